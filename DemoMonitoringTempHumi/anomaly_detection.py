@@ -1,5 +1,15 @@
 """Anomaly detection module.
 
+Descriptions:
+    Parameters are compiled into plain attributes at load time (e.g. the
+    reciprocal variance and the acceptance band of raw values), and are
+    reloaded if the parameter file is updated (HotellingTSquare.reload),
+    so a retrained model is used without restarting the monitoring.
+    Parameter files are written atomically (a temporary file + rename),
+    so readers never see a half-written file.
+    scipy is imported only by fitting (the threshold of a fitted model is
+    saved), so loading and scoring are light.
+
 ---
 
 KazutoMakino
@@ -7,20 +17,107 @@ KazutoMakino
 """
 
 import json
+import os
+import stat
+import tempfile
+import typing
 from datetime import datetime
 from pathlib import Path
 
 import numpy as np
-from scipy import stats
 
 ######################################################################
 # class
 ######################################################################
 
 
+class SufficientStats:
+    """Mergeable statistics class of samples (count, mean and scatter).
+
+    Descriptions:
+        Statistics of parts of a dataset (e.g. log files computed by
+        worker processes) are merged exactly by the parallel formula of
+        Chan et al. in any order, so the mean and the (co)variance of the
+        whole dataset are obtained without gathering samples.
+        m2 is the sum of squared deviations from the mean (univariate),
+        or the scatter matrix (multivariate).
+    """
+
+    def __init__(
+        self,
+        count: int = 0,
+        mean: typing.Union[float, np.ndarray, None] = None,
+        m2: typing.Union[float, np.ndarray, None] = None,
+    ) -> None:
+        """Set statistics (empty by default).
+
+        Args:
+            count (int, optional): The number of samples. Defaults to 0.
+            mean (Union[float, np.ndarray], optional): The mean (vector).
+                Defaults to None.
+            m2 (Union[float, np.ndarray], optional): The sum of squared
+                deviations (matrix). Defaults to None.
+        """
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    @classmethod
+    def from_data(cls, data: list) -> "SufficientStats":
+        """Compute statistics of samples.
+
+        Args:
+            data (list): 1d-array data (univariate),
+                or 2d-array data: (samples, channels) (multivariate).
+
+        Returns:
+            SufficientStats: Statistics (empty if no samples).
+        """
+        data = np.asarray(data, dtype=np.float64)
+        if data.ndim not in [1, 2]:
+            raise ValueError(f"data must be 1d or 2d array: {data.shape}")
+        if len(data) == 0:
+            return cls()
+        mean = np.mean(data, axis=0)
+        dev = data - mean
+        m2 = dev.T @ dev if data.ndim == 2 else float(dev @ dev)
+        return cls(count=len(data), mean=mean, m2=m2)
+
+    def merge(self, other: "SufficientStats") -> "SufficientStats":
+        """Merge statistics of another part.
+
+        Args:
+            other (SufficientStats): Statistics of other samples.
+
+        Returns:
+            SufficientStats: Statistics of both (a new instance).
+        """
+        if other.count == 0:
+            return SufficientStats(count=self.count, mean=self.mean, m2=self.m2)
+        if self.count == 0:
+            return SufficientStats(count=other.count, mean=other.mean, m2=other.m2)
+        n = self.count + other.count
+        delta = other.mean - self.mean
+        return SufficientStats(
+            count=n,
+            mean=self.mean + delta * (other.count / n),
+            m2=self.m2
+            + other.m2
+            + np.multiply.outer(delta, delta) * (self.count * other.count / n),
+        )
+
+    @property
+    def covariance(self) -> typing.Union[float, np.ndarray]:
+        """The variance (covariance matrix) with ddof=0."""
+        return self.m2 / self.count
+
+
 class HotellingTSquare:
     """Hotelling T-squared distribution class."""
 
+    # the number of past samples if not saved in parameters (by partial_fit)
+    PRIOR_COUNT = 10000.0
+
     def __init__(
         self, param_path: Path = Path(__file__).parent / "./param_HotellingTSquare.json"
     ) -> None:
@@ -33,62 +130,435 @@ class HotellingTSquare:
         # cast
         self.param_path = Path(param_path)
 
-        # load parameters
-        if self.param_path.exists():
+        # load parameters (and the modified time to detect updates)
+        self._mtime = self._get_mtime()
+        if self._mtime is not None:
             with self.param_path.open(mode="r", encoding="utf-8") as f:
                 self.params = json.load(fp=f)
         else:
             self.params = {"mean": None, "variance": None}
 
+        # init: the number of samples which are not saved by partial_fit
+        self._n_unsaved = 0
+
+        # precompute values used by scoring
+        self._prepare()
+
+    def _get_mtime(self) -> typing.Optional[int]:
+        """Get the modified time [ns] of the parameter file (None if not exists)."""
+        try:
+            return os.stat(self.param_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def reload(self) -> bool:
+        """Reload parameters if the parameter file is updated.
+
+        Descriptions:
+            Only the modified time is checked (a stat call) if not updated,
+            so this can be called every frame. The new parameters are loaded
+            and compiled first, and then all attributes used by scoring are
+            swapped, so scores between calls use the same model (an instance
+            is not shared by threads: one instance per monitoring session).
+            If the file is invalid, the current model is kept.
+
+        Returns:
+            bool: Reloaded or not.
+        """
+        mtime = self._get_mtime()
+        if (mtime is None) or (mtime == self._mtime):
+            return False
+
+        # load and compile (the current model is kept if failed)
+        try:
+            with self.param_path.open(mode="r", encoding="utf-8") as f:
+                params = json.load(fp=f)
+            compiled = self._compile(params=params)
+        except (OSError, ValueError, KeyError, TypeError) as err:
+            print(f"parameters are not reloaded: {err}")
+            self._mtime = mtime
+            return False
+
+        # swap
+        self.params = params
+        self._set_compiled(compiled=compiled)
+        self._mtime = mtime
+        self._n_unsaved = 0
+        return True
+
     def fit(
-        self, dataset: list, alpha: float = 0.99, df: float = 1.0, memo_dict: dict = {}
+        self,
+        dataset: list,
+        alpha: float = 0.99,
+        df: float = None,
+        memo_dict: dict = {},
+        columns: list = None,
     ) -> None:
         """Parameter fitting.
 
         Args:
-            dataset (list): An input 1d-array data.
+            dataset (list): An input 1d-array data (univariate),
+                or 2d-array data: (samples, channels) (multivariate).
+            alpha (float, optional): A degree of reliability.
+                Defaults to 0.99.
+            df (float, optional): A degree of freedom.
+                Defaults to None (1.0 or the number of channels).
+            memo_dict (dict, optional): A memo dictionary.
+                Defaults to {}.
+            columns (list, optional): Channel names of the dataset.
+                Defaults to None.
+        """
+        self.fit_stats(
+            sufficient_stats=SufficientStats.from_data(data=dataset),
+            alpha=alpha,
+            df=df,
+            memo_dict=memo_dict,
+            columns=columns,
+        )
+
+    def fit_stats(
+        self,
+        sufficient_stats: SufficientStats,
+        alpha: float = 0.99,
+        df: float = None,
+        memo_dict: dict = {},
+        columns: list = None,
+    ) -> None:
+        """Parameter fitting by statistics of the dataset.
+
+        Args:
+            sufficient_stats (SufficientStats): Statistics of the dataset
+                (e.g. merged statistics of log files).
             alpha (float, optional): A degree of reliability.
                 Defaults to 0.99.
             df (float, optional): A degree of freedom.
-                Defaults to 1.0.
+                Defaults to None (1.0 or the number of channels).
             memo_dict (dict, optional): A memo dictionary.
                 Defaults to {}.
+            columns (list, optional): Channel names of the dataset.
+                Defaults to None.
         """
-        # calc sample mean
-        s_mean = np.mean(dataset)
+        if sufficient_stats.count == 0:
+            raise ValueError("no samples to fit")
 
-        # calc sample variance
-        s_var = np.var(dataset, ddof=0)
+        if np.ndim(sufficient_stats.mean) == 0:
+            # # univariate
+            # sample mean and sample variance
+            params = {
+                "mean": float(sufficient_stats.mean),
+                "variance": float(sufficient_stats.covariance),
+            }
+            if df is None:
+                df = 1.0
+
+        else:
+            # # multivariate
+            # sample mean vector and sample covariance matrix
+            params = self._get_multivariate_params(
+                s_mean=sufficient_stats.mean,
+                s_cov=np.atleast_2d(sufficient_stats.covariance),
+            )
+            if df is None:
+                df = float(len(sufficient_stats.mean))
 
         # calc threshold
-        threshold = stats.chi2.interval(alpha=alpha, df=df, loc=0, scale=1)[1]
+        threshold = self._get_threshold(alpha=alpha, df=df)
 
         # set self.params and update
         self.params = {
-            "mean": s_mean,
-            "variance": s_var,
+            **params,
+            "count": sufficient_stats.count,
             "alpha": alpha,
             "df": df,
             "threshold": threshold,
             "memo": "Hotelling T-squared distribution",
             "timestamp": datetime.now().strftime("%Y/%m/%d-%H:%M:%S.%f"),
         }
+        if columns is not None:
+            self.params["columns"] = list(columns)
         self.params.update(memo_dict)
 
         # save to json
-        with self.param_path.open(mode="w", encoding="utf-8") as f:
-            json.dump(obj=self.params, fp=f, indent=4, sort_keys=False)
+        self.save()
+
+        # precompute values used by scoring
+        self._prepare()
+
+    def partial_fit(
+        self,
+        samples: list,
+        forgetting_factor: float = 1.0,
+        checkpoint_interval: int = 0,
+    ) -> None:
+        """Incremental parameter fitting.
+
+        Descriptions:
+            The mean and the (co)variance are updated by merging the
+            statistics of samples into the current ones (Welford / Chan),
+            so the cost does not depend on the number of past samples.
+            The weight of past samples is multiplied by forgetting_factor
+            per sample, so the baseline follows slow drifts if < 1.0
+            (the effective number of samples is 1 / (1 - forgetting_factor)).
+            If not fitted yet, alpha=0.99 and df=1.0 or the number of
+            channels are used, and a 2d-array is needed for multivariate.
+
+        Args:
+            samples (list): A value or 1d-array data (univariate),
+                or 1d-array of channel values or 2d-array data:
+                (samples, channels) (multivariate).
+            forgetting_factor (float, optional): A forgetting factor in (0, 1].
+                Defaults to 1.0 (no forgetting).
+            checkpoint_interval (int, optional): Parameters are saved to
+                self.param_path every this number of samples.
+                Defaults to 0 (not saved).
+        """
+        # cast
+        samples = np.asarray(samples, dtype=np.float64)
+        fitted = self.params.get("mean") is not None
+        if (fitted and self.is_multivariate) or (not fitted and samples.ndim == 2):
+            samples = np.atleast_2d(samples)
+        else:
+            samples = np.atleast_1d(samples)
+        n_b = len(samples)
+        if n_b == 0:
+            return
+
+        # statistics of samples
+        mean_b = np.mean(samples, axis=0)
+        dev_b = samples - mean_b
+        m2_b = dev_b.T @ dev_b if samples.ndim == 2 else dev_b @ dev_b
+
+        if fitted:
+            # decayed statistics of past samples
+            # (if unknown (e.g. fitted by older versions), the count is
+            # regarded as the effective number, up to PRIOR_COUNT)
+            if "count" in self.params:
+                n_a = self.params["count"]
+            elif forgetting_factor < 1.0:
+                n_a = min(1.0 / (1.0 - forgetting_factor), self.PRIOR_COUNT)
+            else:
+                n_a = self.PRIOR_COUNT
+            n_a *= forgetting_factor**n_b
+            if self.is_multivariate:
+                mean_a = self._mean
+                m2_a = np.asarray(self.params["covariance"]) * n_a
+            else:
+                mean_a = self.params["mean"]
+                m2_a = self.params["variance"] * n_a
+
+            # merge
+            n = n_a + n_b
+            delta = mean_b - mean_a
+            mean = mean_a + delta * (n_b / n)
+            m2 = m2_a + m2_b + np.multiply.outer(delta, delta) * (n_a * n_b / n)
+
+        else:
+            n, mean, m2 = n_b, mean_b, m2_b
+
+        # set parameters
+        if samples.ndim == 2:
+            try:
+                params = self._get_multivariate_params(s_mean=mean, s_cov=m2 / n)
+            except np.linalg.LinAlgError:
+                # not positive definite yet (e.g. too few samples)
+                params = {
+                    "mean": mean.tolist(),
+                    "covariance": (m2 / n).tolist(),
+                    "cholesky": None,
+                    "inv_covariance": np.linalg.pinv(m2 / n).tolist(),
+                    "n_channels": len(mean),
+                }
+            df = float(len(mean))
+        else:
+            params = {"mean": float(mean), "variance": float(m2 / n)}
+            df = 1.0
+        self.params.update(params)
+        self.params["count"] = float(n)
+        self.params["forgetting_factor"] = forgetting_factor
+
+        # calc threshold only if not calculated
+        if "threshold" not in self.params:
+            self.params.setdefault("alpha", 0.99)
+            self.params["df"] = df
+            self.params["threshold"] = self._get_threshold(
+                alpha=self.params["alpha"], df=df
+            )
+            self.params["memo"] = "Hotelling T-squared distribution"
+
+        # precompute values used by scoring
+        self._prepare()
+
+        # checkpoint
+        self._n_unsaved += n_b
+        if checkpoint_interval and (self._n_unsaved >= checkpoint_interval):
+            self.params["timestamp"] = datetime.now().strftime("%Y/%m/%d-%H:%M:%S.%f")
+            self.save()
+
+    def save(self) -> None:
+        """Save parameters to self.param_path atomically.
+
+        Descriptions:
+            Parameters are written to a temporary file in the same directory
+            and it is renamed to self.param_path (os.replace), so readers
+            (e.g. reload of the monitoring) get the old or the new file.
+            The mode of the file is kept (0o666 masked by the umask if new).
+        """
+        fd, tmp = tempfile.mkstemp(
+            suffix=".tmp", prefix=self.param_path.name, dir=self.param_path.parent
+        )
+        try:
+            with os.fdopen(fd, mode="w", encoding="utf-8") as f:
+                json.dump(obj=self.params, fp=f, indent=4, sort_keys=False)
+                f.flush()
+                os.fsync(f.fileno())
+
+            # mkstemp makes the file readable only by the owner
+            try:
+                mode = stat.S_IMODE(os.stat(self.param_path).st_mode)
+            except FileNotFoundError:
+                umask = os.umask(0)
+                os.umask(umask)
+                mode = 0o666 & ~umask
+            os.chmod(tmp, mode)
+
+            os.replace(tmp, self.param_path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        self._n_unsaved = 0
+
+        # own updates are not reloaded
+        self._mtime = self._get_mtime()
+
+    @staticmethod
+    def _get_threshold(alpha: float, df: float) -> float:
+        """Get the upper limit of the chi-squared distribution.
+
+        Descriptions:
+            scipy is imported here (only by fitting), so loading and scoring
+            by a fitted model do not need it.
+
+        Args:
+            alpha (float): A degree of reliability.
+            df (float): A degree of freedom.
+
+        Returns:
+            float: The threshold of anomaly scores.
+        """
+        from scipy import stats
+
+        return stats.chi2.interval(alpha, df, loc=0, scale=1)[1]
+
+    @staticmethod
+    def _get_multivariate_params(s_mean: np.ndarray, s_cov: np.ndarray) -> dict:
+        """Get multivariate parameters.
+
+        Args:
+            s_mean (np.ndarray): A sample mean vector.
+            s_cov (np.ndarray): A sample covariance matrix.
+
+        Returns:
+            dict: Parameters including the cholesky factor (s_cov = L @ L.T)
+                and the inverse covariance matrix.
+        """
+        # get cholesky factor and its inverse matrix
+        chol = np.linalg.cholesky(s_cov)
+        inv_chol = np.linalg.solve(chol, np.eye(len(s_mean)))
+
+        return {
+            "mean": np.asarray(s_mean).tolist(),
+            "covariance": np.asarray(s_cov).tolist(),
+            "cholesky": chol.tolist(),
+            "inv_covariance": (inv_chol.T @ inv_chol).tolist(),
+            "n_channels": len(s_mean),
+        }
+
+    def _prepare(self) -> None:
+        """Precompute values used by scoring (compile self.params)."""
+        self._set_compiled(compiled=self._compile(params=self.params))
+
+    def _set_compiled(self, compiled: dict) -> None:
+        """Set compiled attributes (not via __dict__, to keep fast lookups)."""
+        for k, v in compiled.items():
+            setattr(self, k, v)
+
+    @staticmethod
+    def _compile(params: dict) -> dict:
+        """Compile parameters into attributes used by scoring.
+
+        Descriptions:
+            - univariate: the mean, the reciprocal variance and
+                the acceptance interval of raw values.
+                (x - mean)^2 / variance <= threshold
+                <=> mean - sqrt(threshold * variance) <= x
+                    <= mean + sqrt(threshold * variance)
+                If parameters are not fitted, they are nan
+                and then every value is regarded as an anomaly.
+            - multivariate: the mean vector and the inverse covariance
+                matrix as np.ndarray, so as not to invert per sample.
+
+        Args:
+            params (dict): Parameters.
+
+        Returns:
+            dict: {attribute name: value}.
+        """
+        nan = float("nan")
+        threshold = params.get("threshold")
+        compiled = {
+            "is_multivariate": isinstance(params.get("mean"), list),
+            "threshold": nan if threshold is None else float(threshold),
+        }
+
+        if compiled["is_multivariate"]:
+            if "inv_covariance" in params:
+                inv_cov = np.asarray(params["inv_covariance"], dtype=np.float64)
+            else:
+                inv_chol = np.linalg.inv(np.asarray(params["cholesky"]))
+                inv_cov = inv_chol.T @ inv_chol
+            compiled.update(
+                {
+                    "_mean": np.asarray(params["mean"], dtype=np.float64),
+                    "_inv_cov": inv_cov,
+                    "_inv_var": nan,
+                    "lower": nan,
+                    "upper": nan,
+                }
+            )
+            return compiled
+
+        if (params.get("mean") is None) or (params.get("variance") is None):
+            mean, variance = nan, nan
+        else:
+            mean, variance = float(params["mean"]), float(params["variance"])
+        half_width = np.sqrt(compiled["threshold"] * variance)
+        compiled.update(
+            {
+                "_mean": mean,
+                "_inv_cov": None,
+                "_inv_var": 1.0 / variance if variance else nan,
+                "lower": float(mean - half_width),
+                "upper": float(mean + half_width),
+            }
+        )
+        return compiled
 
     def get_anomaly_score(self, data: float) -> float:
         """Calculating anomaly score.
 
         Args:
-            data (float): An input 1d-array data.
+            data (float): An input value (univariate),
+                or 1d-array of channel values (multivariate).
 
         Returns:
             float: An anomaly score.
         """
-        return data - self.params["mean"] ** 2 / self.params["variance"]
+        if self.is_multivariate:
+            # mahalanobis distance^2
+            dev = np.asarray(data, dtype=np.float64) - self._mean
+            return float(dev @ self._inv_cov @ dev)
+        dev = data - self._mean
+        return dev * dev * self._inv_var
 
     def is_normal(self, anomaly_score: float) -> bool:
         """Return True (normal) or False (anomaly) using the threshold.
@@ -100,7 +570,54 @@ class HotellingTSquare:
             bool: True (normal) or False (anomaly).
         """
         # return normal (True) or anomaly (False)
-        if anomaly_score <= self.params["threshold"]:
+        if anomaly_score <= self.threshold:
             return True
         else:
             return False
+
+    def is_normal_data(self, data: float) -> bool:
+        """Return True (normal) or False (anomaly) of the raw value.
+
+        Descriptions:
+            This is equivalent to is_normal(get_anomaly_score(data)),
+            but uses only 2 comparisons with the acceptance interval.
+            (univariate only)
+
+        Args:
+            data (float): An input value.
+
+        Returns:
+            bool: True (normal) or False (anomaly).
+        """
+        return self.lower <= data <= self.upper
+
+    def score_batch(self, data: np.ndarray) -> np.ndarray:
+        """Calculating anomaly scores of many values at once.
+
+        Args:
+            data (np.ndarray): An input nd-array data
+                (e.g. 1d: time, 2d: device x time).
+                If multivariate, the last axis is channels
+                (e.g. 2d: time x channel, 3d: device x time x channel).
+
+        Returns:
+            np.ndarray: Anomaly scores with the same shape as data
+                (if multivariate, except the last axis).
+        """
+        if self.is_multivariate:
+            # mahalanobis distance^2 of all samples with one matrix product
+            dev = np.asarray(data, dtype=np.float64) - self._mean
+            return np.sum((dev @ self._inv_cov) * dev, axis=-1)
+        dev = np.asarray(data, dtype=np.float64) - self._mean
+        return dev * dev * self._inv_var
+
+    def is_normal_batch(self, anomaly_scores: np.ndarray) -> np.ndarray:
+        """Return True (normal) or False (anomaly) of many scores at once.
+
+        Args:
+            anomaly_scores (np.ndarray): Calculated anomaly scores.
+
+        Returns:
+            np.ndarray: A bool array with the same shape as anomaly_scores.
+        """
+        return np.asarray(anomaly_scores) <= self.threshold
@@ -0,0 +1,467 @@
+"""Columnar on-disk archive of sensor logs.
+
+Descriptions:
+    Each log file (session) is converted chunk by chunk into
+    - "npy": one .npy file per column, read as memory-mapped arrays, or
+    - "parquet": one parquet file (a row group per chunk, pyarrow is needed).
+    Reading supports column pruning and time range predicate pushdown
+    ("npy": binary search of sorted time stamps without copying,
+    "parquet": row group statistics).
+    Sessions whose source file is already archived (same sha1) are skipped,
+    so duplicated directories (e.g. data/ and traindata/) are stored once.
+
+Layout:
+    {root}/{session}/meta.json
+    {root}/{session}/{column index}.npy  ("npy")
+    {root}/{session}/data.parquet  ("parquet")
+
+Usage:
+- py archive.py data traindata
+- py archive.py data --format parquet --root archive_parquet
+- from archive import SensorArchive
+    sa = SensorArchive()
+    data = sa.read(session=sa.list_sessions()[0], columns=["Humidity[%]"])
+    HotellingTSquare().fit(dataset=data["Humidity[%]"])
+
+---
+
+KazutoMakino
+
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import shutil
+import sys
+import typing
+from pathlib import Path
+
+import numpy as np
+
+# import my pkgs
+if True:
+    from line_parser import TIME_KEY, LineParser
+
+######################################################################
+# main
+######################################################################
+
+
+def main():
+    # get parser
+    parser = argparse.ArgumentParser(description="Convert logs to the archive.")
+    parser.add_argument(
+        "sources", type=str, nargs="+", help="log files or directories (*.txt, *.log)"
+    )
+    parser.add_argument(
+        "--root",
+        "-r",
+        type=str,
+        default=Path(__file__).parent / "archive",
+        help="archive directory",
+    )
+    parser.add_argument(
+        "--format", "-f", type=str, default="npy", help="npy or parquet"
+    )
+    args = parser.parse_args()
+
+    # convert
+    sa = SensorArchive(root=args.root, fmt=args.format)
+    for src in SensorArchive.glob_logs(sources=args.sources):
+        session = sa.convert(src=src)
+        print(f"{src} -> {session or 'skipped (no samples)'}")
+
+
+######################################################################
+# class
+######################################################################
+
+
+class SensorArchive:
+    """Columnar archive class of sensor logs."""
+
+    def __init__(
+        self,
+        root: typing.Union[Path, str] = Path(__file__).parent / "archive",
+        fmt: str = "npy",
+    ) -> None:
+        """Set the archive directory.
+
+        Args:
+            root (Union[Path, str], optional): An archive directory.
+                Defaults to Path(__file__).parent / "archive".
+            fmt (str, optional): A format of new sessions ("npy" or "parquet").
+                Defaults to "npy".
+        """
+        if fmt not in ["npy", "parquet"]:
+            raise ValueError(f"format must be npy or parquet: {fmt}")
+        self.root = Path(root)
+        self.fmt = fmt
+
+    @staticmethod
+    def glob_logs(sources: typing.List[typing.Union[Path, str]]) -> typing.List[Path]:
+        """Get log file paths.
+
+        Args:
+            sources (List[Union[Path, str]]): Log files or directories.
+
+        Returns:
+            List[Path]: Log file paths (*.txt, *.log in directories).
+        """
+        paths = []
+        for src in map(Path, sources):
+            if src.is_dir():
+                paths.extend(sorted(src.glob("*.txt")) + sorted(src.glob("*.log")))
+            else:
+                paths.append(src)
+        return paths
+
+    def convert(
+        self, src: typing.Union[Path, str], chunk_size: int = 1 << 22
+    ) -> typing.Optional[str]:
+        """Convert a log file to a session of the archive.
+
+        Args:
+            src (Union[Path, str]): A log file path.
+            chunk_size (int, optional): A byte size to parse at once.
+                Defaults to 1 << 22 (4 [MiB]).
+
+        Returns:
+            Optional[str]: The session name
+                (None if the log has no samples, which is not archived).
+        """
+        # get source hash
+        src = Path(src)
+        sha1 = self._get_sha1(path=src)
+
+        # skip if archived
+        for session in self.list_sessions():
+            if self.get_meta(session=session).get("sha1") == sha1:
+                return session
+
+        # make session directory (the stem of src, or with a suffix)
+        session = src.stem
+        n = 1
+        while (self.root / session).exists():
+            session = f"{src.stem}_{n}"
+            n += 1
+        sdir = self.root / session
+        sdir.mkdir(parents=True)
+
+        # write columns
+        lp = LineParser()
+        stats = {"n_rows": 0, "sorted": True, "tstart": None, "tend": None}
+        chunks = self._track(
+            chunks=lp.iter_chunks(source=src, chunk_size=chunk_size), stats=stats
+        )
+        if self.fmt == "npy":
+            self._write_npy(sdir=sdir, chunks=chunks, stats=stats)
+        else:
+            self._write_parquet(sdir=sdir, chunks=chunks)
+
+        # no samples (e.g. only boot messages): no session
+        if stats["n_rows"] == 0:
+            shutil.rmtree(sdir)
+            return None
+
+        # write meta data
+        meta = {
+            "format": self.fmt,
+            "columns": lp.columns,
+            **stats,
+            "source": str(src),
+            "sha1": sha1,
+            "skipped_lines": lp.n_skipped,
+        }
+        with (sdir / "meta.json").open(mode="w", encoding="utf-8") as f:
+            json.dump(obj=meta, fp=f, indent=4, sort_keys=False)
+
+        return session
+
+    @staticmethod
+    def _track(
+        chunks: typing.Iterable[dict], stats: dict
+    ) -> typing.Generator[dict, None, None]:
+        """Pass chunks through with updating the number of rows,
+        the order and the range of time stamps in stats."""
+        for chunk in chunks:
+            ts = chunk[TIME_KEY]
+            stats["sorted"] &= bool(np.all(ts[1:] >= ts[:-1]))
+            if stats["n_rows"]:
+                stats["sorted"] &= bool(ts[0] >= stats["last"])
+                stats["tstart"] = min(stats["tstart"], int(ts.min()))
+                stats["tend"] = max(stats["tend"], int(ts.max()))
+            else:
+                stats["tstart"], stats["tend"] = int(ts.min()), int(ts.max())
+            stats["last"] = int(ts[-1])
+            stats["n_rows"] += len(ts)
+            yield chunk
+        stats.pop("last", None)
+
+    def _write_npy(
+        self, sdir: Path, chunks: typing.Iterable[dict], stats: dict
+    ) -> None:
+        """Write chunks to .npy columns via raw temporary files."""
+        # init
+        files = {}
+
+        try:
+            # append chunks to raw files
+            for chunk in chunks:
+                if not files:
+                    files = {
+                        k: (sdir / f"{i}.tmp").open(mode="wb")
+                        for i, k in enumerate(chunk)
+                    }
+                for k, v in chunk.items():
+                    files[k].write(v.tobytes())
+        finally:
+            for f in files.values():
+                f.close()
+
+        # raw files -> .npy files (copied by blocks)
+        n_rows = stats["n_rows"]
+        for i, k in enumerate(files):
+            dtype = np.int64 if k == TIME_KEY else np.float64
+            tmp = sdir / f"{i}.tmp"
+            dst = np.lib.format.open_memmap(
+                sdir / f"{i}.npy", mode="w+", dtype=dtype, shape=(n_rows,)
+            )
+            if n_rows:
+                raw = np.memmap(tmp, dtype=dtype, mode="r", shape=(n_rows,))
+                for j in range(0, n_rows, 1 << 20):
+                    dst[j : j + (1 << 20)] = raw[j : j + (1 << 20)]
+                del raw
+            dst.flush()
+            del dst
+            tmp.unlink()
+
+    def _write_parquet(self, sdir: Path, chunks: typing.Iterable[dict]) -> None:
+        """Write chunks to a parquet file (a row group per chunk)."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        # init
+        writer = None
+
+        try:
+            for chunk in chunks:
+                # time stamp -> timestamp[ns]
+                table = pa.table(
+                    {
+                        k: (
+                            pa.array(v.view("datetime64[ns]"))
+                            if k == TIME_KEY
+                            else pa.array(v)
+                        )
+                        for k, v in chunk.items()
+                    }
+                )
+                if writer is None:
+                    writer = pq.ParquetWriter(sdir / "data.parquet", table.schema)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+
+    def list_sessions(self) -> typing.List[str]:
+        """Get session names.
+
+        Returns:
+            List[str]: Session names.
+        """
+        if not self.root.exists():
+            return []
+        return sorted(v.parent.name for v in self.root.glob("*/meta.json"))
+
+    def get_meta(self, session: str) -> dict:
+        """Get meta data of the session.
+
+        Args:
+            session (str): A session name.
+
+        Returns:
+            dict: Meta data.
+        """
+        with (self.root / session / "meta.json").open(mode="r", encoding="utf-8") as f:
+            return json.load(fp=f)
+
+    def read(
+        self,
+        session: str,
+        columns: typing.Optional[typing.List[str]] = None,
+        tstart: typing.Optional[int] = None,
+        tend: typing.Optional[int] = None,
+    ) -> dict:
+        """Read columns of the session.
+
+        Args:
+            session (str): A session name.
+            columns (List[str], optional): Column names to read.
+                Defaults to None (all columns).
+            tstart (int, optional): The start time (epoch [ns], inclusive).
+                Defaults to None.
+            tend (int, optional): The end time (epoch [ns], exclusive).
+                Defaults to None.
+
+        Returns:
+            dict: {column: array} ("npy": read-only memory-mapped arrays,
+                which are not copied if time stamps are sorted).
+        """
+        # get meta data
+        meta = self.get_meta(session=session)
+
+        # empty sessions (written by older versions): empty arrays
+        if not meta["n_rows"]:
+            return {
+                k: np.empty(0, dtype=np.int64 if k == TIME_KEY else np.float64)
+                for k in (meta["columns"] or [] if columns is None else columns)
+            }
+
+        if columns is None:
+            columns = meta["columns"]
+        unknown = set(columns) - set(meta["columns"])
+        if unknown:
+            raise KeyError(f"unknown columns: {unknown}")
+        sdir = self.root / session
+
+        if meta["format"] == "parquet":
+            import pyarrow.parquet as pq
+
+            # set filters (pushed down to row groups)
+            filters = []
+            if tstart is not None:
+                filters.append((TIME_KEY, ">=", np.datetime64(int(tstart), "ns")))
+            if tend is not None:
+                filters.append((TIME_KEY, "<", np.datetime64(int(tend), "ns")))
+            table = pq.read_table(
+                sdir / "data.parquet", columns=columns, filters=filters or None
+            )
+            ret = {}
+            for k in columns:
+                v = table.column(k).to_numpy()
+                ret[k] = v.view(np.int64) if k == TIME_KEY else v
+            return ret
+
+        # # npy
+        # get row range
+        idx = slice(None)
+        if (tstart is not None) or (tend is not None):
+            ts = np.load(sdir / f"{meta['columns'].index(TIME_KEY)}.npy", mmap_mode="r")
+            if meta["sorted"]:
+                i0 = 0 if tstart is None else np.searchsorted(ts, tstart, side="left")
+                i1 = len(ts) if tend is None else np.searchsorted(ts, tend, side="left")
+                idx = slice(int(i0), int(i1))
+            else:
+                mask = np.ones(len(ts), dtype=bool)
+                if tstart is not None:
+                    mask &= ts >= tstart
+                if tend is not None:
+                    mask &= ts < tend
+                idx = np.flatnonzero(mask)
+
+        # memory-mapped columns
+        return {
+            k: np.load(sdir / f"{meta['columns'].index(k)}.npy", mmap_mode="r")[idx]
+            for k in columns
+        }
+
+    def iter_blocks(
+        self,
+        session: str,
+        columns: typing.Optional[typing.List[str]] = None,
+        block_rows: int = 1 << 16,
+    ) -> typing.Generator[dict, None, None]:
+        """Read columns of the session block by block (in bounded memory).
+
+        Args:
+            session (str): A session name.
+            columns (List[str], optional): Column names to read.
+                Defaults to None (all columns).
+            block_rows (int, optional): The maximum number of rows per block
+                ("parquet": batches in row groups). Defaults to 1 << 16.
+
+        Yields:
+            dict: {column: array} of a block.
+        """
+        meta = self.get_meta(session=session)
+        if not meta["n_rows"]:
+            return
+        if columns is None:
+            columns = meta["columns"]
+
+        if meta["format"] == "parquet":
+            import pyarrow.parquet as pq
+
+            pf = pq.ParquetFile(self.root / session / "data.parquet")
+            for batch in pf.iter_batches(batch_size=block_rows, columns=columns):
+                yield {
+                    k: (
+                        batch.column(k).to_numpy().view(np.int64)
+                        if k == TIME_KEY
+                        else batch.column(k).to_numpy()
+                    )
+                    for k in columns
+                }
+            return
+
+        # slices of memory-mapped columns
+        data = self.read(session=session, columns=columns)
+        for i in range(0, meta["n_rows"], block_rows):
+            yield {k: v[i : i + block_rows] for k, v in data.items()}
+
+    def iter_sessions(
+        self,
+        sessions: typing.Optional[typing.List[str]] = None,
+        columns: typing.Optional[typing.List[str]] = None,
+        tstart: typing.Optional[int] = None,
+        tend: typing.Optional[int] = None,
+    ) -> typing.Generator[typing.Tuple[str, dict], None, None]:
+        """Read columns session by session.
+
+        Args:
+            sessions (List[str], optional): Session names.
+                Defaults to None (all sessions).
+            columns (List[str], optional): Column names to read.
+                Defaults to None (all columns).
+            tstart (int, optional): The start time (epoch [ns], inclusive).
+                Defaults to None.
+            tend (int, optional): The end time (epoch [ns], exclusive).
+                Defaults to None.
+
+        Yields:
+            Tuple[str, dict]: (session name, {column: array}).
+        """
+        for session in self.list_sessions() if sessions is None else sessions:
+            # skip sessions out of the time range
+            meta = self.get_meta(session=session)
+            if meta["n_rows"] == 0:
+                continue
+            if (tstart is not None) and (meta["tend"] < tstart):
+                continue
+            if (tend is not None) and (meta["tstart"] >= tend):
+                continue
+            yield session, self.read(
+                session=session, columns=columns, tstart=tstart, tend=tend
+            )
+
+    @staticmethod
+    def _get_sha1(path: Path) -> str:
+        """Get sha1 of the file."""
+        h = hashlib.sha1()
+        with path.open(mode="rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        return h.hexdigest()
+
+
+######################################################################
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as err:
+        logging.error(msg=err, exc_info=True)
+    sys.exit()
@@ -0,0 +1,560 @@
+"""Benchmark of the monitoring pipeline.
+
+Descriptions:
+    Each stage of the pipeline is timed on the bundled logs (data/*.txt)
+    repeated "scale" times:
+    - parse: LineParser.parse_line / LineParser.feed (DataStream.run)
+    - window: RingBuffer.append / RingBuffer.extend,
+        MonitoringApp.to_dataframe (MonitoringApp.run)
+    - score: HotellingTSquare.get_anomaly_score + is_normal / score_batch / fit
+    - render: the "matplotlib" and "streamlit" PlotType paths
+        (streamlit runs in the bare mode, so elements are built but not sent)
+        and the previous matplotlib path rebuilding all artists per frame
+        (render_matplotlib_full), with a new sample per frame
+        (streamlit: the whole window per frame, or only new rows by add_rows)
+    - render_matplotlib_long: a window of all samples downsampled to 1000 points
+    - downsample: downsample.py (lttb / minmax) of all samples to 1000 points
+    - metrics: a stage timer of metrics.py (the overhead per observation)
+    Results are saved as a json baseline, and compared with a baseline
+    to flag regressions (slower than the tolerance) by the exit code 1.
+
+Usage:
+- py benchmark.py --save benchmark.json
+- py benchmark.py --scale 10 --compare benchmark.json --tolerance 0.2
+- py benchmark.py --cases parse_line parse_feed
+
+---
+
+KazutoMakino
+
+"""
+
+import argparse
+import io
+import json
+import logging
+import platform
+import sys
+import tempfile
+import time
+import typing
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+# import my pkgs
+if True:
+    from anomaly_detection import HotellingTSquare
+    from line_parser import TIME_KEY, LineParser
+    from ring_buffer import RingBuffer
+
+######################################################################
+# main
+######################################################################
+
+
+def main():
+    # get parser
+    parser = argparse.ArgumentParser(description="Benchmark of the pipeline.")
+    parser.add_argument(
+        "--data",
+        type=str,
+        default=Path(__file__).parent / "data",
+        help="log files or a directory",
+    )
+    parser.add_argument(
+        "--scale", type=int, default=1, help="repeat the logs this number of times"
+    )
+    parser.add_argument(
+        "--repeat", "-r", type=int, default=5, help="the number of measurements"
+    )
+    parser.add_argument(
+        "--cases", "-c", type=str, nargs="*", default=None, help="cases to run"
+    )
+    parser.add_argument("--save", "-s", type=str, default=None, help="save results")
+    parser.add_argument(
+        "--compare", type=str, default=None, help="compare with a baseline"
+    )
+    parser.add_argument(
+        "--tolerance",
+        "-t",
+        type=float,
+        default=0.2,
+        help="allowed slowdown ratio against the baseline",
+    )
+    args = parser.parse_args()
+
+    # run
+    results = run_benchmarks(
+        sources=[args.data], scale=args.scale, repeat=args.repeat, cases=args.cases
+    )
+    for name, v in results["cases"].items():
+        print(
+            f"{name:>20}: {v['per_item_us']:12.3f} [us/item] "
+            + f"{v['items_per_s']:14.1f} [items/s] (n={v['n']})"
+        )
+
+    # save
+    if args.save is not None:
+        with Path(args.save).open(mode="w", encoding="utf-8") as f:
+            json.dump(obj=results, fp=f, indent=4, sort_keys=False)
+        print(f"saved: {args.save}")
+
+    # compare
+    if args.compare is not None:
+        with Path(args.compare).open(mode="r", encoding="utf-8") as f:
+            baseline = json.load(fp=f)
+        report = compare(results=results, baseline=baseline, tolerance=args.tolerance)
+        for name, v in report.items():
+            flag = "REGRESSION" if v["regression"] else "ok"
+            print(f"{name:>20}: x{v['ratio']:.3f} {flag}")
+        if any(v["regression"] for v in report.values()):
+            sys.exit(1)
+
+
+def run_benchmarks(
+    sources: typing.List[typing.Union[Path, str]],
+    scale: int = 1,
+    repeat: int = 5,
+    cases: typing.Optional[typing.List[str]] = None,
+) -> dict:
+    """Run benchmark cases.
+
+    Args:
+        sources (List[Union[Path, str]]): Log files or directories.
+        scale (int, optional): Repeat the logs this number of times.
+            Defaults to 1.
+        repeat (int, optional): The number of measurements (the median is used).
+            Defaults to 5.
+        cases (List[str], optional): Names of cases. Defaults to None (all).
+
+    Returns:
+        dict: {"meta": {...}, "cases": {name: {n, median_s, best_s,
+            per_item_us, items_per_s}}}
+    """
+    from archive import SensorArchive
+
+    # load logs
+    raw = b"".join(
+        v.read_bytes() for v in SensorArchive.glob_logs(sources=sources)
+    ) * int(scale)
+    bench = Benchmark(raw=raw)
+
+    # run
+    names = list(bench.CASES) if cases is None else cases
+    unknown = set(names) - set(bench.CASES)
+    if unknown:
+        raise KeyError(f"unknown cases: {unknown} (cases: {list(bench.CASES)})")
+    results = {}
+    for name in names:
+        func, n = getattr(bench, bench.CASES[name])()
+        times = []
+        for _ in range(repeat):
+            tstart = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - tstart)
+        median = float(np.median(times))
+        results[name] = {
+            "n": n,
+            "median_s": median,
+            "best_s": float(np.min(times)),
+            "per_item_us": median / n * 1e6,
+            "items_per_s": n / median,
+        }
+
+    return {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "bytes": len(raw),
+            "scale": scale,
+            "repeat": repeat,
+        },
+        "cases": results,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.2) -> dict:
+    """Compare results with a baseline.
+
+    Args:
+        results (dict): Results of run_benchmarks.
+        baseline (dict): A baseline (results of run_benchmarks).
+        tolerance (float, optional): Allowed slowdown ratio, e.g. 0.2: +20 [%].
+            Defaults to 0.2.
+
+    Returns:
+        dict: {name: {"ratio": per item time / baseline's, "regression": bool}}
+            (cases in both).
+    """
+    report = {}
+    for name, v in results["cases"].items():
+        if name not in baseline["cases"]:
+            continue
+        ratio = v["per_item_us"] / baseline["cases"][name]["per_item_us"]
+        report[name] = {"ratio": ratio, "regression": ratio > 1 + tolerance}
+    return report
+
+
+######################################################################
+# class
+######################################################################
+
+
+class Benchmark:
+    """Benchmark cases class.
+
+    Descriptions:
+        Each case method prepares inputs and returns
+        (a function to be timed, the number of items).
+    """
+
+    CASES = {
+        "parse_line": "case_parse_line",
+        "parse_feed": "case_parse_feed",
+        "window_append": "case_window_append",
+        "window_extend": "case_window_extend",
+        "to_dataframe": "case_to_dataframe",
+        "score_sample": "case_score_sample",
+        "score_batch": "case_score_batch",
+        "score_stream": "case_score_stream",
+        "fit": "case_fit",
+        "render_matplotlib": "case_render_matplotlib",
+        "render_matplotlib_full": "case_render_matplotlib_full",
+        "render_streamlit": "case_render_streamlit",
+        "render_streamlit_append": "case_render_streamlit_append",
+        "render_matplotlib_long": "case_render_matplotlib_long",
+        "downsample_lttb": "case_downsample_lttb",
+        "downsample_minmax": "case_downsample_minmax",
+        "metrics_observe": "case_metrics_observe",
+        "rollup_update": "case_rollup_update",
+    }
+
+    def __init__(self, raw: bytes, data_length: int = 30) -> None:
+        """Parse logs for inputs of cases.
+
+        Args:
+            raw (bytes): Logs.
+            data_length (int, optional): The window length. Defaults to 30.
+        """
+        self.raw = raw
+        self.lines = raw.splitlines()
+        self.data = LineParser().parse_chunk(data=raw)
+        self.columns = [k for k in self.data if k != TIME_KEY]
+        self.data_length = data_length
+        if len(self.data[TIME_KEY]) < data_length:
+            raise ValueError("too few samples in logs")
+
+    def _get_window(self, data_length: typing.Optional[int] = None) -> RingBuffer:
+        """Get a filled window (of all samples if data_length is 0)."""
+        if data_length is None:
+            data_length = self.data_length
+        capacity = data_length or len(self.data[TIME_KEY])
+        window = RingBuffer(
+            columns=self.columns, capacity=capacity, time_column=TIME_KEY
+        )
+        window.extend(tstamps=self.data[TIME_KEY], values=self.data)
+        return window
+
+    def _get_model(self) -> HotellingTSquare:
+        """Get a univariate model of humidity fitted to logs."""
+        self._tmpdir = tempfile.TemporaryDirectory()
+        hts = HotellingTSquare(param_path=Path(self._tmpdir.name) / "param.json")
+        hts.fit(dataset=self.data["Humidity[%]"])
+        return hts
+
+    def case_parse_line(self) -> typing.Tuple[typing.Callable, int]:
+        lp = LineParser()
+        lines = self.lines
+
+        def func():
+            for line in lines:
+                lp.parse_line(line=line)
+
+        return func, len(lines)
+
+    def case_parse_feed(self) -> typing.Tuple[typing.Callable, int]:
+        # received bytes of 4 [KiB]
+        blocks = [self.raw[i : i + 4096] for i in range(0, len(self.raw), 4096)]
+
+        def func():
+            lp = LineParser()
+            for block in blocks:
+                lp.feed(data=block)
+
+        return func, len(self.lines)
+
+    def case_window_append(self) -> typing.Tuple[typing.Callable, int]:
+        window = self._get_window()
+        samples = [
+            dict(zip(self.data.keys(), v))
+            for v in zip(*[arr.tolist() for arr in self.data.values()])
+        ]
+
+        def func():
+            for sample in samples:
+                window.append(tstamp=sample[TIME_KEY], values=sample)
+
+        return func, len(samples)
+
+    def case_window_extend(self) -> typing.Tuple[typing.Callable, int]:
+        window = self._get_window()
+        n = len(self.data[TIME_KEY])
+        chunks = [
+            {k: v[i : i + 10] for k, v in self.data.items()} for i in range(0, n, 10)
+        ]
+
+        def func():
+            for chunk in chunks:
+                window.extend(tstamps=chunk[TIME_KEY], values=chunk)
+
+        return func, n
+
+    def case_to_dataframe(self) -> typing.Tuple[typing.Callable, int]:
+        from real_time_monitoring import MonitoringApp
+
+        windows = {"0": self._get_window()}
+
+        def func():
+            for _ in range(100):
+                MonitoringApp.to_dataframe(windows=windows, xcol=TIME_KEY)
+
+        return func, 100
+
+    def case_score_sample(self) -> typing.Tuple[typing.Callable, int]:
+        hts = self._get_model()
+        values = self.data["Humidity[%]"].tolist()
+
+        def func():
+            for v in values:
+                hts.is_normal(anomaly_score=hts.get_anomaly_score(data=v))
+
+        return func, len(values)
+
+    def case_score_batch(self) -> typing.Tuple[typing.Callable, int]:
+        hts = self._get_model()
+        values = self.data["Humidity[%]"]
+
+        def func():
+            hts.is_normal_batch(anomaly_scores=hts.score_batch(data=values))
+
+        return func, len(values)
+
+    def case_score_stream(self) -> typing.Tuple[typing.Callable, int]:
+        from detectors import CUSUM, EWMA, RollingZScore
+
+        hts = self._get_model()
+        std = float(np.sqrt(hts.params["variance"]))
+        detectors = [
+            EWMA(mean=hts.params["mean"], std=std),
+            CUSUM(mean=hts.params["mean"], std=std),
+            RollingZScore(),
+        ]
+        values = self.data["Humidity[%]"]
+
+        def func():
+            # 3 detectors of a device per chunk (updated sample by sample)
+            for det in detectors:
+                det.is_normal_batch(anomaly_scores=det.score_batch(data=values))
+
+        return func, len(values)
+
+    def case_fit(self) -> typing.Tuple[typing.Callable, int]:
+        hts = self._get_model()
+        dataset = np.column_stack(
+            [self.data["Temperature[degC]"], self.data["Humidity[%]"]]
+        )
+
+        def func():
+            hts.fit(dataset=dataset)
+
+        return func, len(dataset)
+
+    def _get_chunks(self) -> typing.Iterator[dict]:
+        """Get chunks of a new sample per frame endlessly following windows
+        (time stamps are shifted per cycle to keep increasing)."""
+        n = len(self.data[TIME_KEY])
+        tstamps = self.data[TIME_KEY]
+        span = int(tstamps[-1] - tstamps[0]) + 1_000_000_000
+        k = 1
+        while True:
+            for i in range(n):
+                chunk = {key: v[i : i + 1] for key, v in self.data.items()}
+                chunk[TIME_KEY] = tstamps[i : i + 1] + k * span
+                yield chunk
+            k += 1
+
+    def case_render_matplotlib(
+        self, data_length: typing.Optional[int] = None, max_points: int = 0
+    ) -> typing.Tuple[typing.Callable, int]:
+        from PIL import Image
+        from render import MatplotlibRenderer
+
+        windows = {"0": self._get_window(data_length=data_length)}
+        chunks = self._get_chunks()
+        renderer = MatplotlibRenderer(xlabel=TIME_KEY)
+
+        def func():
+            # the same as MonitoringApp.run (streamlit.image encodes png)
+            for _ in range(30):
+                chunk = next(chunks)
+                windows["0"].extend(tstamps=chunk[TIME_KEY], values=chunk)
+                image = renderer.update(
+                    windows=windows, max_points=max_points, method="lttb"
+                )
+                Image.fromarray(image).save(io.BytesIO(), format="png")
+
+        return func, 30
+
+    def case_render_matplotlib_full(self) -> typing.Tuple[typing.Callable, int]:
+        import gc
+
+        import matplotlib
+
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+
+        windows = {"0": self._get_window()}
+        chunks = self._get_chunks()
+        fig = plt.figure(figsize=(12, 5))
+        ax1 = fig.add_subplot()
+        ax2 = ax1.twinx()
+
+        def func():
+            # the previous path: all artists are made per frame
+            # (streamlit.pyplot saves png)
+            for _ in range(30):
+                chunk = next(chunks)
+                windows["0"].extend(tstamps=chunk[TIME_KEY], values=chunk)
+                ax1.cla()
+                ax2.cla()
+                x = windows["0"].get_timestamps().view("datetime64[ns]")
+                for ax, ycol, color in [
+                    (ax1, "Temperature[degC]", "red"),
+                    (ax2, "Humidity[%]", "blue"),
+                ]:
+                    ax.set_xlabel(TIME_KEY)
+                    ax.set_ylabel(ycol)
+                    ax.plot(
+                        x,
+                        windows["0"].get_column(ycol),
+                        marker="o",
+                        color=color,
+                        label=ycol,
+                    )
+                ax1.legend(loc="upper left")
+                ax2.legend(loc="upper right")
+                fig.tight_layout()
+                fig.savefig(io.BytesIO(), format="png")
+                plt.close("all")
+                gc.collect()
+
+        return func, 30
+
+    def case_render_streamlit(
+        self, mode: str = "full"
+    ) -> typing.Tuple[typing.Callable, int]:
+        import streamlit as st
+        import streamlit.logger
+        from real_time_monitoring import MonitoringApp
+        from render import StreamlitChart
+
+        # warnings of the bare mode
+        streamlit.logger.set_log_level("error")
+
+        windows = {"0": self._get_window()}
+        chunks = self._get_chunks()
+        chart = StreamlitChart(
+            placeholder=st.empty(),
+            capacity=self.data_length,
+            mode=mode,
+            chart_kwargs={"use_container_width": True},
+        )
+
+        def func():
+            # the same as MonitoringApp.run
+            for _ in range(30):
+                chunk = {"0": next(chunks)}
+                windows["0"].extend(tstamps=chunk["0"][TIME_KEY], values=chunk["0"])
+                chart.update(
+                    new_rows=lambda: MonitoringApp.to_dataframe(
+                        windows=chunk, xcol=TIME_KEY
+                    ),
+                    get_window=lambda: MonitoringApp.to_dataframe(
+                        windows=windows, xcol=TIME_KEY
+                    ),
+                )
+
+        return func, 30
+
+    def case_render_streamlit_append(self) -> typing.Tuple[typing.Callable, int]:
+        return self.case_render_streamlit(mode="append")
+
+    def case_render_matplotlib_long(self) -> typing.Tuple[typing.Callable, int]:
+        # a window of all samples downsampled to 1000 points
+        return self.case_render_matplotlib(data_length=0, max_points=1000)
+
+    def case_downsample_lttb(self) -> typing.Tuple[typing.Callable, int]:
+        from downsample import downsample
+
+        x = self.data[TIME_KEY]
+        ys = [self.data["Temperature[degC]"], self.data["Humidity[%]"]]
+
+        def func():
+            downsample(x=x, ys=ys, n_out=1000, method="lttb")
+
+        return func, len(x)
+
+    def case_downsample_minmax(self) -> typing.Tuple[typing.Callable, int]:
+        from downsample import downsample
+
+        x = self.data[TIME_KEY]
+        ys = [self.data["Temperature[degC]"], self.data["Humidity[%]"]]
+
+        def func():
+            downsample(x=x, ys=ys, n_out=1000, method="minmax")
+
+        return func, len(x)
+
+    def case_metrics_observe(self) -> typing.Tuple[typing.Callable, int]:
+        from metrics import Metrics
+
+        metrics = Metrics()
+
+        def func():
+            # a timer of a stage (the overhead of the instrumentation)
+            for _ in range(10000):
+                t0 = time.perf_counter()
+                metrics.observe(stage="stage", seconds=time.perf_counter() - t0)
+
+        return func, 10000
+
+    def case_rollup_update(self) -> typing.Tuple[typing.Callable, int]:
+        from rollup import RollupStore
+
+        n = len(self.data[TIME_KEY])
+        chunks = [
+            {k: v[i : i + 10] for k, v in self.data.items()} for i in range(0, n, 10)
+        ]
+
+        def func():
+            # in memory (files are not written)
+            store = RollupStore(columns=self.columns, root=None)
+            for chunk in chunks:
+                store.update(device_id="0", data=chunk)
+
+        return func, n
+
+
+######################################################################
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as err:
+        logging.error(msg=err, exc_info=True)
+    sys.exit()
@@ -0,0 +1,409 @@
+"""Streaming detectors of drifts and level shifts.
+
+Descriptions:
+    HotellingTSquare scores each sample by the static mean and variance,
+    so slow drifts or level shifts inside the threshold are not detected.
+    Detectors of this module keep a constant-size state per stream and
+    update it in O(1) per sample:
+    - EWMA: the exponentially weighted moving average control chart
+    - CUSUM: the two-sided tabular cumulative sum control chart
+    - RollingZScore: the z-score by the mean and variance of a sliding window
+    They have the same interface as HotellingTSquare (get_anomaly_score,
+    is_normal, score_batch and is_normal_batch), where scoring updates the
+    state, so one instance is used per device (univariate).
+    The in-control mean and standard deviation of EWMA / CUSUM are given
+    (e.g. by the fitted HotellingTSquare) or estimated by the first samples.
+
+Usage:
+- from detectors import DETECTORS, CUSUM
+    cusum = CUSUM(mean=50.0, std=7.8)
+    is_normal = cusum.is_normal(anomaly_score=cusum.get_anomaly_score(data=v))
+- detector = DETECTORS["EWMA"](lam=0.1, threshold=3.0)
+
+---
+
+KazutoMakino
+
+"""
+
+import math
+import typing
+
+import numpy as np
+
+######################################################################
+# class
+######################################################################
+
+
+class StreamingDetector:
+    """Base class of streaming detectors (univariate, stateful).
+
+    Descriptions:
+        Subclasses implement get_anomaly_score (which updates the state)
+        and reset. Scores <= threshold are normal.
+    """
+
+    # the in-control mean and standard deviation are used or not
+    has_baseline = False
+
+    # univariate only (the same attribute as HotellingTSquare)
+    is_multivariate = False
+
+    def __init__(self, threshold: float) -> None:
+        """Set the threshold.
+
+        Args:
+            threshold (float): The upper limit of normal anomaly scores.
+        """
+        self.threshold = float(threshold)
+        self.reset()
+
+    def reset(self) -> None:
+        """Clear the state."""
+        raise NotImplementedError
+
+    def get_anomaly_score(self, data: float) -> float:
+        """Update the state by a sample and calculate its anomaly score.
+
+        Args:
+            data (float): An input value.
+
+        Returns:
+            float: An anomaly score.
+        """
+        raise NotImplementedError
+
+    def is_normal(self, anomaly_score: float) -> bool:
+        """Return True (normal) or False (anomaly) using the threshold.
+
+        Args:
+            anomaly_score (float): A calculated anomaly score.
+
+        Returns:
+            bool: True (normal) or False (anomaly).
+        """
+        # return normal (True) or anomaly (False)
+        if anomaly_score <= self.threshold:
+            return True
+        else:
+            return False
+
+    def score_batch(self, data: np.ndarray) -> np.ndarray:
+        """Update the state by samples in order and calculate anomaly scores.
+
+        Args:
+            data (np.ndarray): A 1d-array of input values (in time order).
+
+        Returns:
+            np.ndarray: Anomaly scores with the same shape as data.
+        """
+        get_anomaly_score = self.get_anomaly_score
+        scores = np.empty(len(data), dtype=np.float64)
+        for i, v in enumerate(np.asarray(data, dtype=np.float64).tolist()):
+            scores[i] = get_anomaly_score(data=v)
+        return scores
+
+    def is_normal_batch(self, anomaly_scores: np.ndarray) -> np.ndarray:
+        """Return True (normal) or False (anomaly) of many scores at once.
+
+        Args:
+            anomaly_scores (np.ndarray): Calculated anomaly scores.
+
+        Returns:
+            np.ndarray: A bool array with the same shape as anomaly_scores.
+        """
+        return np.asarray(anomaly_scores) <= self.threshold
+
+
+class _BaselineDetector(StreamingDetector):
+    """Base class of detectors by the in-control mean and standard deviation.
+
+    Descriptions:
+        If the mean or the standard deviation is not given, they are
+        estimated by the first warmup samples (Welford's algorithm),
+        whose scores are 0.0.
+    """
+
+    has_baseline = True
+
+    def __init__(
+        self,
+        threshold: float,
+        mean: typing.Optional[float] = None,
+        std: typing.Optional[float] = None,
+        warmup: int = 100,
+    ) -> None:
+        """Set the baseline.
+
+        Args:
+            threshold (float): The upper limit of normal anomaly scores.
+            mean (float, optional): The in-control mean.
+                Defaults to None (estimated).
+            std (float, optional): The in-control standard deviation.
+                Defaults to None (estimated).
+            warmup (int, optional): The number of samples to estimate
+                the baseline. Defaults to 100.
+        """
+        if (std is not None) and not (std > 0):
+            raise ValueError(f"std must be positive: {std}")
+        if warmup < 2:
+            raise ValueError(f"warmup must be 2 or more: {warmup}")
+        self._mean0 = mean
+        self._std0 = std
+        self.warmup = int(warmup)
+        super().__init__(threshold=threshold)
+
+    def reset(self) -> None:
+        """Clear the state (the estimated baseline is also cleared)."""
+        self.mean = self._mean0
+        self.std = self._std0
+        self.is_ready = (self.mean is not None) and (self.std is not None)
+        self._n = 0
+        self._wmean = 0.0
+        self._wm2 = 0.0
+        self._reset_chart()
+
+    def _reset_chart(self) -> None:
+        """Clear the state of the chart."""
+        raise NotImplementedError
+
+    def _warm_up(self, data: float) -> None:
+        """Update the estimation of the baseline by a sample."""
+        self._n += 1
+        delta = data - self._wmean
+        self._wmean += delta / self._n
+        self._wm2 += delta * (data - self._wmean)
+        if self._n >= self.warmup:
+            if self.mean is None:
+                self.mean = self._wmean
+            if self.std is None:
+                self.std = math.sqrt(self._wm2 / (self._n - 1)) or 1.0
+            self.is_ready = True
+            self._reset_chart()
+
+
+class EWMA(_BaselineDetector):
+    """EWMA control chart class.
+
+    Descriptions:
+        z_t = lam * x_t + (1 - lam) * z_{t-1} (z_0 = mean), and the anomaly
+        score is |z_t - mean| / std(z_t), where
+        std(z_t) = std * sqrt(lam / (2 - lam) * (1 - (1 - lam)^(2t))).
+        Small lam detects small and slow shifts (a long memory).
+    """
+
+    def __init__(
+        self,
+        lam: float = 0.1,
+        threshold: float = 3.0,
+        mean: typing.Optional[float] = None,
+        std: typing.Optional[float] = None,
+        warmup: int = 100,
+    ) -> None:
+        """Set parameters.
+
+        Args:
+            lam (float, optional): The weight of the new sample (0, 1].
+                Defaults to 0.1.
+            threshold (float, optional): The width of control limits
+                (L [sigma]). Defaults to 3.0.
+            mean (float, optional): The in-control mean.
+                Defaults to None (estimated).
+            std (float, optional): The in-control standard deviation.
+                Defaults to None (estimated).
+            warmup (int, optional): The number of samples to estimate
+                the baseline. Defaults to 100.
+        """
+        if not (0 < lam <= 1):
+            raise ValueError(f"lam must be in (0, 1]: {lam}")
+        self.lam = float(lam)
+        super().__init__(threshold=threshold, mean=mean, std=std, warmup=warmup)
+
+    def _reset_chart(self) -> None:
+        self.z = self.mean
+        self._decay = 1.0
+
+    def get_anomaly_score(self, data: float) -> float:
+        """Update the EWMA by a sample and calculate its anomaly score.
+
+        Args:
+            data (float): An input value.
+
+        Returns:
+            float: |z_t - mean| / std(z_t) (0.0 while warming up).
+        """
+        if not self.is_ready:
+            self._warm_up(data=data)
+            return 0.0
+        lam = self.lam
+        self.z += lam * (data - self.z)
+        self._decay *= (1.0 - lam) * (1.0 - lam)
+        return abs(self.z - self.mean) / (
+            self.std * math.sqrt(lam / (2.0 - lam) * (1.0 - self._decay))
+        )
+
+
+class CUSUM(_BaselineDetector):
+    """Two-sided tabular CUSUM control chart class.
+
+    Descriptions:
+        By u_t = (x_t - mean) / std,
+        s+_t = max(0, s+_{t-1} + u_t - k), s-_t = max(0, s-_{t-1} - u_t - k),
+        and the anomaly score is max(s+_t, s-_t).
+        Shifts larger than k [sigma] are accumulated, so a small level shift
+        exceeds the threshold (h [sigma]) after some samples.
+        The sums are not reset at anomalies (shifted levels keep being
+        anomalies) but capped at limit x threshold, so they return to
+        normal within about (limit - 1) x threshold / k samples after the
+        level returns.
+    """
+
+    def __init__(
+        self,
+        k: float = 0.5,
+        threshold: float = 5.0,
+        limit: float = 2.0,
+        mean: typing.Optional[float] = None,
+        std: typing.Optional[float] = None,
+        warmup: int = 100,
+    ) -> None:
+        """Set parameters.
+
+        Args:
+            k (float, optional): The allowance [sigma] (about a half of the
+                shift to be detected). Defaults to 0.5.
+            threshold (float, optional): The decision interval (h [sigma]).
+                Defaults to 5.0.
+            limit (float, optional): The upper limit of sums (x threshold).
+                Defaults to 2.0.
+            mean (float, optional): The in-control mean.
+                Defaults to None (estimated).
+            std (float, optional): The in-control standard deviation.
+                Defaults to None (estimated).
+            warmup (int, optional): The number of samples to estimate
+                the baseline. Defaults to 100.
+        """
+        if k < 0:
+            raise ValueError(f"k must not be negative: {k}")
+        if limit < 1:
+            raise ValueError(f"limit must be 1 or more: {limit}")
+        self.k = float(k)
+        self.s_max = float(limit) * float(threshold)
+        super().__init__(threshold=threshold, mean=mean, std=std, warmup=warmup)
+
+    def _reset_chart(self) -> None:
+        self.s_pos = 0.0
+        self.s_neg = 0.0
+
+    def get_anomaly_score(self, data: float) -> float:
+        """Update the sums by a sample and calculate its anomaly score.
+
+        Args:
+            data (float): An input value.
+
+        Returns:
+            float: max(s+_t, s-_t) (0.0 while warming up).
+        """
+        if not self.is_ready:
+            self._warm_up(data=data)
+            return 0.0
+        u = (data - self.mean) / self.std
+        s_pos = min(max(self.s_pos + u - self.k, 0.0), self.s_max)
+        s_neg = min(max(self.s_neg - u - self.k, 0.0), self.s_max)
+        self.s_pos = s_pos
+        self.s_neg = s_neg
+        return s_pos if s_pos > s_neg else s_neg
+
+
+class RollingZScore(StreamingDetector):
+    """Rolling z-score class.
+
+    Descriptions:
+        The anomaly score is |x_t - mean| / std, where the mean and the
+        standard deviation are of the last window samples before x_t.
+        They are updated in O(1) per sample by adding the new sample and
+        removing the oldest one from the sum of squared deviations
+        (a preallocated ring buffer of the window).
+    """
+
+    def __init__(
+        self, window: int = 600, threshold: float = 3.0, min_periods: int = 30
+    ) -> None:
+        """Preallocate the window.
+
+        Args:
+            window (int, optional): The number of samples of the window.
+                Defaults to 600.
+            threshold (float, optional): The upper limit of normal
+                z-scores. Defaults to 3.0.
+            min_periods (int, optional): Scores are 0.0 until the window has
+                this number of samples. Defaults to 30.
+        """
+        if window < 2:
+            raise ValueError(f"window must be 2 or more: {window}")
+        self.window = int(window)
+        self.min_periods = min(max(int(min_periods), 2), self.window)
+        self._values = [0.0] * self.window
+        super().__init__(threshold=threshold)
+
+    def reset(self) -> None:
+        """Clear the window."""
+        self._head = 0
+        self._size = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def get_anomaly_score(self, data: float) -> float:
+        """Calculate the z-score of a sample and add it to the window.
+
+        Args:
+            data (float): An input value.
+
+        Returns:
+            float: |x_t - mean| / std (0.0 if too few samples, or inf
+                if the window is constant and x_t is not the same).
+        """
+        # score by the window before the sample
+        n = self._size
+        mean = self.mean
+        score = 0.0
+        if n >= self.min_periods:
+            var = self._m2 / (n - 1)
+            dev = abs(data - mean)
+            if var > 0.0:
+                score = dev / math.sqrt(var)
+            elif dev > 0.0:
+                score = math.inf
+
+        # add the sample (and remove the oldest one if full)
+        i = self._head
+        if n < self.window:
+            n += 1
+            self._size = n
+            delta = data - mean
+            mean += delta / n
+            self._m2 += delta * (data - mean)
+        else:
+            old = self._values[i]
+            delta = data - old
+            mean_new = mean + delta / n
+            m2 = self._m2 + delta * (data - mean_new + old - mean)
+            self._m2 = m2 if m2 > 0.0 else 0.0
+            mean = mean_new
+        self.mean = mean
+        self._values[i] = data
+        self._head = i + 1 if i + 1 < self.window else 0
+        return score
+
+
+######################################################################
+# settings
+######################################################################
+
+# detectors selectable by settings.yml (Monitoring: Detectors:)
+DETECTORS = {
+    "EWMA": EWMA,
+    "CUSUM": CUSUM,
+    "RollingZScore": RollingZScore,
+}
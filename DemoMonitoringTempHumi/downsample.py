@@ -0,0 +1,169 @@
+"""Downsampling of time series for plotting.
+
+Descriptions:
+    Windows longer than the plot width are reduced to about the width
+    before plotting, so the rendering time does not depend on the window
+    length. Functions return indices of kept samples (the first and the
+    last are always kept), so several columns sharing the time stamps can
+    be reduced together.
+    - "lttb": largest-triangle-three-buckets (keeps the visual shape)
+    - "minmax": the minimum and maximum of each bucket (keeps all spikes)
+
+Usage:
+- from downsample import downsample
+    idx = downsample(x=tstamps, ys=[temp, humi], n_out=1000, method="lttb")
+    x, temp, humi = tstamps[idx], temp[idx], humi[idx]
+
+---
+
+KazutoMakino
+
+"""
+
+import typing
+
+import numpy as np
+
+######################################################################
+# modules
+######################################################################
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Select indices by largest-triangle-three-buckets.
+
+    Descriptions:
+        Inner samples are split into n_out - 2 buckets, and the sample which
+        makes the largest triangle with the previous selected sample and
+        the average of the next bucket is selected from each bucket.
+
+    Args:
+        x (np.ndarray): A 1d-array of x (e.g. time stamps).
+        y (np.ndarray): A 1d-array of y.
+        n_out (int): The number of output samples.
+
+    Returns:
+        np.ndarray: Sorted indices (all if n_out >= len(y) or n_out < 3).
+    """
+    n = len(y)
+    if (n_out >= n) or (n_out < 3):
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # buckets [edges[k], edges[k + 1]) of inner samples [1, n - 1)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    counts = np.diff(edges)
+
+    # averages of the next buckets (the last sample for the last bucket)
+    avg_x = np.add.reduceat(x[: n - 1], edges[:-1]) / counts
+    avg_y = np.add.reduceat(y[: n - 1], edges[:-1]) / counts
+    avg_x = np.append(avg_x[1:], x[-1]).tolist()
+    avg_y = np.append(avg_y[1:], y[-1]).tolist()
+
+    # select the sample of the largest triangle per bucket
+    # (2 * area = |A * y + B * x - (A * ya + B * xa)| with the selected a)
+    idx = np.empty(n_out, dtype=np.int64)
+    idx[0], idx[-1] = 0, n - 1
+    xa, ya = float(x[0]), float(y[0])
+    for k, (s, e) in enumerate(zip(edges[:-1].tolist(), edges[1:].tolist())):
+        coef_a = xa - avg_x[k]
+        coef_b = avg_y[k] - ya
+        area = coef_a * y[s:e] + coef_b * x[s:e]
+        area -= coef_a * ya + coef_b * xa
+        np.abs(area, out=area)
+        a = s + int(area.argmax())
+        xa, ya = float(x[a]), float(y[a])
+        idx[k + 1] = a
+
+    return idx
+
+
+def minmax(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Select indices of the minimum and maximum of each bucket.
+
+    Args:
+        x (np.ndarray): A 1d-array of x (not used, for the same interface).
+        y (np.ndarray): A 1d-array of y.
+        n_out (int): The maximum number of output samples
+            (n_out // 2 buckets).
+
+    Returns:
+        np.ndarray: Sorted unique indices (all if n_out >= len(y) or n_out < 4).
+    """
+    n = len(y)
+    if (n_out >= n) or (n_out < 4):
+        return np.arange(n)
+    y = np.asarray(y, dtype=np.float64)
+
+    # buckets of equal lengths
+    n_buckets = n_out // 2
+    edges = np.linspace(0, n, n_buckets + 1).astype(np.int64)
+    bucket_ids = np.repeat(np.arange(n_buckets), np.diff(edges))
+
+    # the first index of the extremum per bucket (buckets of nan are skipped)
+    idx = [np.array([0, n - 1])]
+    for reduce in [np.minimum, np.maximum]:
+        extrema = reduce.reduceat(y, edges[:-1])
+        cand = np.flatnonzero(y == extrema[bucket_ids])
+        idx.append(cand[np.unique(bucket_ids[cand], return_index=True)[1]])
+
+    return np.unique(np.concatenate(idx))
+
+
+METHODS = {"lttb": lttb, "minmax": minmax}
+
+
+def downsample(
+    x: np.ndarray,
+    ys: typing.List[np.ndarray],
+    n_out: int,
+    method: typing.Optional[str] = "lttb",
+) -> np.ndarray:
+    """Select indices of samples to be plotted for columns sharing x.
+
+    Args:
+        x (np.ndarray): A 1d-array of x (e.g. time stamps).
+        ys (List[np.ndarray]): 1d-arrays of columns.
+        n_out (int): The number of output samples per column
+            (e.g. the plot width [px]).
+        method (str, optional): "lttb", "minmax" or None (not reduced).
+            Defaults to "lttb".
+
+    Returns:
+        np.ndarray: Sorted unique indices (the union of columns).
+    """
+    n = len(x)
+    if (method is None) or (not n_out) or (n <= n_out):
+        return np.arange(n)
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {list(METHODS)}: {method}")
+
+    # time stamps of int64 [ns] -> float64 (relative, to keep the precision)
+    x = np.asarray(x)
+    x = (x - x[0]).astype(np.float64)
+
+    func = METHODS[method]
+    return np.unique(np.concatenate([func(x=x, y=y, n_out=n_out) for y in ys]))
+
+
+######################################################################
+# for checking
+######################################################################
+
+if __name__ == "__main__":
+    import time
+
+    # a multi-hour window @ 10 [Hz] with spikes
+    n = 10 * 3600 * 4
+    x = np.arange(n, dtype=np.int64) * 100_000_000
+    y = np.sin(np.arange(n) * 1e-4) + np.random.rand(n) * 0.1
+    y[::7919] += 5
+    for method in METHODS:
+        tstart = time.perf_counter()
+        idx = downsample(x=x, ys=[y], n_out=1000, method=method)
+        elapsed = time.perf_counter() - tstart
+        print(
+            f"{method}: {n} -> {len(idx)} in {elapsed * 1e3:.3f} [ms], "
+            + f"max: {y.max():.3f} -> {y[idx].max():.3f}"
+        )
@@ -0,0 +1,283 @@
+"""Binary frame protocol between temp_humi.py and DataStream.
+
+Descriptions:
+    A frame is 21 bytes of little-endian struct "<2sHIIIHHB":
+        magic (b"\\xa5\\x5a"), sequence number (uint16),
+        time stamp [s] since 2000/01/01 of the device's local time (uint32),
+        sub seconds [us] (uint32), device ticks [ms] (uint32),
+        raw temperature / humidity counts of SHT3x (uint16, uint16),
+        CRC-8 (poly 0x31, init 0xff) of the bytes from the sequence number.
+    FrameDecoder scans received bytes with NumPy without copying,
+    resyncs after garbage (e.g. boot messages) and counts sequence gaps.
+
+Usage:
+- from frame_protocol import FrameDecoder
+    fd = FrameDecoder()
+    data = fd.feed(data=serial_bytes)  # {column: array}
+
+---
+
+KazutoMakino
+
+"""
+
+import struct
+import typing
+
+import numpy as np
+
+# import my pkgs
+if True:
+    from line_parser import TIME_KEY
+
+######################################################################
+# settings
+######################################################################
+
+MAGIC = b"\xa5\x5a"
+FRAME_FORMAT = "<2sHIIIHHB"
+FRAME_SIZE = struct.calcsize(FRAME_FORMAT)
+FRAME_DTYPE = np.dtype(
+    [
+        ("magic", "S2"),
+        ("seq", "<u2"),
+        ("sec", "<u4"),
+        ("usec", "<u4"),
+        ("ticks", "<u4"),
+        ("t_raw", "<u2"),
+        ("h_raw", "<u2"),
+        ("crc", "u1"),
+    ]
+)
+
+# epoch [ns] of 2000/01/01 (the epoch of micropython)
+EPOCH_2000_NS = int(np.datetime64("2000-01-01", "ns").astype(np.int64))
+
+
+def _get_crc8_table() -> np.ndarray:
+    """Get the CRC-8 (poly 0x31) table of 256 bytes."""
+    table = np.zeros(256, dtype=np.uint8)
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x31) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        table[i] = crc
+    return table
+
+
+_CRC8_TABLE = _get_crc8_table()
+
+######################################################################
+# modules
+######################################################################
+
+
+def crc8(data: bytes, init: int = 0xFF) -> int:
+    """Get CRC-8 (poly 0x31) of the data (the same as SHT3x).
+
+    Args:
+        data (bytes): A data.
+        init (int, optional): An initial value. Defaults to 0xFF.
+
+    Returns:
+        int: The CRC.
+    """
+    crc = init
+    for v in data:
+        crc = int(_CRC8_TABLE[crc ^ v])
+    return crc
+
+
+def encode_frame(
+    seq: int, sec: int, usec: int, ticks: int, t_raw: int, h_raw: int
+) -> bytes:
+    """Encode a frame (the same as temp_humi.py).
+
+    Args:
+        seq (int): A sequence number (wrapped at 2 ** 16).
+        sec (int): A time stamp [s] since 2000/01/01.
+        usec (int): Sub seconds [us].
+        ticks (int): Device ticks [ms] (wrapped at 2 ** 32).
+        t_raw (int): A raw temperature count.
+        h_raw (int): A raw humidity count.
+
+    Returns:
+        bytes: The frame.
+    """
+    body = struct.pack(
+        FRAME_FORMAT[:-1],
+        MAGIC,
+        seq & 0xFFFF,
+        sec,
+        usec,
+        ticks & 0xFFFFFFFF,
+        t_raw,
+        h_raw,
+    )
+    return body + bytes([crc8(data=body[2:])])
+
+
+def get_frames_end(data: bytes) -> int:
+    """Get the end of complete frames in received bytes.
+
+    Descriptions:
+        Bytes from the first magic which may start an incomplete frame
+        (i.e. in the last FRAME_SIZE - 1 bytes and not in the last valid
+        frame) are excluded, so frames are not split (e.g. by log rotations).
+
+    Args:
+        data (bytes): Received bytes.
+
+    Returns:
+        int: The end index (len(data) if there is no incomplete frame).
+    """
+    n = len(data)
+
+    # the end of the last valid frame overlapping the last FRAME_SIZE - 1 bytes
+    end = 0
+    for s in range(n - FRAME_SIZE, max(n - 2 * FRAME_SIZE + 1, -1), -1):
+        if (data[s : s + 2] == MAGIC) and (
+            crc8(data=data[s + 2 : s + FRAME_SIZE - 1]) == data[s + FRAME_SIZE - 1]
+        ):
+            end = s + FRAME_SIZE
+            break
+
+    # the first magic (or its first byte at the end) after that
+    start = max(end, n - FRAME_SIZE + 1, 0)
+    i = data.find(MAGIC, start)
+    if i >= 0:
+        return i
+    if (n > start) and (data[-1] == MAGIC[0]):
+        return n - 1
+    return n
+
+
+######################################################################
+# class
+######################################################################
+
+
+class FrameDecoder:
+    """Streaming decoder class of binary frames."""
+
+    def __init__(self) -> None:
+        """Init the buffer and counters."""
+        # init: undecoded bytes
+        self._buf = b""
+
+        # init: counters
+        self.n_frames = 0
+        self.n_rejected = 0
+        self.n_skipped_bytes = 0
+        self.n_gaps = 0
+        self.n_lost = 0
+        self.last_seq = None
+
+    def feed(self, data: bytes) -> typing.Dict[str, np.ndarray]:
+        """Decode frames in received bytes.
+
+        Args:
+            data (bytes): Received bytes (frames may be split or
+                mixed with garbage).
+
+        Returns:
+            Dict[str, np.ndarray]: {column: 1d-array} with the same columns as
+                the text protocol (time stamps are epoch [ns] of int64).
+        """
+        # join the undecoded rest
+        buf = self._buf + bytes(data)
+        n_buf = len(buf)
+        arr = np.frombuffer(buf, dtype=np.uint8)
+
+        # get valid frames
+        starts = np.zeros(0, dtype=np.int64)
+        if n_buf >= FRAME_SIZE:
+            # candidates: magic bytes (rows of a strided view, not copied)
+            rows = np.lib.stride_tricks.as_strided(
+                arr, shape=(n_buf - FRAME_SIZE + 1, FRAME_SIZE), strides=(1, 1)
+            )
+            cand = np.flatnonzero((rows[:, 0] == MAGIC[0]) & (rows[:, 1] == MAGIC[1]))
+
+            # check CRC of all candidates column by column
+            crc = np.full(len(cand), 0xFF, dtype=np.uint8)
+            for j in range(2, FRAME_SIZE - 1):
+                crc = _CRC8_TABLE[crc ^ rows[cand, j]]
+            is_valid = crc == rows[cand, FRAME_SIZE - 1]
+            starts = cand[is_valid]
+            self.n_rejected += int(np.count_nonzero(~is_valid))
+
+            # remove overlapped frames (magic and CRC matched by chance)
+            if np.any(np.diff(starts) < FRAME_SIZE):
+                keep, end = [], 0
+                for s in starts.tolist():
+                    if s >= end:
+                        keep.append(s)
+                        end = s + FRAME_SIZE
+                self.n_rejected += len(starts) - len(keep)
+                starts = np.array(keep, dtype=np.int64)
+
+        # keep the rest which may be a head of the next frame
+        end = int(starts[-1]) + FRAME_SIZE if len(starts) else 0
+        rest = max(end, n_buf - FRAME_SIZE + 1)
+        self.n_skipped_bytes += rest - len(starts) * FRAME_SIZE
+        self._buf = buf[rest:]
+
+        # get frames (not copied if frames are contiguous)
+        n = len(starts)
+        if n and (int(starts[-1]) - int(starts[0]) == (n - 1) * FRAME_SIZE):
+            frames = np.frombuffer(
+                buf, dtype=FRAME_DTYPE, count=n, offset=int(starts[0])
+            )
+        else:
+            frames = rows[starts].view(FRAME_DTYPE)[:, 0] if n else None
+
+        return self._to_columns(frames=frames)
+
+    def _to_columns(self, frames: typing.Optional[np.ndarray]) -> dict:
+        """Convert frames to columns and update counters."""
+        if frames is None:
+            return {
+                TIME_KEY: np.zeros(0, dtype=np.int64),
+                "ElapsedTime[s]": np.zeros(0),
+                "Temperature[degC]": np.zeros(0),
+                "Humidity[%]": np.zeros(0),
+            }
+
+        # sequence gaps (including the previous feed)
+        seq = frames["seq"].astype(np.int64)
+        if self.last_seq is not None:
+            seq_prev = np.concatenate([[self.last_seq], seq])
+        else:
+            seq_prev = seq
+        lost = (np.diff(seq_prev) - 1) % (1 << 16)
+        self.n_gaps += int(np.count_nonzero(lost))
+        self.n_lost += int(lost.sum())
+        self.last_seq = int(seq[-1])
+        self.n_frames += len(frames)
+
+        # convert (the same as SHT31.get_temp_humi)
+        return {
+            TIME_KEY: (
+                EPOCH_2000_NS
+                + frames["sec"].astype(np.int64) * 1_000_000_000
+                + frames["usec"].astype(np.int64) * 1_000
+            ),
+            "ElapsedTime[s]": frames["ticks"] * 1e-3,
+            "Temperature[degC]": -45 + 175 * (frames["t_raw"] / 65535),
+            "Humidity[%]": 100 * (frames["h_raw"] / 65535),
+        }
+
+    def get_stats(self) -> dict:
+        """Get counters.
+
+        Returns:
+            dict: frames, rejected (candidates of wrong CRC), skipped_bytes,
+                gaps and lost.
+        """
+        return {
+            "frames": self.n_frames,
+            "rejected": self.n_rejected,
+            "skipped_bytes": self.n_skipped_bytes,
+            "gaps": self.n_gaps,
+            "lost": self.n_lost,
+        }
@@ -0,0 +1,340 @@
+"""Background ingestion with a bounded queue.
+
+Descriptions:
+    IngestWorker calls a blocking source (e.g. DataStream.run) in a
+    background thread and puts results into BoundedQueue, so the UI loop
+    is not blocked by serial reading and can drain all samples per frame.
+
+Usage:
+- from ingest import BoundedQueue, IngestWorker
+
+---
+
+KazutoMakino
+
+"""
+
+import collections
+import threading
+import time
+import typing
+
+######################################################################
+# class
+######################################################################
+
+
+class BoundedQueue:
+    """Bounded FIFO queue class with an overflow policy.
+
+    Descriptions:
+        The overflow policy is applied when putting into the full queue.
+        - "drop-oldest": the oldest item is dropped.
+        - "block": the producer waits until the consumer drains.
+        - "coalesce": the newest queued item of the same key (e.g. the same
+          device) is replaced by the new item. If there is no such item,
+          the oldest item is dropped.
+    """
+
+    POLICIES = ("drop-oldest", "block", "coalesce")
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        policy: str = "drop-oldest",
+        key: typing.Optional[typing.Callable[[object], object]] = None,
+    ) -> None:
+        """Set the queue size and the overflow policy.
+
+        Args:
+            maxsize (int, optional): A maximum number of items.
+                Defaults to 1024.
+            policy (str, optional): An overflow policy
+                ("drop-oldest", "block" or "coalesce").
+                Defaults to "drop-oldest".
+            key (Callable[[object], object], optional): A function which
+                returns a key of an item for "coalesce"
+                (e.g. lambda item: item[0] for items tagged by IngestWorker).
+                Defaults to None (all items have the same key).
+        """
+        if maxsize < 1:
+            raise ValueError(f"maxsize must be positive: {maxsize}")
+        if policy not in self.POLICIES:
+            raise ValueError(f"policy must be one of {self.POLICIES}: {policy}")
+
+        # set parameters
+        self.maxsize = int(maxsize)
+        self.policy = policy
+        self.key = key
+
+        # init
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+        # counters
+        self.n_put = 0
+        self.n_dropped = 0
+        self.n_coalesced = 0
+        self.n_blocked = 0
+        self.max_depth = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @property
+    def closed(self) -> bool:
+        """Whether the queue is closed or not."""
+        return self._closed
+
+    def put(self, item: object, timeout: typing.Optional[float] = None) -> bool:
+        """Put an item.
+
+        Args:
+            item (object): An item.
+            timeout (float, optional): A timeout [s] of "block".
+                Defaults to None (wait forever).
+
+        Returns:
+            bool: False if the item is not put (timeout or closed).
+                The item is not counted as dropped by "block", since the
+                caller may retry it (see count_dropped).
+        """
+        with self._cond:
+            if self._closed:
+                return False
+
+            # overflow
+            if len(self._items) >= self.maxsize:
+                if self.policy == "drop-oldest":
+                    self._items.popleft()
+                    self.n_dropped += 1
+
+                elif self.policy == "coalesce":
+                    i = self._find_newest(
+                        key=None if self.key is None else self.key(item)
+                    )
+                    if i is None:
+                        self._items.popleft()
+                        self.n_dropped += 1
+                    else:
+                        self._items[i] = item
+                        self.n_coalesced += 1
+                        self.n_put += 1
+                        self._cond.notify_all()
+                        return True
+
+                else:
+                    is_ready = self._cond.wait_for(
+                        lambda: (len(self._items) < self.maxsize) or self._closed,
+                        timeout=timeout,
+                    )
+                    if self._closed:
+                        return False
+                    if not is_ready:
+                        self.n_blocked += 1
+                        return False
+
+            # append
+            self._items.append(item)
+            self.n_put += 1
+            self.max_depth = max(self.max_depth, len(self._items))
+            self._cond.notify_all()
+
+        return True
+
+    def _find_newest(self, key: object) -> typing.Optional[int]:
+        """Find the newest item of the key.
+
+        Args:
+            key (object): A key (ignored if self.key is None).
+
+        Returns:
+            Optional[int]: An index of the item (None if not found).
+        """
+        if self.key is None:
+            return len(self._items) - 1
+        for i in range(len(self._items) - 1, -1, -1):
+            if self.key(self._items[i]) == key:
+                return i
+        return None
+
+    def drain(
+        self,
+        timeout: typing.Optional[float] = None,
+        max_items: typing.Optional[int] = None,
+    ) -> list:
+        """Get all available items (oldest -> newest).
+
+        Args:
+            timeout (float, optional): A time [s] to wait for the first item.
+                Defaults to None (not wait).
+            max_items (int, optional): A maximum number of items.
+                Defaults to None (all items).
+
+        Returns:
+            list: Items (empty if timeout or closed).
+        """
+        with self._cond:
+            if timeout is not None:
+                self._cond.wait_for(
+                    lambda: len(self._items) or self._closed, timeout=timeout
+                )
+            n = len(self._items)
+            if max_items is not None:
+                n = min(n, max_items)
+            ret = [self._items.popleft() for _ in range(n)]
+            self._cond.notify_all()
+
+        return ret
+
+    def count_dropped(self, n: int = 1) -> None:
+        """Count items which are given up by the producer.
+
+        Args:
+            n (int, optional): A number of items. Defaults to 1.
+        """
+        with self._cond:
+            self.n_dropped += n
+
+    def close(self) -> None:
+        """Close the queue (waiting producers / consumers are released)."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def get_stats(self) -> dict:
+        """Get counters.
+
+        Returns:
+            dict: depth, max_depth, put, dropped, coalesced and blocked
+                (timeouts of "block").
+        """
+        return {
+            "depth": len(self._items),
+            "max_depth": self.max_depth,
+            "put": self.n_put,
+            "dropped": self.n_dropped,
+            "coalesced": self.n_coalesced,
+            "blocked": self.n_blocked,
+        }
+
+
+class IngestWorker(threading.Thread):
+    """Background ingestion thread class."""
+
+    def __init__(
+        self,
+        source: typing.Callable[[], object],
+        queue: BoundedQueue,
+        skip_values: tuple = ("continue",),
+        tag: typing.Optional[str] = None,
+        close_queue: bool = True,
+        put_timeout: float = 1.0,
+    ) -> None:
+        """Set the source and the queue.
+
+        Args:
+            source (Callable[[], object]): A blocking function which returns
+                an item (None: the end of the stream).
+            queue (BoundedQueue): A queue to put items into.
+            skip_values (tuple, optional): Returned values which are skipped.
+                Defaults to ("continue",).
+            tag (str, optional): If given, (tag, item) is put
+                (e.g. a device id when workers share the queue).
+                Defaults to None.
+            close_queue (bool, optional): Close the queue at the end
+                (set False when workers share the queue). Defaults to True.
+            put_timeout (float, optional): A timeout [s] of a "block" put,
+                after which the stop is checked and the put is retried.
+                Defaults to 1.0.
+        """
+        super().__init__(
+            name="IngestWorker" if tag is None else f"IngestWorker-{tag}",
+            daemon=True,
+        )
+
+        # set parameters
+        self.source = source
+        self.queue = queue
+        self.skip_values = skip_values
+        self.tag = tag
+        self.close_queue = close_queue
+        self.put_timeout = put_timeout
+
+        # init
+        self._stop_event = threading.Event()
+        self.n_skipped = 0
+        self.error = None
+
+    def run(self) -> None:
+        """Call the source and put items until stopped or the end."""
+        try:
+            while not self._stop_event.is_set():
+                # get item
+                item = self.source()
+
+                # end of the stream
+                if item is None:
+                    break
+
+                # skip
+                if isinstance(item, str) and (item in self.skip_values):
+                    self.n_skipped += 1
+                    continue
+
+                # tag
+                if self.tag is not None:
+                    item = (self.tag, item)
+
+                # put (retry if "block" policy is timeout)
+                while not self.queue.put(item=item, timeout=self.put_timeout):
+                    if self._stop_event.is_set() or self.queue.closed:
+                        self.queue.count_dropped()
+                        return
+
+        except Exception as err:
+            # keep the error for the consumer
+            self.error = err
+
+        finally:
+            if self.close_queue:
+                self.queue.close()
+
+    def stop(self, timeout: typing.Optional[float] = None) -> None:
+        """Stop the thread.
+
+        Args:
+            timeout (float, optional): A time [s] to wait for the thread.
+                Defaults to None (not wait).
+        """
+        self._stop_event.set()
+        if self.close_queue:
+            self.queue.close()
+        if timeout is not None:
+            self.join(timeout=timeout)
+
+    def get_stats(self) -> dict:
+        """Get counters of the queue and the worker.
+
+        Returns:
+            dict: depth, max_depth, put, dropped, coalesced, blocked and
+                skipped.
+        """
+        return {**self.queue.get_stats(), "skipped": self.n_skipped}
+
+
+######################################################################
+# for checking
+######################################################################
+
+if __name__ == "__main__":
+    # slow consumer with a fast source
+    q = BoundedQueue(maxsize=10, policy="drop-oldest")
+    counter = iter(range(1000))
+    w = IngestWorker(source=lambda: next(counter, None), queue=q)
+    w.start()
+    while w.is_alive() or len(q):
+        items = q.drain(timeout=0.1)
+        time.sleep(0.01)
+    print(w.get_stats())
@@ -0,0 +1,496 @@
+"""Streaming parser of the IoT device's line format.
+
+Format (temp_humi.py, serial_monitor.py):
+    TimeStamp: 2022/01/18 18:05:40.16290, ElapsedTime[s]: 55.832, ...
+
+    - The sub-second field of "TimeStamp" is RTC().datetime()'s subseconds
+      [us] which is not zero-padded ("40.16290" means 40.016290 [s]).
+    - "TimeStamp" is converted to int64 epoch [ns] (naive local time),
+      the other values are converted to float64.
+    - Lines which are not in this format (restarting messages, garbage,
+      broken lines) are skipped without raising.
+
+Usage:
+- from line_parser import LineParser
+- py line_parser.py {log file paths}
+
+---
+
+KazutoMakino
+
+"""
+
+import argparse
+import io
+import logging
+import sys
+import time
+import typing
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+
+######################################################################
+# settings
+######################################################################
+
+# the first key and the separators
+TIME_KEY = "TimeStamp"
+SEP_ITEM = b", "
+SEP_KEY = b": "
+
+# the head of a line (digits are normalized to "0" by _LUT_NORM)
+#   "TimeStamp: YYYY/MM/DD hh:mm:ss.u..."
+_HEAD = b"TimeStamp: 0000/00/00 00:00:00."
+_POS_DIGITS = np.array([11, 12, 13, 14, 16, 17, 19, 20, 22, 23, 25, 26, 28, 29])
+
+# the maximum width of a numerical text in the vectorized parsing
+# (float64 represents integers of 15 digits exactly)
+_MAX_WIDTH = 15
+_POW10 = 10.0 ** np.arange(_MAX_WIDTH + 1)
+
+# lookup tables of characters
+#   _LUT_NORM: digits -> "0", others -> themselves
+#   _LUT_DIGIT: digits -> values, others -> 0
+#   _LUT_CODE: digits -> 0, "." -> 1, "-" -> 16, others -> 64
+#   _LUT_DOT: "." -> 1, others -> 0
+_LUT_NORM = np.arange(256, dtype=np.uint8)
+_LUT_NORM[ord("0") : ord("9") + 1] = ord("0")
+_LUT_DIGIT = np.zeros(256)
+_LUT_DIGIT[ord("0") : ord("9") + 1] = np.arange(10)
+_LUT_CODE = np.full(256, 64.0)
+_LUT_CODE[ord("0") : ord("9") + 1] = 0.0
+_LUT_CODE[ord(".")] = 1.0
+_LUT_CODE[ord("-")] = 16.0
+_LUT_DOT = np.zeros(256)
+_LUT_DOT[ord(".")] = 1.0
+
+######################################################################
+# main
+######################################################################
+
+
+def main():
+    # get parser
+    parser = argparse.ArgumentParser(description="Parse log files.")
+    parser.add_argument("paths", type=str, nargs="+", help="log file paths")
+    args = parser.parse_args()
+
+    # parse and show throughput
+    lp = LineParser()
+    for path in args.paths:
+        t_start = time.perf_counter()
+        n = sum(len(v[TIME_KEY]) for v in lp.iter_chunks(source=path))
+        elapsed = time.perf_counter() - t_start
+        print(f"{path}: {n} lines, {n / elapsed:.0f} lines/s, skipped={lp.n_skipped}")
+
+
+######################################################################
+# class
+######################################################################
+
+
+class LineParser:
+    """Parser class of the "TimeStamp: ..., Key: Value" line format."""
+
+    def __init__(self, columns: typing.Optional[typing.List[str]] = None) -> None:
+        """Set columns.
+
+        Args:
+            columns (List[str], optional): Keys of a line in order
+                (the first one must be "TimeStamp").
+                Defaults to None (keys of the first valid line).
+        """
+        # init
+        self.columns = None
+        self.n_skipped = 0
+        self._days_cache = {}
+        self._rest = b""
+
+        # set columns
+        if columns is not None:
+            self._set_columns(columns=columns)
+
+    def _set_columns(self, columns: typing.List[str]) -> None:
+        """Set columns and the byte patterns of keys."""
+        if columns[0] != TIME_KEY:
+            raise ValueError(f"the first column must be {TIME_KEY}: {columns}")
+        self.columns = list(columns)
+        self._keys = [
+            np.frombuffer(k.encode() + SEP_KEY, dtype=np.uint8) for k in columns
+        ]
+
+    def parse_line(self, line: typing.Union[str, bytes]) -> typing.Optional[dict]:
+        """Parse a line.
+
+        Args:
+            line (Union[str, bytes]): A line.
+
+        Returns:
+            Optional[dict]: {"TimeStamp": epoch [ns], key: value, ...},
+                or None if the line is invalid.
+        """
+        # cast
+        if isinstance(line, (bytes, bytearray)):
+            line = line.decode(encoding="utf-8", errors="replace")
+        line = line.rstrip("\r\n")
+
+        # check header
+        if not line.startswith("TimeStamp: "):
+            return None
+
+        try:
+            # txt to dict
+            items = [w.split(": ", maxsplit=1) for w in line.split(", ")]
+            data_dict = {k: v for k, v in items}
+
+            # cast
+            if self.columns is None:
+                self._set_columns(columns=list(data_dict.keys()))
+            elif list(data_dict.keys()) != self.columns:
+                return None
+            for k, v in data_dict.items():
+                if k == TIME_KEY:
+                    data_dict[k] = self.to_epoch_ns(tstamp=v)
+                else:
+                    data_dict[k] = float(v)
+
+        except ValueError:
+            return None
+
+        return data_dict
+
+    def to_epoch_ns(self, tstamp: str) -> int:
+        """Convert the time stamp text to the epoch time.
+
+        Args:
+            tstamp (str): "YYYY/MM/DD hh:mm:ss.u" (u: not zero-padded [us]).
+
+        Returns:
+            int: The epoch time [ns] (naive local time).
+        """
+        # check the format of the time of every line (not only of new days)
+        hh, mm, ss, us = tstamp[11:13], tstamp[14:16], tstamp[17:19], tstamp[20:]
+        if not (
+            len(tstamp) >= 21
+            and tstamp[10] == " "
+            and tstamp[13] == ":"
+            and tstamp[16] == ":"
+            and tstamp[19] == "."
+            and (hh + mm + ss + us).isdigit()
+        ):
+            raise ValueError(f"invalid time stamp: {tstamp}")
+
+        # get days from 1970/01/01 (cached per day)
+        ymd = tstamp[:10]
+        days = self._days_cache.get(ymd)
+        if days is None:
+            if (ymd[4] != "/") or (ymd[7] != "/"):
+                raise ValueError(f"invalid time stamp: {tstamp}")
+            days = date(int(ymd[:4]), int(ymd[5:7]), int(ymd[8:10])).toordinal()
+            days -= date(1970, 1, 1).toordinal()
+            self._days_cache[ymd] = days
+
+        # get seconds of the day
+        secs = int(hh) * 3600 + int(mm) * 60 + int(ss)
+
+        return (days * 86400 + secs) * 1_000_000_000 + int(us) * 1000
+
+    def parse_chunk(self, data: bytes) -> dict:
+        """Parse complete lines at once.
+
+        Args:
+            data (bytes): Lines separated by b"\\n".
+
+        Returns:
+            dict: {"TimeStamp": int64 array, key: float64 array, ...}
+                (empty dict if there are no valid lines).
+        """
+        # add the last line feed and the sentinel
+        if not data.endswith(b"\n"):
+            data += b"\n"
+        buf = np.frombuffer(data + b"0", dtype=np.uint8)
+
+        # get line positions: [starts, ends)
+        ends = np.flatnonzero(buf == ord("\n"))
+        starts = np.empty_like(ends)
+        starts[0] = 0
+        starts[1:] = ends[:-1] + 1
+        ends = ends - (buf[np.maximum(ends - 1, 0)] == ord("\r"))
+
+        # columns from the first valid line
+        if self.columns is None:
+            for s, e in zip(starts, ends):
+                if self.parse_line(line=data[s:e]) is not None:
+                    break
+            else:
+                self.n_skipped += len(starts)
+                return {}
+
+        # candidate lines: the head of a line + enough length
+        cand = np.flatnonzero((ends - starts) > len(_HEAD))
+        head = self._gather(buf=buf, starts=starts[cand], width=len(_HEAD))
+        cand = cand[self._equals(rows=_LUT_NORM[head], pattern=_HEAD)]
+        seps = np.flatnonzero((buf[:-1] == SEP_ITEM[0]) & (buf[1:] == SEP_ITEM[1]))
+        if (len(cand) == 0) or (len(seps) == 0):
+            self.n_skipped += len(starts)
+            return {}
+        s = starts[cand]
+
+        # # check the format of lines (vectorized)
+        # the number of separators (", ") in each line
+        first_sep = np.searchsorted(seps, s)
+        n_sep = np.searchsorted(seps, ends[cand]) - first_sep
+        ok = n_sep == len(self.columns) - 1
+
+        # field positions: [value_starts[j], value_ends[j]) and keys
+        first_sep = np.where(ok, first_sep, 0)
+        value_starts, value_ends = [s + len(_HEAD)], []
+        for j, key in enumerate(self._keys[1:]):
+            sep = seps[np.minimum(first_sep + j, len(seps) - 1)]
+            value_ends.append(sep)
+            key_start = sep + len(SEP_ITEM)
+            ok &= self._equals(
+                rows=self._gather(buf=buf, starts=key_start, width=len(key)),
+                pattern=key,
+            )
+            value_starts.append(key_start + len(key))
+        value_ends.append(ends[cand])
+
+        # # parse values (vectorized)
+        values = [
+            self._parse_decimals(buf=buf, starts=vs, ends=ve)
+            for vs, ve in zip(value_starts, value_ends)
+        ]
+        for v in values:
+            ok &= ~np.isnan(v)
+        subsec = values[0]
+
+        # time stamp [ns]
+        digits = buf[s[:, None] + _POS_DIGITS].astype(np.int64) - ord("0")
+        year = (
+            digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+        )
+        month = digits[:, 4] * 10 + digits[:, 5]
+        day = digits[:, 6] * 10 + digits[:, 7]
+        secs = (
+            (digits[:, 8] * 10 + digits[:, 9]) * 3600
+            + (digits[:, 10] * 10 + digits[:, 11]) * 60
+            + (digits[:, 12] * 10 + digits[:, 13])
+        )
+        ok &= (month >= 1) & (month <= 12) & (day >= 1) & (day <= 31)
+        days = self._days_from_civil(year=year, month=month, day=day)
+        tstamps = (days * 86400 + secs) * 1_000_000_000
+        tstamps += np.where(ok, subsec, 0).astype(np.int64) * 1000
+
+        # set results of valid lines
+        ret = {TIME_KEY: tstamps[ok]}
+        for k, v in zip(self.columns[1:], values[1:]):
+            ret[k] = v[ok]
+
+        # # fall back to parse_line for candidate lines which are not parsed
+        # (e.g. exponential notation)
+        idx_valid = cand[ok]
+        idx_retry = cand[~ok]
+        retried = []
+        for i in idx_retry:
+            d = self.parse_line(line=data[starts[i] : ends[i]])
+            if d is not None:
+                retried.append((i, d))
+        if retried:
+            order = np.argsort(
+                np.concatenate([idx_valid, [i for i, _ in retried]]), kind="stable"
+            )
+            for k, v in ret.items():
+                ret[k] = np.concatenate([v, [d[k] for _, d in retried]]).astype(
+                    v.dtype
+                )[order]
+
+        # count skipped lines
+        self.n_skipped += len(starts) - len(ret[TIME_KEY])
+
+        return ret
+
+    def iter_chunks(
+        self,
+        source: typing.Union[str, Path, typing.BinaryIO],
+        chunk_size: int = 1 << 22,
+    ) -> typing.Generator[dict, None, None]:
+        """Parse a byte stream or a file chunk by chunk.
+
+        Args:
+            source (Union[str, Path, BinaryIO]): A file path
+                or a binary stream (with read()).
+            chunk_size (int, optional): A byte size to read at once.
+                Defaults to 1 << 22 (4 [MiB]).
+
+        Yields:
+            dict: {"TimeStamp": int64 array, key: float64 array, ...}
+        """
+        # open file
+        if isinstance(source, (str, Path)):
+            with Path(source).open(mode="rb") as f:
+                yield from self.iter_chunks(source=f, chunk_size=chunk_size)
+            return
+
+        # loop: chunks (complete lines only)
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            ret = self.feed(data=chunk)
+            if ret and len(ret[TIME_KEY]):
+                yield ret
+
+        # the last line without line feed
+        rest, self._rest = self._rest, b""
+        if rest.strip():
+            ret = self.parse_chunk(data=rest)
+            if ret and len(ret[TIME_KEY]):
+                yield ret
+
+    def feed(self, data: bytes) -> dict:
+        """Parse received bytes of a stream (e.g. batches of serial lines).
+
+        Args:
+            data (bytes): Received bytes (the last line may be incomplete,
+                which is kept and parsed with the next data).
+
+        Returns:
+            dict: {"TimeStamp": int64 array, key: float64 array, ...}
+                (empty dict if there are no complete valid lines).
+        """
+        # parse complete lines only
+        data = self._rest + data
+        last = data.rfind(b"\n")
+        if last < 0:
+            self._rest = data
+            return {}
+        self._rest = data[last + 1 :]
+        return self.parse_chunk(data=data[: last + 1])
+
+    def read_columns(
+        self, source: typing.Union[str, Path, bytes, typing.BinaryIO]
+    ) -> dict:
+        """Parse all lines of a file.
+
+        Args:
+            source (Union[str, Path, bytes, BinaryIO]): A file path,
+                bytes or a binary stream.
+
+        Returns:
+            dict: {"TimeStamp": int64 array, key: float64 array, ...}
+        """
+        if isinstance(source, (bytes, bytearray)):
+            source = io.BytesIO(source)
+        chunks = list(self.iter_chunks(source=source))
+        if not chunks:
+            return {}
+        return {k: np.concatenate([v[k] for v in chunks]) for k in chunks[0]}
+
+    @staticmethod
+    def _gather(buf: np.ndarray, starts: np.ndarray, width: int) -> np.ndarray:
+        """Get characters of fixed width: (rows, width).
+
+        Args:
+            buf (np.ndarray): A uint8 array of the text.
+            starts (np.ndarray): Start positions.
+            width (int): A width.
+
+        Returns:
+            np.ndarray: A uint8 2d-array (out of range -> the last character).
+        """
+        idx = starts[:, None] + np.arange(width)
+        return buf[np.minimum(idx, len(buf) - 1)]
+
+    @staticmethod
+    def _equals(rows: np.ndarray, pattern: bytes) -> np.ndarray:
+        """Compare each row of characters with the pattern at once.
+
+        Args:
+            rows (np.ndarray): A uint8 2d-array: (rows, len(pattern)).
+            pattern (bytes): A pattern.
+
+        Returns:
+            np.ndarray: A bool array.
+        """
+        rows = np.ascontiguousarray(rows)
+        return rows.view(f"S{rows.shape[1]}")[:, 0] == bytes(pattern)
+
+    @staticmethod
+    def _parse_decimals(
+        buf: np.ndarray, starts: np.ndarray, ends: np.ndarray
+    ) -> np.ndarray:
+        """Parse decimal texts (e.g. "-12.345") at once.
+
+        Descriptions:
+            Texts are right-aligned in a 2d-array of characters
+            (the left side is filled with "0"), and the integer made of
+            all digits is divided by 10^(fraction digits).
+            Both are exact in float64, so the result equals float(text).
+            Invalid texts (exponent, too long, ...) are NaN.
+
+        Args:
+            buf (np.ndarray): A uint8 array of the text
+                (the last character must be "0").
+            starts (np.ndarray): Start positions of texts.
+            ends (np.ndarray): End positions of texts (exclusive).
+
+        Returns:
+            np.ndarray: A float64 array.
+        """
+        # right-aligned characters: (texts, width)
+        n_chars = ends - starts
+        width = int(min(n_chars.max(initial=1), _MAX_WIDTH))
+        idx = ends[:, None] - width + np.arange(width)
+        chars = buf[np.where(idx >= starts[:, None], idx, len(buf) - 1)]
+
+        # count characters (digits: 0, ".": 1, "-": 16, others: 64)
+        codes = np.take(_LUT_CODE, chars) @ np.ones(width)
+        n_dots = codes % 16
+        is_minus = buf[starts] == ord("-")
+        valid = (n_chars > 0) & (n_chars <= width) & (n_dots <= 1)
+        valid &= (codes // 16) == is_minus
+        valid &= n_chars > (n_dots + is_minus)
+
+        # the integer made of all digits
+        # (digits on the left side of "." are 10 times larger here)
+        integer = np.take(_LUT_DIGIT, chars) @ _POW10[width - 1 :: -1]
+        n_frac = np.where(
+            n_dots == 1, width - 1 - np.take(_LUT_DOT, chars) @ np.arange(width), 0
+        ).astype(np.int64)
+        frac = np.fmod(integer, _POW10[n_frac])
+        integer = np.where(n_dots == 1, (integer - frac) / 10 + frac, integer)
+
+        # divide by 10^(fraction digits)
+        ret = integer / _POW10[n_frac]
+        ret[is_minus] *= -1
+
+        return np.where(valid, ret, np.nan)
+
+    @staticmethod
+    def _days_from_civil(
+        year: np.ndarray, month: np.ndarray, day: np.ndarray
+    ) -> np.ndarray:
+        """Get days from 1970/01/01 (proleptic gregorian calendar).
+
+        Refs.:
+        - http://howardhinnant.github.io/date_algorithms.html#days_from_civil
+        """
+        year = year - (month <= 2)
+        era = year // 400
+        yoe = year - era * 400
+        doy = (153 * (month + np.where(month > 2, -3, 9)) + 2) // 5 + day - 1
+        doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+        return era * 146097 + doe - 719468
+
+
+######################################################################
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as err:
+        logging.error(msg=err, exc_info=True)
+    sys.exit()
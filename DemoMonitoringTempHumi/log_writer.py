@@ -0,0 +1,253 @@
+"""Buffered and rotating log writer.
+
+Descriptions:
+    The log file is kept open and lines are flushed in batches
+    (every "flush_lines" lines or "flush_interval" seconds), so at most
+    one flush interval of lines is lost by a crash.
+    The log file is rotated by size ("max_bytes") and / or by wall-clock
+    period ("period", aligned to the local midnight), and rotated segments
+    ({stem}.{%Y%m%d%H%M%S}{suffix}) can be compressed by gzip or zstd
+    (zstandard is needed) in a background thread.
+
+Usage:
+- from log_writer import LogWriter
+    with LogWriter(path="log/sample.log", max_bytes=1 << 24, compress="gzip") as w:
+        w.write(txt="TimeStamp: ...\\n")
+
+---
+
+KazutoMakino
+
+"""
+
+import gzip
+import os
+import shutil
+import threading
+import time
+import typing
+from datetime import datetime
+from pathlib import Path
+
+######################################################################
+# class
+######################################################################
+
+
+class LogWriter:
+    """Buffered and rotating log writer class."""
+
+    FSYNC_POLICIES = ("never", "flush", "rotate")
+    COMPRESSIONS = (None, "gzip", "zstd")
+
+    def __init__(
+        self,
+        path: typing.Union[Path, str],
+        flush_lines: int = 100,
+        flush_interval: float = 1.0,
+        fsync: str = "rotate",
+        max_bytes: int = 0,
+        period: float = 0,
+        compress: typing.Optional[str] = None,
+    ) -> None:
+        """Set the log file and the flush / rotation policy.
+
+        Args:
+            path (Union[Path, str]): A log file path.
+            flush_lines (int, optional): Flush every this number of lines.
+                Defaults to 100.
+            flush_interval (float, optional): Flush if this time [s] has passed
+                since the last flush. Defaults to 1.0.
+            fsync (str, optional): When os.fsync is called
+                ("never", "flush": every flush, "rotate": every rotation).
+                Defaults to "rotate".
+            max_bytes (int, optional): Rotate if the file exceeds this size
+                (0: disabled). Defaults to 0.
+            period (float, optional): Rotate every this time [s] from
+                the local midnight, e.g. 3600: hourly, 86400: daily
+                (0: disabled). Defaults to 0.
+            compress (str, optional): A compression of rotated segments
+                (None, "gzip" or "zstd"). Defaults to None.
+        """
+        if fsync not in self.FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {self.FSYNC_POLICIES}: {fsync}")
+        if compress not in self.COMPRESSIONS:
+            raise ValueError(f"compress must be one of {self.COMPRESSIONS}: {compress}")
+        if compress == "zstd":
+            # check the optional dependency at first
+            import zstandard  # noqa: F401
+
+        # set parameters
+        self.path = Path(path)
+        self.flush_lines = int(flush_lines)
+        self.flush_interval = float(flush_interval)
+        self.fsync = fsync
+        self.max_bytes = int(max_bytes)
+        self.period = float(period)
+        self.compress = compress
+
+        # init (the file is opened at the first writing)
+        self._f = None
+        self._size = 0
+        self._n_pending = 0
+        self._is_pending = False
+        self._tflush = time.monotonic()
+        self._trotate = None
+        self._threads = []
+        self.segments = []
+
+    def __enter__(self) -> "LogWriter":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def write(
+        self, txt: typing.Union[str, bytes], n_lines: typing.Optional[int] = None
+    ) -> None:
+        """Write a line (or lines).
+
+        Descriptions:
+            txt is not split, so write complete lines (records) to keep them
+            in a file when rotated.
+
+        Args:
+            txt (Union[str, bytes]): A text with line endings.
+            n_lines (int, optional): A number of lines (records) in txt
+                (e.g. binary frames). Defaults to None (line endings).
+        """
+        data = txt.encode(encoding="utf-8") if isinstance(txt, str) else txt
+        if n_lines is None:
+            n_lines = data.count(b"\n")
+
+        # rotate
+        if self._f is not None:
+            if self.max_bytes and (self._size + len(data) > self.max_bytes):
+                self.rotate()
+            elif self.period and (time.time() >= self._trotate):
+                self.rotate()
+
+        # open
+        if self._f is None:
+            self._open()
+
+        # write into the buffer
+        self._f.write(data)
+        self._size += len(data)
+        self._n_pending += n_lines
+        self._is_pending = True
+
+        # flush by the number of lines or the time
+        self.poll()
+
+    def poll(self) -> None:
+        """Flush if the number of pending lines or the time is over.
+        (Call this periodically even if there is no line to write.)"""
+        if not self._is_pending:
+            return
+        if (self._n_pending >= self.flush_lines) or (
+            time.monotonic() - self._tflush >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        """Flush the buffer to the OS (and the disk if fsync == "flush")."""
+        if self._f is None:
+            return
+        self._f.flush()
+        if self.fsync == "flush":
+            self._fsync()
+        self._n_pending = 0
+        self._is_pending = False
+        self._tflush = time.monotonic()
+
+    def rotate(self) -> typing.Optional[Path]:
+        """Close the current file, rename it to a segment and compress it.
+
+        Returns:
+            Optional[Path]: The segment path (None if nothing is written).
+        """
+        if self._f is None:
+            return None
+
+        # close
+        self.flush()
+        if self.fsync != "never":
+            self._fsync()
+        self._f.close()
+        self._f = None
+
+        # rename to {stem}.{%Y%m%d%H%M%S}{suffix}
+        stamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        segment = self.path.with_name(f"{self.path.stem}.{stamp}{self.path.suffix}")
+        n = 1
+        while any(Path(f"{segment}{v}").exists() for v in ["", ".gz", ".zst"]):
+            segment = self.path.with_name(
+                f"{self.path.stem}.{stamp}_{n}{self.path.suffix}"
+            )
+            n += 1
+        self.path.rename(segment)
+
+        # compress in background
+        if self.compress is not None:
+            th = threading.Thread(
+                target=self._compress, args=(segment, self.compress), daemon=True
+            )
+            th.start()
+            self._threads.append(th)
+            segment = Path(f"{segment}.{'gz' if self.compress == 'gzip' else 'zst'}")
+        self.segments.append(segment)
+
+        return segment
+
+    def close(self) -> None:
+        """Flush and close the file, and wait for compressions."""
+        if self._f is not None:
+            self.flush()
+            if self.fsync != "never":
+                self._fsync()
+            self._f.close()
+            self._f = None
+        for th in self._threads:
+            th.join()
+        self._threads = []
+
+    def _fsync(self) -> None:
+        """os.fsync (ignored if the file does not support, e.g. /dev/null)."""
+        try:
+            os.fsync(self._f.fileno())
+        except OSError:
+            pass
+
+    def _open(self) -> None:
+        """Open the file in the append mode and set the next rotation time."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._f = self.path.open(mode="ab", buffering=1 << 16)
+        self._size = self._f.tell()
+        self._n_pending = 0
+        self._is_pending = False
+        self._tflush = time.monotonic()
+
+        # next rotation time (aligned to the local midnight)
+        if self.period:
+            now = datetime.now()
+            midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+            elapsed = (now - midnight).total_seconds()
+            self._trotate = midnight.timestamp() + self.period * (
+                elapsed // self.period + 1
+            )
+
+    @staticmethod
+    def _compress(src: Path, method: str) -> None:
+        """Compress the segment and remove the source."""
+        if method == "gzip":
+            dst = Path(f"{src}.gz")
+            with src.open(mode="rb") as fi, gzip.open(dst, mode="wb") as fo:
+                shutil.copyfileobj(fi, fo, length=1 << 20)
+        else:
+            import zstandard
+
+            dst = Path(f"{src}.zst")
+            with src.open(mode="rb") as fi, dst.open(mode="wb") as fo:
+                zstandard.ZstdCompressor().copy_stream(fi, fo)
+        src.unlink()
@@ -0,0 +1,283 @@
+"""Lightweight metrics of the monitoring loop.
+
+Descriptions:
+    Elapsed times of stages (serial read, parse, window update, plot, ...)
+    are observed into fixed-bucket histograms, and events (samples,
+    resyncs, parse failures, anomalies) are counted.
+    Observing is a bisect and 3 additions under a lock (~1 [us]),
+    and values are exported only when scraped:
+    - Prometheus: a custom collector on an HTTP endpoint (/metrics)
+    - Streamlit: a summary table (get_stats)
+
+Usage:
+- from metrics import Metrics
+    metrics = Metrics()
+    t0 = time.perf_counter()
+    ...
+    metrics.observe(stage="parse", seconds=time.perf_counter() - t0)
+    metrics.inc(name="samples", value=10)
+    metrics.start_server(port=8000)  # http://localhost:8000/metrics
+
+---
+
+KazutoMakino
+
+"""
+
+import bisect
+import contextlib
+import threading
+import time
+import typing
+
+######################################################################
+# settings
+######################################################################
+
+# upper bounds [s] of buckets (1 [us] ~ 10 [s]), +Inf is added
+DEFAULT_BUCKETS = (
+    1e-6,
+    2.5e-6,
+    5e-6,
+    1e-5,
+    2.5e-5,
+    5e-5,
+    1e-4,
+    2.5e-4,
+    5e-4,
+    1e-3,
+    2.5e-3,
+    5e-3,
+    1e-2,
+    2.5e-2,
+    5e-2,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+######################################################################
+# class
+######################################################################
+
+
+class Histogram:
+    """Fixed-bucket histogram class (the same buckets as Prometheus)."""
+
+    def __init__(self, buckets: typing.Sequence[float] = DEFAULT_BUCKETS) -> None:
+        """Init counts of buckets.
+
+        Args:
+            buckets (Sequence[float], optional): Upper bounds of buckets
+                (+Inf is added). Defaults to DEFAULT_BUCKETS.
+        """
+        self.buckets = tuple(sorted(float(v) for v in buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        """Add a value.
+
+        Args:
+            value (float): A value (e.g. an elapsed time [s]).
+        """
+        # the first bucket whose upper bound >= value
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by the linear interpolation in the bucket
+        (the same as histogram_quantile of Prometheus).
+
+        Args:
+            q (float): A quantile [0, 1].
+
+        Returns:
+            float: The estimated value (nan if no values).
+        """
+        if self.count == 0:
+            return float("nan")
+
+        # find the bucket
+        rank = q * self.count
+        cum = 0
+        for i, n in enumerate(self.counts):
+            if cum + n >= rank and n:
+                break
+            cum += n
+
+        # the last bucket (+Inf): the maximum
+        if i == len(self.buckets):
+            return self.max
+        lower = self.buckets[i - 1] if i else 0.0
+        upper = min(self.buckets[i], self.max)
+        return lower + (upper - lower) * (rank - cum) / n
+
+    def get_cumulative(self) -> typing.List[typing.Tuple[str, int]]:
+        """Get cumulative counts of buckets.
+
+        Returns:
+            List[Tuple[str, int]]: (upper bound, count of values <= it),
+                the last is ("+Inf", count).
+        """
+        ret = []
+        cum = 0
+        for upper, n in zip(self.buckets, self.counts):
+            cum += n
+            ret.append((repr(upper), cum))
+        ret.append(("+Inf", self.count))
+        return ret
+
+
+class Metrics:
+    """Registry class of stage histograms and event counters."""
+
+    def __init__(
+        self,
+        prefix: str = "monitoring",
+        buckets: typing.Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        """Init histograms and counters.
+
+        Args:
+            prefix (str, optional): A prefix of Prometheus metric names.
+                Defaults to "monitoring".
+            buckets (Sequence[float], optional): Upper bounds [s] of buckets.
+                Defaults to DEFAULT_BUCKETS.
+        """
+        # set parameters
+        self.prefix = prefix
+        self.buckets = tuple(buckets)
+
+        # init (observed by reader threads and the monitoring loop)
+        self.histograms = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float) -> None:
+        """Add an elapsed time of a stage.
+
+        Args:
+            stage (str): A stage name (e.g. "parse").
+            seconds (float): An elapsed time [s].
+        """
+        with self._lock:
+            hist = self.histograms.get(stage)
+            if hist is None:
+                hist = self.histograms[stage] = Histogram(buckets=self.buckets)
+            hist.observe(value=seconds)
+
+    def inc(self, name: str, value: int = 1) -> None:
+        """Increment a counter.
+
+        Args:
+            name (str): A counter name (e.g. "samples").
+            value (int, optional): An increment. Defaults to 1.
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextlib.contextmanager
+    def time(self, stage: str) -> typing.Iterator[None]:
+        """Observe the elapsed time of the with block.
+
+        Args:
+            stage (str): A stage name.
+        """
+        tstart = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage=stage, seconds=time.perf_counter() - tstart)
+
+    def get_stats(self) -> dict:
+        """Get a summary.
+
+        Returns:
+            dict: {"counters": {name: value},
+                "stages": {stage: {count, mean, p50, p99, max [ms]}}}
+        """
+        with self._lock:
+            stages = {
+                stage: {
+                    "count": hist.count,
+                    "mean[ms]": hist.sum / hist.count * 1e3,
+                    "p50[ms]": hist.quantile(q=0.5) * 1e3,
+                    "p99[ms]": hist.quantile(q=0.99) * 1e3,
+                    "max[ms]": hist.max * 1e3,
+                }
+                for stage, hist in self.histograms.items()
+                if hist.count
+            }
+            return {"counters": dict(self.counters), "stages": stages}
+
+    def collect(self) -> typing.Iterator[typing.Any]:
+        """Get Prometheus metrics (called when scraped).
+
+        Yields:
+            HistogramMetricFamily: "{prefix}_stage_seconds" (label: stage).
+            CounterMetricFamily: "{prefix}_{counter}_total".
+        """
+        from prometheus_client.core import CounterMetricFamily, HistogramMetricFamily
+
+        with self._lock:
+            hist_family = HistogramMetricFamily(
+                f"{self.prefix}_stage_seconds",
+                "Elapsed time of the stage",
+                labels=["stage"],
+            )
+            for stage, hist in self.histograms.items():
+                hist_family.add_metric(
+                    [stage], buckets=hist.get_cumulative(), sum_value=hist.sum
+                )
+            counter_families = [
+                CounterMetricFamily(
+                    f"{self.prefix}_{name}", f"The number of {name}", value=value
+                )
+                for name, value in self.counters.items()
+            ]
+
+        yield hist_family
+        yield from counter_families
+
+    def start_server(self, port: int = 8000, addr: str = "0.0.0.0") -> typing.Any:
+        """Serve metrics on http://{addr}:{port}/metrics in a daemon thread.
+
+        Args:
+            port (int, optional): A port. Defaults to 8000.
+            addr (str, optional): An address. Defaults to "0.0.0.0".
+
+        Returns:
+            CollectorRegistry: The registry which has only this collector.
+        """
+        from prometheus_client import CollectorRegistry, start_http_server
+
+        registry = CollectorRegistry(auto_describe=False)
+        registry.register(self)
+        start_http_server(port=port, addr=addr, registry=registry)
+        return registry
+
+
+######################################################################
+# for checking
+######################################################################
+
+if __name__ == "__main__":
+    # overhead of observing
+    metrics = Metrics()
+    n = 100000
+    tstart = time.perf_counter()
+    for _ in range(n):
+        t0 = time.perf_counter()
+        metrics.observe(stage="loop", seconds=time.perf_counter() - t0)
+    print(f"observe: {(time.perf_counter() - tstart) / n * 1e6:.3f} [us]")
+    print(metrics.get_stats())
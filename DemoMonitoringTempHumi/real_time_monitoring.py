@@ -1,5 +1,12 @@
 """The sample code of the real time monitoring system using by streamlit.
 
+Descriptions:
+    Streamlit reruns this script at every interaction, so the startup is
+    kept light: pandas, matplotlib / seaborn and scipy are imported only
+    when they are used (the chart, the matplotlib renderer or fitting of
+    the model), and settings.yml is parsed once and cached across reruns
+    and sessions (parsed again if the file is updated).
+
 Usage:
 - streamlit run real_time_monitoring.py
 
@@ -13,26 +20,34 @@ KazutoMakino
 # import
 ######################################################################
 
-import gc
 import sys
 import time
+import typing
 from datetime import datetime
 from logging import info
 from pathlib import Path
 
-import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
-import seaborn as sns
 import streamlit as st
 import yaml
 
-sns.set()
+if typing.TYPE_CHECKING:
+    import pandas as pd
 
 # import my pkgs
 if True:
     from anomaly_detection import HotellingTSquare
+    from detectors import DETECTORS, StreamingDetector
+    from downsample import downsample
+    from frame_protocol import FrameDecoder
+    from ingest import BoundedQueue, IngestWorker
+    from line_parser import TIME_KEY, LineParser
+    from metrics import Metrics
+    from render import MatplotlibRenderer, RenderScheduler, StreamlitChart
+    from ring_buffer import RingBuffer
+    from rollup import RollupStore
     from serial_monitor import SerialMonitor
+    from sqlite_sink import SQLiteSink
 
 ######################################################################
 # global settings
@@ -65,6 +80,51 @@ SETS_PATH = Path(__file__).resolve().parent / "settings.yml"
 if not SETS_PATH.exists():
     raise FileNotFoundError(f"not exists: {SETS_PATH}")
 
+######################################################################
+# cached resources
+######################################################################
+
+# cache decorators (experimental_memo / experimental_singleton before 1.18)
+cache_data = getattr(st, "cache_data", None) or st.experimental_memo
+cache_resource = getattr(st, "cache_resource", None) or st.experimental_singleton
+
+
+@cache_data(show_spinner=False)
+def _load_settings(path: Path, mtime_ns: int) -> dict:
+    """Parse settings (cached per the modified time of the file)."""
+    with path.open(mode="r", encoding="utf-8") as f:
+        return yaml.safe_load(stream=f)
+
+
+def load_settings() -> dict:
+    """Get settings from ./settings.yml (parsed once per update of the file).
+
+    Returns:
+        dict: Settings (a copy per call).
+    """
+    return _load_settings(path=SETS_PATH, mtime_ns=SETS_PATH.stat().st_mtime_ns)
+
+
+@cache_resource(show_spinner=False)
+def load_metrics(port: typing.Optional[int] = None) -> Metrics:
+    """Get metrics shared by reruns and sessions (served once per port).
+
+    Args:
+        port (int, optional): A port of the Prometheus endpoint.
+            Defaults to None (not served).
+
+    Returns:
+        Metrics: Stage timers and event counters.
+    """
+    metrics = Metrics()
+    if port:
+        try:
+            metrics.start_server(port=port)
+        except OSError as err:
+            print(f"metrics endpoint is not started: {err}")
+    return metrics
+
+
 ######################################################################
 # main
 ######################################################################
@@ -84,14 +144,54 @@ class MonitoringApp:
     """The real time monitoring system."""
 
     def __init__(self) -> None:
-        # get instance of DataStream
-        self.ds = DataStream()
-
         # get settings from ./settings.yml
-        with SETS_PATH.open(mode="r", encoding="utf-8") as f:
-            self.sets = yaml.safe_load(stream=f)
+        self.sets = load_settings()
         self.param_monitor = self.sets["Monitoring"]
 
+        # stage timers and event counters (shared with reader threads)
+        # (kept through reruns of streamlit, the endpoint serves this one)
+        self.metrics = load_metrics(
+            port=self.sets.get("Metrics", {}).get("PrometheusPort")
+        )
+
+        # sqlite sink of samples (a writer thread shared by devices)
+        param_sqlite = self.sets.get("SQLite", {"enable": False})
+        self.sink = None
+        if param_sqlite["enable"]:
+            self.sink = SQLiteSink(
+                path=(
+                    SQLiteSink.DEFAULT_PATH
+                    if param_sqlite.get("path", "auto") == "auto"
+                    else param_sqlite["path"]
+                ),
+                batch_size=param_sqlite.get("batch_size", 1000),
+                flush_interval=param_sqlite.get("flush_interval", 1.0),
+                queue_size=param_sqlite.get("queue_size", 1024),
+                metrics=self.metrics,
+            )
+
+        # instances of DataStream (ports are opened by run, see open_streams)
+        self.streams = []
+
+    def open_streams(self) -> typing.List["DataStream"]:
+        """Get instances of DataStream (one per device, ports are opened).
+
+        Returns:
+            List[DataStream]: Instances of DataStream.
+        """
+        streams = []
+        try:
+            for v in DataStream.get_serial_params(sets=self.sets):
+                streams.append(
+                    DataStream(param_serial=v, metrics=self.metrics, sink=self.sink)
+                )
+        except BaseException:
+            # close ports which are already opened
+            for ds in streams:
+                ds.close()
+            raise
+        return streams
+
     def run(self) -> None:
         """Run the simple real time monitoring system."""
 
@@ -121,6 +221,23 @@ class MonitoringApp:
         # plot area
         ph_plot = st.empty()
 
+        # ingestion counters
+        ph_ingest = st.empty()
+
+        # errors of the database writer
+        ph_sink = st.empty()
+
+        # long-horizon views of rollups (the view is selected by the user)
+        param_rollup = self.param_monitor.get("Rollup", {"enable": False})
+        if param_rollup["enable"]:
+            views = param_rollup.get("Views", {})
+            view = st.selectbox(label="history", options=["none"] + list(views))
+            ph_history = st.empty()
+
+        # metrics panel
+        param_metrics = self.sets.get("Metrics", {})
+        ph_metrics = st.empty()
+
         # json style parameters
         st.markdown(
             """
@@ -138,160 +255,586 @@ class MonitoringApp:
         else:
             data_length = self.param_monitor["DataLength"]
 
-        # set void
-        data = {}
+        # rendering settings: the frame rate cap and the downsampling of windows
+        param_render = self.param_monitor.get("Render", {})
+        scheduler = RenderScheduler(max_fps=param_render.get("MaxFPS", 0))
+        max_points = param_render.get("MaxPoints", 0)
+        method = param_render.get("Downsample", None)
+
+        # set void (ring buffers are made after getting the first data per device)
+        windows = {}
+        results = {}
+        xcol = TIME_KEY
+
+        # renderer of matplotlib / chart of streamlit (made at the first frame)
+        renderer = None
+        chart = None
+
+        # rollups of devices (made after getting the first data)
+        rollup = None
+        t_history = -np.inf
 
-        # init index
-        i = 0
+        # online fitting settings
+        param_online = self.param_monitor.get("OnlineFitting", {"enable": False})
 
         # set anomaly detection method
+        # (one per run: reloaded, and scored with its columns, by this session)
         hts = HotellingTSquare()
 
-        # running until getting KeyboardInterrupt
-        # (Which does code catch the KeyboardInterrupt ?)
-        while True:
-            # load data
-            data_dict = self.ds.run()
+        # columns used by the model (humidity only if not specified)
+        anomaly_cols = hts.params.get("columns", ["Humidity[%]"])
+
+        # reload the model when the parameter file is updated (e.g. by train.py)
+        param_monitor_reload = self.param_monitor.get("HotReload", True)
+
+        # used detectors (HotellingTSquare and / or streaming detectors)
+        param_detectors = self.param_monitor.get("Detectors", {})
+        detector_names = param_detectors.get("use", ["HotellingTSquare"])
+        unknown = set(detector_names) - {"HotellingTSquare", *DETECTORS}
+        if (not detector_names) or unknown:
+            raise AttributeError(f"detectors are invalid: {detector_names}")
+        use_hts = "HotellingTSquare" in detector_names
+        stream_names = [v for v in detector_names if v != "HotellingTSquare"]
+
+        # streaming detectors of devices (made after getting the first data)
+        detectors = {}
+
+        # metrics served for Prometheus (see load_metrics)
+        metrics = self.metrics
+
+        # start the background ingestion (serial reading is not blocked by plotting)
+        # (a reader thread per device, samples are tagged by the device id,
+        # and only samples of the same device are coalesced)
+        param_ingest = self.sets.get("Ingest", {})
+        queue = BoundedQueue(
+            maxsize=param_ingest.get("QueueSize", 1024),
+            policy=param_ingest.get("Overflow", "drop-oldest"),
+            key=lambda item: item[0],
+        )
+        workers = []
+        try:
+            # open ports (closed by the finally clause also if interrupted)
+            self.streams = self.open_streams()
+            workers = [
+                IngestWorker(
+                    source=ds.run, queue=queue, tag=ds.device_id, close_queue=False
+                )
+                for ds in self.streams
+            ]
+            for w in workers:
+                w.start()
+            if self.sink is not None:
+                self.sink.start()
+            is_multi = len(workers) > 1
+            sink_error = None
+
+            # running until getting KeyboardInterrupt or the end of the streams
+            # (Which does code catch the KeyboardInterrupt ?)
+            while True:
+                # wait for the next frame, and get all samples arrived since the last
+                scheduler.wait()
+                items = queue.drain(timeout=1.0)
+
+                # the database writer is stopped by an error
+                # (samples are not inserted after it, shown once)
+                if (self.sink is not None) and (self.sink.error is not sink_error):
+                    sink_error = self.sink.error
+                    metrics.inc(name="sink_errors")
+                    ph_sink.error(f"SQLite sink is stopped: {sink_error!r}")
+
+                # no data -> wait, or finish if all streams are closed
+                if not items:
+                    if any(w.is_alive() for w in workers):
+                        continue
+                    for w in workers:
+                        if w.error is not None:
+                            raise w.error
+                    break
+
+                # show @ debug
+                if DBG:
+                    for item in items:
+                        print(item)
+                tstart = time.perf_counter()
+
+                # group by devices: samples (or arrays of samples) -> columns of chunks
+                grouped = {}
+                for device_id, data_dict in items:
+                    grouped.setdefault(device_id, []).append(data_dict)
+                chunks = {
+                    device_id: {
+                        k: np.concatenate([np.atleast_1d(v[k]) for v in data_dicts])
+                        for k in data_dicts[0].keys()
+                    }
+                    for device_id, data_dicts in grouped.items()
+                }
 
-            # count continue flag -> continue
-            if data_dict == "continue":
-                continue
+                for device_id, chunk in chunks.items():
+                    # make the fixed-capacity window: 1st key is the time stamp
+                    if device_id not in windows:
+                        xcol = list(chunk.keys())[0]
+                        windows[device_id] = RingBuffer(
+                            columns=[k for k in chunk.keys() if k != xcol],
+                            capacity=data_length,
+                            time_column=xcol,
+                        )
+
+                    # updating data at once (the oldest ones are evicted)
+                    windows[device_id].extend(tstamps=chunk[xcol], values=chunk)
+                    metrics.inc(name="samples", value=len(chunk[xcol]))
+                t0 = time.perf_counter()
+                metrics.observe(stage="window", seconds=t0 - tstart)
+
+                # aggregate new samples into buckets of 1 min / 1 h / 1 day
+                if param_rollup["enable"]:
+                    if rollup is None:
+                        rollup = RollupStore(
+                            columns=[
+                                k for k in next(iter(chunks.values())) if k != xcol
+                            ]
+                        )
+                    n_dropped = rollup.n_dropped
+                    for device_id, chunk in chunks.items():
+                        rollup.update(device_id=device_id, data=chunk)
+                    if rollup.n_dropped > n_dropped:
+                        metrics.inc(
+                            name="rollup_dropped", value=rollup.n_dropped - n_dropped
+                        )
+                    t1 = time.perf_counter()
+                    metrics.observe(stage="rollup", seconds=t1 - t0)
+                    t0 = t1
+
+                # make line plot once per frame
+                # (Which is faster streamlit.line_chart or matplotlib ?)
+                if self.param_monitor["PlotType"] == "streamlit":
+                    # set dataframe whose index is "timestamp" for
+                    # using streamlit.line_chart x-label.
+                    # (append: only new rows are sent, the window is sent if trimmed)
+                    if chart is None:
+                        chart = StreamlitChart(
+                            placeholder=ph_plot,
+                            capacity=min(data_length, max_points or data_length),
+                            mode=param_render.get("StreamlitMode", "append"),
+                            trim_factor=param_render.get("TrimFactor", 2.0),
+                            chart_kwargs={
+                                "width": 0,
+                                "height": 0,
+                                "use_container_width": True,
+                            },
+                        )
+                    n_rows = chart.update(
+                        new_rows=lambda: self.to_dataframe(
+                            windows=chunks, xcol=xcol, is_multi=len(windows) > 1
+                        ),
+                        get_window=lambda: self.to_dataframe(
+                            windows=windows,
+                            xcol=xcol,
+                            max_points=max_points,
+                            method=method,
+                        ),
+                    )
+                    metrics.inc(name="chart_rows", value=n_rows)
+
+                    # streamlit.line_chart()'s data: pandas.DataFrame, xaxis<-index
+                    # see:
+                    #   https://docs.streamlit.io/library/api-reference/charts/st.line_chart
+                    #   https://docs.streamlit.io/library/api-reference/charts/st.line_chart#elementadd_rows
+
+                elif self.param_monitor["PlotType"] == "matplotlib":
+                    # update artists made at the first frame and render
+                    # (only lines are redrawn while limits are kept)
+                    if renderer is None:
+                        import seaborn as sns
+
+                        sns.set()
+                        renderer = MatplotlibRenderer(
+                            xlabel=xcol, headroom=param_render.get("Headroom", 0.1)
+                        )
+                    image = renderer.update(
+                        windows=windows, max_points=max_points, method=method
+                    )
+
+                    # set to place holder
+                    ph_plot.image(image, output_format="PNG")
 
-            # show @ debug
-            if DBG:
-                if not data_dict:
-                    break
                 else:
-                    print(data_dict)
+                    raise AttributeError(
+                        f"monitoring plot type is invalid: {self.param_monitor}"
+                    )
+                t1 = time.perf_counter()
+                metrics.observe(stage="plot", seconds=t1 - t0)
+                t0 = t1
+
+                # preprocessings for prediction
+                pass
+
+                # use the retrained model if the parameter file is updated
+                # (streaming detectors are remade by the new baseline)
+                if param_monitor_reload and hts.reload():
+                    anomaly_cols = hts.params.get("columns", ["Humidity[%]"])
+                    detectors.clear()
+                    metrics.inc(name="model_reloads")
+
+                # predict scores of all samples of all devices at once
+                # (a sample is an anomaly if any of detectors says so)
+                anomaly_inputs = np.concatenate(
+                    [
+                        np.column_stack([chunk[k] for k in anomaly_cols])
+                        for chunk in chunks.values()
+                    ]
+                )
+                if not hts.is_multivariate:
+                    anomaly_inputs = anomaly_inputs[:, 0]
+                anomaly_scores = {}
+                norm_anoms = np.ones(len(anomaly_inputs), dtype=bool)
+                if use_hts:
+                    anomaly_scores["HotellingTSquare"] = hts.score_batch(
+                        data=anomaly_inputs
+                    )
+                    norm_anoms &= hts.is_normal_batch(
+                        anomaly_scores=anomaly_scores["HotellingTSquare"]
+                    )
 
-            # cast values except "TimeStamp"
-            for k, v in data_dict.items():
-                if (k in ["tstamp", "TimeStamp"]) and (
-                    self.param_monitor["PlotType"] == "streamlit"
-                ):
-                    # except "TimeStamp" if "PlotType" == "streamlit"
-                    continue
+                # update streaming detectors of each device in time order
+                # (O(1) per sample, the state is kept per device)
+                detector_col = param_detectors.get("column") or anomaly_cols[0]
+                for device_id in chunks:
+                    if device_id not in detectors:
+                        detectors[device_id] = self.make_detectors(
+                            names=stream_names,
+                            param_detectors=param_detectors,
+                            hts=hts,
+                            column=detector_col,
+                        )
+                for name in stream_names:
+                    scores = [
+                        detectors[device_id][name].score_batch(data=chunk[detector_col])
+                        for device_id, chunk in chunks.items()
+                    ]
+                    anomaly_scores[name] = np.concatenate(scores)
+                    norm_anoms &= np.concatenate(
+                        [
+                            detectors[device_id][name].is_normal_batch(anomaly_scores=v)
+                            for device_id, v in zip(chunks.keys(), scores)
+                        ]
+                    )
+
+                # update the model by normal samples (the baseline follows drifts)
+                if param_online["enable"] and np.any(norm_anoms):
+                    hts.partial_fit(
+                        samples=anomaly_inputs[norm_anoms],
+                        forgetting_factor=param_online["forgetting_factor"],
+                        checkpoint_interval=param_online["checkpoint_interval"],
+                    )
+
+                metrics.inc(name="anomalies", value=int(np.count_nonzero(~norm_anoms)))
+                t1 = time.perf_counter()
+                metrics.observe(stage="score", seconds=t1 - t0)
+                t0 = t1
+
+                # the latest sample of each device: the last index of each chunk
+                lasts = np.cumsum([len(chunk[xcol]) for chunk in chunks.values()]) - 1
+                for device_id, j in zip(chunks.keys(), lasts.tolist()):
+                    results[device_id] = (
+                        {
+                            name: (
+                                float(scores[j]),
+                                hts.threshold
+                                if name == "HotellingTSquare"
+                                else detectors[device_id][name].threshold,
+                            )
+                            for name, scores in anomaly_scores.items()
+                        },
+                        bool(norm_anoms[j]),
+                    )
 
-                elif (k in ["tstamp", "TimeStamp"]) and (
-                    self.param_monitor["PlotType"] == "matplotlib"
+                # write results of the latest predictions
+                # (0 or 1, percentages, predicted lifetime, ...)
+                with ph_pred.container():
+                    for device_id, (scores, norm_anom) in results.items():
+                        prefix = f"{device_id}: " if is_multi else ""
+                        detail = " / ".join(
+                            (f"{name} " if len(scores) > 1 else "")
+                            + f"異常度: {score:.3f}, 閾値: {threshold:.3f}"
+                            for name, (score, threshold) in scores.items()
+                        )
+                        if norm_anom:
+                            st.success(f"{prefix}状態: 正常 ({detail})")
+                        else:
+                            st.error(f"{prefix}状態: 異常 ({detail})")
+
+                # write ingestion counters
+                ph_ingest.caption(
+                    "ingest: "
+                    + ", ".join(f"{k}={v}" for k, v in queue.get_stats().items())
+                    + f", skipped={sum(w.n_skipped for w in workers)}"
+                    + f", alive={sum(w.is_alive() for w in workers)}/{len(workers)}"
+                    + f", chunk={len(anomaly_inputs)}"
+                    + f", frames={scheduler.n_frames}"
+                    + (
+                        ""
+                        if self.sink is None
+                        else ", sink: "
+                        + ", ".join(
+                            f"{k}={v}" for k, v in self.sink.get_stats().items()
+                        )
+                    )
+                )
+
+                # write the metrics panel (stages [ms] and counters)
+                if param_metrics.get("ShowPanel", False):
+                    import pandas as pd
+
+                    stats = metrics.get_stats()
+                    with ph_metrics.container():
+                        st.caption(
+                            "metrics: "
+                            + ", ".join(
+                                f"{k}={v}" for k, v in stats["counters"].items()
+                            )
+                        )
+                        st.table(
+                            pd.DataFrame.from_dict(
+                                stats["stages"], orient="index"
+                            ).round(3)
+                        )
+
+                # write the history view (pre-aggregated buckets, refreshed slowly)
+                if (
+                    param_rollup["enable"]
+                    and (view in views)
+                    and (t0 - t_history >= param_rollup.get("RefreshInterval", 10))
                 ):
-                    # if "PlotType" == "matplotlib", cast to datetime obj
-                    data_dict[k] = datetime.strptime(
-                        data_dict[k], "%Y/%m/%d %H:%M:%S.%f"
+                    resolution, span = views[view]
+                    ph_history.line_chart(
+                        data=self.rollup_to_dataframe(
+                            rollup=rollup,
+                            device_ids=list(windows.keys()),
+                            resolution=resolution,
+                            span=span,
+                        )
                     )
+                    t_history = t0
+                t1 = time.perf_counter()
+                metrics.observe(stage="status", seconds=t1 - t0)
+
+                # the whole frame
+                metrics.observe(stage="frame", seconds=t1 - tstart)
+
+        finally:
+            # stop the background ingestion and close serial ports
+            # (also when streamlit stops the script at a rerun or the session end,
+            # so ports are not opened twice by the next run)
+            for w in workers:
+                w.stop()
+            queue.close()
+            for w in workers:
+                w.join(timeout=2.0)
+            for ds in self.streams:
+                ds.close()
+
+            # insert waiting samples into the database
+            if self.sink is not None:
+                self.sink.close(timeout=10.0)
+
+            # write the open buckets (reopened at the next start)
+            if rollup is not None:
+                rollup.close()
 
-                else:
-                    # cast values
-                    data_dict[k] = float(v)
+        # show
+        st.info("fin.")
 
-            print(data_dict)
+    @staticmethod
+    def make_detectors(
+        names: typing.List[str],
+        param_detectors: dict,
+        hts: HotellingTSquare,
+        column: str,
+    ) -> typing.Dict[str, StreamingDetector]:
+        """Make streaming detectors of a device.
+
+        Descriptions:
+            The in-control mean and standard deviation of EWMA / CUSUM are
+            of the univariate model of the same column if not specified
+            (estimated by the first samples if the model is not available).
 
-            # get formated data set (xmax,xmin, )
-            if i == 0:
-                # initial: value -> list
-                data = {k: [v] for k, v in data_dict.items()}
-            else:
-                # updating data
-                for k, v in data_dict.items():
-                    # remove oldest component
-                    # if list length is larger than setting length
-                    if len(data[k]) >= data_length:
-                        data[k].remove(data[k][0])
-
-                    # append
-                    data[k].append(v)
-
-            # set dataframe
-            df = pd.DataFrame(data=data)
-
-            # make line plot (Which is faster streamlit.line_chart or matplotlib ?)
-            if self.param_monitor["PlotType"] == "streamlit":
-                # set index to "timestamp" column for
-                # using streamlit.line_chart x-label.
-                df.set_index(keys=list(data.keys())[0], drop=True, inplace=True)
-
-                # streamlit.line_chart()'s data: pandas.DataFrame, xaxis<-index
-                # see:
-                #   https://docs.streamlit.io/library/api-reference/charts/st.line_chart
-                ph_plot.line_chart(data=df, width=0, height=0, use_container_width=True)
-
-            elif self.param_monitor["PlotType"] == "matplotlib":
-                # get x column name
-                xcol = list(df.columns)[0]
-                ycol1 = "Temperature[degC]"
-                ycol2 = "Humidity[%]"
-
-                # plot
-                if i == 0:
-                    fig = plt.figure(figsize=(12, 5))
-                    ax1 = fig.add_subplot()
-                    ax2 = ax1.twinx()
-                else:
-                    ax1.cla()
-                    ax2.cla()
-                ax1.set_xlabel(xcol)
-                ax2.set_xlabel(xcol)
-                ax1.set_ylabel(ycol1)
-                ax2.set_ylabel(ycol2)
-                ax1.plot(df[xcol], df[ycol1], marker="o", color="red", label=ycol1)
-                ax2.plot(df[xcol], df[ycol2], marker="o", color="blue", label=ycol2)
-                ax1.legend(loc="upper left")
-                ax2.legend(loc="upper right")
-                fig.tight_layout()
-
-                # set to place holder
-                ph_plot.pyplot(fig)
-
-                # plt.close
-                plt.close("all")
+        Args:
+            names (List[str]): Names of streaming detectors (keys of DETECTORS).
+            param_detectors (dict): "Monitoring: Detectors:" of ./settings.yml
+                ({name: keyword arguments}).
+            hts (HotellingTSquare): The anomaly detection model.
+            column (str): The column input to detectors.
 
-            else:
-                raise AttributeError(
-                    f"monitoring plot type is invalid: {self.param_monitor}"
-                )
+        Returns:
+            Dict[str, StreamingDetector]: {name: detector}.
+        """
+        detectors = {}
+        for name in names:
+            kwargs = dict(param_detectors.get(name) or {})
+            if (
+                DETECTORS[name].has_baseline
+                and (not hts.is_multivariate)
+                and (hts.params.get("columns", ["Humidity[%]"]) == [column])
+                and (hts.params.get("variance") or 0) > 0
+            ):
+                kwargs.setdefault("mean", hts.params["mean"])
+                kwargs.setdefault("std", float(np.sqrt(hts.params["variance"])))
+            detectors[name] = DETECTORS[name](**kwargs)
+        return detectors
 
-            # preprocessings for prediction
-            pass
+    @staticmethod
+    def to_dataframe(
+        windows: typing.Dict[str, typing.Union[RingBuffer, dict]],
+        xcol: str,
+        max_points: int = 0,
+        method: typing.Optional[str] = None,
+        is_multi: typing.Optional[bool] = None,
+    ) -> "pd.DataFrame":
+        """Make a dataframe of windows for streamlit.line_chart.
 
-            # predict score
-            anomaly_score = hts.get_anomaly_score(data=data_dict["Humidity[%]"])
-            norm_anom = hts.is_normal(anomaly_score=anomaly_score)
+        Args:
+            windows (Dict[str, Union[RingBuffer, dict]]): {device id: window},
+                or {device id: {column: 1d-array}} (e.g. chunks of new samples).
+            xcol (str): The time stamp column (the index of the dataframe).
+            max_points (int, optional): Windows longer than this are downsampled
+                (0: not downsampled). Defaults to 0.
+            method (str, optional): A method of downsampling
+                ("lttb", "minmax" or None). Defaults to None.
+            is_multi (bool, optional): Columns are suffixed by device ids or not.
+                Defaults to None (multiple windows or not).
 
-            # write result of prediction (0 or 1, percentages, predicted lifetime, ...)
-            if norm_anom:
-                ph_pred.success(
-                    f"状態: 正常 (異常度: {anomaly_score:.3f}, "
-                    + f"閾値: {hts.params['threshold']:.3f})"
+        Returns:
+            pd.DataFrame: The dataframe whose index is time stamps
+                (columns are "{column} @ {device id}" if multiple devices).
+        """
+        import pandas as pd
+
+        if is_multi is None:
+            is_multi = len(windows) > 1
+        dfs = []
+        for device_id, window in windows.items():
+            data = window.to_dict() if isinstance(window, RingBuffer) else window
+            if len(data[xcol]) > max_points > 0:
+                idx = downsample(
+                    x=data[xcol],
+                    ys=[v for k, v in data.items() if k != xcol],
+                    n_out=max_points,
+                    method=method,
                 )
-            else:
-                ph_pred.error(
-                    f"状態: 異常 (異常度: {anomaly_score:.3f}, "
-                    + f"閾値: {hts.params['threshold']:.3f})"
+                data = {k: v[idx] for k, v in data.items()}
+            dfs.append(
+                pd.DataFrame(
+                    data={
+                        (f"{k} @ {device_id}" if is_multi else k): v
+                        for k, v in data.items()
+                        if k != xcol
+                    },
+                    index=pd.DatetimeIndex(
+                        data[xcol].view("datetime64[ns]"), name=xcol
+                    ),
                 )
+            )
+        return pd.concat(dfs, axis=1) if len(dfs) > 1 else dfs[0]
 
-            # increment
-            i += 1
+    @staticmethod
+    def rollup_to_dataframe(
+        rollup: RollupStore,
+        device_ids: typing.List[str],
+        resolution: str,
+        span: float,
+        stats: typing.Sequence[str] = ("min", "mean", "max"),
+    ) -> "pd.DataFrame":
+        """Make a dataframe of the latest buckets for streamlit.line_chart.
 
-            # gc
-            gc.collect()
+        Args:
+            rollup (RollupStore): Rollups of devices.
+            device_ids (List[str]): Device ids.
+            resolution (str): A resolution name (e.g. "1min").
+            span (float): The time span [s] from the latest bucket.
+            stats (Sequence[str], optional): Aggregates to be plotted.
+                Defaults to ("min", "mean", "max").
 
-        # show
-        st.info("fin.")
+        Returns:
+            pd.DataFrame: The dataframe whose index is start times of buckets
+                (columns are "{column}/{stat}" (+ " @ {device id}")).
+        """
+        import pandas as pd
+
+        is_multi = len(device_ids) > 1
+        dfs = []
+        for device_id in device_ids:
+            tend = rollup.get_latest(device_id=device_id)
+            if tend is None:
+                continue
+            data = rollup.query(
+                device_id=device_id,
+                resolution=resolution,
+                tstart=tend - int(span * 1e9),
+            )
+            dfs.append(
+                pd.DataFrame(
+                    data={
+                        (f"{k}/{v} @ {device_id}" if is_multi else f"{k}/{v}"): data[
+                            f"{k}/{v}"
+                        ]
+                        for k in rollup.columns
+                        for v in stats
+                    },
+                    index=pd.DatetimeIndex(
+                        data[TIME_KEY].view("datetime64[ns]"), name=TIME_KEY
+                    ),
+                )
+            )
+        if not dfs:
+            return pd.DataFrame()
+        return pd.concat(dfs, axis=1) if len(dfs) > 1 else dfs[0]
 
 
 class DataStream:
     """Data stream class."""
 
-    def __init__(self) -> None:
-        """Get serial monitoring parameters and connect to the IoT device."""
+    def __init__(
+        self,
+        param_serial: typing.Optional[dict] = None,
+        metrics: typing.Optional[Metrics] = None,
+        sink: typing.Optional[SQLiteSink] = None,
+    ) -> None:
+        """Get serial monitoring parameters and connect to the IoT device.
+
+        Args:
+            param_serial (dict, optional): Serial parameters of a device
+                (an element of DataStream.get_serial_params()).
+                Defaults to None (the first device of ./settings.yml).
+            metrics (Metrics, optional): Metrics to observe the read / parse
+                stages and count resyncs / parse failures.
+                Defaults to None (own metrics).
+            sink (SQLiteSink, optional): A sink which received samples are put
+                into (not blocking). Defaults to None.
+        """
         # init
         self.tstamp = None
         self.tstart_ds = time.perf_counter()
+        self.metrics = Metrics() if metrics is None else metrics
+        self.sink = sink
 
         # get settings from ./settings.yml
-        with SETS_PATH.open(mode="r", encoding="utf-8") as f:
-            self.param_serial = yaml.safe_load(stream=f)
-        self.param_serial = self.param_serial["Serial"]
+        if param_serial is None:
+            param_serial = self.get_serial_params()[0]
+        self.param_serial = param_serial
+
+        # get device id (the port name if not specified)
+        self.device_id = str(
+            self.param_serial.get("device_id", self.param_serial["port"])
+        )
+
+        # get serial protocol ("text" or "binary")
+        self.protocol = self.param_serial.get("protocol", "text")
+        if self.protocol not in ["text", "binary"]:
+            raise ValueError(f"serial protocol is invalid: {self.protocol}")
+
+        # get instance of LineParser / FrameDecoder
+        self.lp = LineParser()
+        self.fd = FrameDecoder()
 
         # get instance of SerialMonitor
         if not DBG:
@@ -300,14 +843,58 @@ class DataStream:
                 baudrate=self.param_serial["baudrate"],
                 timeout=self.param_serial["timeout[s]"],
                 logpath=self.param_serial["logpath"],
+                log_options=self.param_serial.get("log"),
+                log_suffix=(
+                    (f"_{self.device_id}" if "device_id" in self.param_serial else "")
+                    + (".bin" if self.protocol == "binary" else ".log")
+                ),
+                binary=self.protocol == "binary",
             )
 
+    def close(self) -> None:
+        """Close the serial port (and flush the log)."""
+        if hasattr(self, "seri"):
+            self.seri.close()
+
+    @staticmethod
+    def get_serial_params(sets: typing.Optional[dict] = None) -> typing.List[dict]:
+        """Get serial parameters of devices from ./settings.yml.
+
+        Descriptions:
+            Each element of "Serial: devices:" overrides the common parameters
+            of "Serial:" (at least "device_id" and "port").
+            If "devices" is not set, the single device of "Serial:" is used.
+
+        Args:
+            sets (dict, optional): Settings. Defaults to None (load_settings()).
+
+        Returns:
+            List[dict]: Serial parameters of devices.
+        """
+        # get settings from ./settings.yml
+        if sets is None:
+            sets = load_settings()
+        param_serial = sets["Serial"]
+
+        # common parameters + parameters of each device
+        devices = param_serial.get("devices") or [{}]
+        common = {k: v for k, v in param_serial.items() if k != "devices"}
+        params = [{**common, **v} for v in devices]
+
+        # check device ids
+        device_ids = [str(v.get("device_id", v["port"])) for v in params]
+        if len(set(device_ids)) != len(device_ids):
+            raise ValueError(f"device ids are duplicated: {device_ids}")
+
+        return params
+
     def run(self) -> dict:
         """Run the data stream.
 
         Returns:
             dict: contains data type keys and values with time stamp.
                 (Return type is a json-like object as seen in cloud services.)
+                Values are 1d-arrays of received samples (lines or frames).
         """
 
         # init
@@ -321,29 +908,65 @@ class DataStream:
             # get dummy data
             if time.perf_counter() - self.tstart_ds < 30:
                 data_dict = {
-                    "tstamp": Timer.get_timestamp(fmt_date="datetime"),
+                    "tstamp": self.lp.to_epoch_ns(
+                        tstamp=Timer.get_timestamp(fmt_date="datetime")
+                    ),
                     "dummy_0[ ]": np.random.rand(),
                     "dummy_1[ ]": np.random.rand(),
                 }
             else:
                 data_dict = None
 
-        else:
-            # get data from serial port (other module)
-            data_txt = self.seri.run(is_return=True)
+        elif self.protocol == "binary":
+            # get bytes from serial port (including waiting for the timeout)
+            t0 = time.perf_counter()
+            data = self.seri.read_bytes()
+            t1 = time.perf_counter()
+            self.metrics.observe(stage="read", seconds=t1 - t0)
+
+            # decode frames (garbage is skipped)
+            n_rejected = self.fd.n_rejected
+            data_dict = self.fd.feed(data=data)
+            self.metrics.observe(stage="parse", seconds=time.perf_counter() - t1)
+            if self.fd.n_rejected > n_rejected:
+                self.metrics.inc(
+                    name="parse_failures", value=self.fd.n_rejected - n_rejected
+                )
 
-            # if text header is invalid, return "continue"
-            if not data_txt.startswith("TimeStamp"):
-                print("now restarting...")
+            # no complete frame, return "continue"
+            if len(data_dict[TIME_KEY]) == 0:
                 return "continue"
 
-            # txt to dict
-            data_txt = data_txt.replace("\r\n", "").split(", ")
-            data_dict = {k: v for k, v in [w.split(": ", maxsplit=1) for w in data_txt]}
+        else:
+            # get all available lines from serial port (a batch of samples)
+            t0 = time.perf_counter()
+            data = self.seri.read_bytes()
+            t1 = time.perf_counter()
+            self.metrics.observe(stage="read", seconds=t1 - t0)
+
+            # parse lines
+            n_skipped = self.lp.n_skipped
+            data_dict = self.lp.feed(data=data)
+            self.metrics.observe(stage="parse", seconds=time.perf_counter() - t1)
+
+            # if text is invalid (e.g. boot messages), return "continue"
+            if self.lp.n_skipped > n_skipped:
+                print("now restarting...")
+                self.metrics.inc(name="resyncs")
+                self.metrics.inc(
+                    name="parse_failures", value=self.lp.n_skipped - n_skipped
+                )
+            if (not data_dict) or (len(data_dict[TIME_KEY]) == 0):
+                return "continue"
 
             # show
             print(data_dict)
 
+        # put into the database (inserted in batches by the writer thread)
+        if (self.sink is not None) and data_dict:
+            if not self.sink.put(device_id=self.device_id, data=data_dict):
+                self.metrics.inc(name="sink_dropped")
+
         return data_dict
 
 
@@ -0,0 +1,380 @@
+"""Rendering helpers of the monitoring loop.
+
+Descriptions:
+    RenderScheduler caps the frame rate of the UI: the loop waits until
+    the next frame, and all samples arrived meanwhile are drained and
+    rendered at once, so the rendering cost does not grow with
+    the ingestion rate.
+    MatplotlibRenderer updates artists made once instead of rebuilding
+    the figure every frame, and redraws only lines while limits are kept.
+    StreamlitChart sends only new rows to the browser (add_rows) and
+    the whole window only when trimmed.
+
+Usage:
+- from render import RenderScheduler
+    scheduler = RenderScheduler(max_fps=5)
+    while True:
+        scheduler.wait()
+        items = queue.drain()
+        ...
+- from render import MatplotlibRenderer
+    renderer = MatplotlibRenderer()
+    image = renderer.update(windows=windows)  # RGBA array
+- from render import StreamlitChart
+    chart = StreamlitChart(placeholder=st.empty(), capacity=30)
+    chart.update(new_rows=lambda: df_new, get_window=lambda: df_window)
+
+---
+
+KazutoMakino
+
+"""
+
+import time
+import typing
+
+import numpy as np
+
+# import my pkgs
+if True:
+    from downsample import downsample
+
+######################################################################
+# class
+######################################################################
+
+
+class RenderScheduler:
+    """Frame rate limiter class."""
+
+    def __init__(self, max_fps: float = 5.0) -> None:
+        """Set the maximum frame rate.
+
+        Args:
+            max_fps (float, optional): The maximum number of frames per second
+                (0: not limited). Defaults to 5.0.
+        """
+        if max_fps < 0:
+            raise ValueError(f"max_fps must not be negative: {max_fps}")
+
+        # set parameters
+        self.max_fps = float(max_fps)
+        self.interval = 1 / self.max_fps if self.max_fps else 0.0
+
+        # init
+        self.t_next = 0.0
+        self.n_frames = 0
+        self.waited = 0.0
+
+    def wait(self) -> float:
+        """Wait until the next frame and start the frame.
+
+        Returns:
+            float: The waited time [s].
+        """
+        now = time.perf_counter()
+        wait = self.t_next - now
+        if wait > 0:
+            time.sleep(wait)
+            now = self.t_next
+        else:
+            wait = 0.0
+
+        # the next frame (not catching up after slow frames)
+        self.t_next = now + self.interval
+        self.n_frames += 1
+        self.waited += wait
+        return wait
+
+
+class MatplotlibRenderer:
+    """Incremental renderer class of windows by matplotlib (Agg).
+
+    Descriptions:
+        The figure, twin axes, lines and legends are made once and updated
+        by set_data. Static parts (axes, ticks, labels) are drawn and cached
+        only when the limits change, otherwise the cached background is
+        restored and only lines and legends are drawn on it (blitting).
+        Limits have headroom, so they are not changed by every sample.
+        The figure is not managed by pyplot, so it is never closed
+        and garbage is not made per frame.
+    """
+
+    def __init__(
+        self,
+        ycols: typing.Tuple[str, str] = ("Temperature[degC]", "Humidity[%]"),
+        xlabel: str = "TimeStamp",
+        figsize: typing.Tuple[float, float] = (12, 5),
+        headroom: float = 0.1,
+    ) -> None:
+        """Make the figure.
+
+        Args:
+            ycols (Tuple[str, str], optional): Columns of the left / right axes.
+                Defaults to ("Temperature[degC]", "Humidity[%]").
+            xlabel (str, optional): A label of the x axis.
+                Defaults to "TimeStamp".
+            figsize (Tuple[float, float], optional): A figure size [inch].
+                Defaults to (12, 5).
+            headroom (float, optional): A margin of limits per the data range.
+                Defaults to 0.1.
+        """
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        # set parameters
+        self.ycols = ycols
+        self.headroom = float(headroom)
+
+        # make the figure once
+        self.fig = Figure(figsize=figsize)
+        self.canvas = FigureCanvasAgg(self.fig)
+        ax1 = self.fig.add_subplot()
+        ax2 = ax1.twinx()
+        self.axes = (ax1, ax2)
+        for ax, ycol in zip(self.axes, self.ycols):
+            ax.set_xlabel(xlabel)
+            ax.set_ylabel(ycol)
+            ax.xaxis_date()
+
+        # init
+        self.lines = {}
+        self.legends = []
+        self._device_ids = None
+        self._background = None
+        self.n_full = 0
+        self.n_blit = 0
+
+    def _reset_lines(self, device_ids: typing.List[str]) -> None:
+        """Make lines and legends of devices."""
+        for line in self.lines.values():
+            line.remove()
+        for legend in self.legends:
+            legend.remove()
+        self.lines = {}
+
+        # the same styles as the previous plot
+        is_multi = len(device_ids) > 1
+        styles = [
+            {"marker": "o", "color": None if is_multi else "red"},
+            {"marker": "x" if is_multi else "o", "color": None if is_multi else "blue"},
+        ]
+        for device_id in device_ids:
+            suffix = f" @ {device_id}" if is_multi else ""
+            for ax, ycol, style in zip(self.axes, self.ycols, styles):
+                (line,) = ax.plot([], [], label=ycol + suffix, animated=True, **style)
+                self.lines[(device_id, ycol)] = line
+        self.legends = [
+            self.axes[0].legend(loc="upper left"),
+            self.axes[1].legend(loc="upper right"),
+        ]
+        for legend in self.legends:
+            legend.set_animated(True)
+        self._device_ids = device_ids
+        self._background = None
+
+    def _update_limits(
+        self, get_lim: typing.Callable, set_lim: typing.Callable, lo: float, hi: float
+    ) -> bool:
+        """Update limits if the data are out of them or too small in them.
+
+        Returns:
+            bool: Limits are changed or not.
+        """
+        if not (np.isfinite(lo) and np.isfinite(hi)):
+            return False
+        margin = self.headroom * ((hi - lo) or abs(hi) or 1.0)
+        cur_lo, cur_hi = get_lim()
+        if (lo < cur_lo) or (hi > cur_hi) or (cur_hi - cur_lo > 2 * (hi - lo + margin)):
+            set_lim(lo - margin, hi + margin)
+            return True
+        return False
+
+    def update(
+        self,
+        windows: typing.Dict[str, typing.Any],
+        max_points: int = 0,
+        method: typing.Optional[str] = None,
+    ) -> np.ndarray:
+        """Update lines by windows and render.
+
+        Args:
+            windows (Dict[str, RingBuffer]): {device id: window}.
+            max_points (int, optional): Windows longer than this are downsampled
+                (0: not downsampled). Defaults to 0.
+            method (str, optional): A method of downsampling
+                ("lttb", "minmax" or None). Defaults to None.
+
+        Returns:
+            np.ndarray: The rendered RGBA image (valid until the next update).
+        """
+        from matplotlib import dates as mdates
+
+        # lines of devices (made again only if devices are changed)
+        device_ids = list(windows.keys())
+        if device_ids != self._device_ids:
+            self._reset_lines(device_ids=device_ids)
+
+        # update data of lines
+        x_range = [np.inf, -np.inf]
+        y_ranges = [[np.inf, -np.inf], [np.inf, -np.inf]]
+        for device_id, window in windows.items():
+            x = window.get_timestamps()
+            ys = [window.get_column(v) for v in self.ycols]
+            if len(x) == 0:
+                continue
+            if len(x) > max_points > 0:
+                idx = downsample(x=x, ys=ys, n_out=max_points, method=method)
+                x, ys = x[idx], [v[idx] for v in ys]
+            x = mdates.date2num(x.view("datetime64[ns]"))
+            x_range = [min(x_range[0], x[0]), max(x_range[1], x[-1])]
+            for ycol, y, y_range in zip(self.ycols, ys, y_ranges):
+                self.lines[(device_id, ycol)].set_data(x, y)
+                if np.any(np.isfinite(y)):
+                    y_range[0] = min(y_range[0], np.nanmin(y))
+                    y_range[1] = max(y_range[1], np.nanmax(y))
+
+        # update limits (x: only the newest side has headroom)
+        ax1, ax2 = self.axes
+        is_changed = False
+        lo, hi = x_range
+        if np.isfinite(lo) and np.isfinite(hi):
+            margin = self.headroom * ((hi - lo) or 1 / 86400)
+            cur_lo, cur_hi = ax1.get_xlim()
+            if (lo < cur_lo) or (hi > cur_hi) or (lo - cur_lo > margin):
+                ax1.set_xlim(lo, hi + margin)
+                is_changed = True
+        for ax, (lo, hi) in zip(self.axes, y_ranges):
+            is_changed |= self._update_limits(
+                get_lim=ax.get_ylim, set_lim=ax.set_ylim, lo=lo, hi=hi
+            )
+
+        # draw static parts and cache them, or restore the cache
+        if is_changed or (self._background is None):
+            if self._background is None:
+                self.fig.tight_layout()
+            self.canvas.draw()
+            self._background = self.canvas.copy_from_bbox(self.fig.bbox)
+            self.n_full += 1
+        else:
+            self.canvas.restore_region(self._background)
+            self.n_blit += 1
+
+        # draw lines and legends on it
+        for line in self.lines.values():
+            line.axes.draw_artist(line)
+        for legend in self.legends:
+            legend.axes.draw_artist(legend)
+
+        return np.asarray(self.canvas.buffer_rgba())
+
+
+class StreamlitChart:
+    """Append-only line chart class of streamlit.
+
+    Descriptions:
+        In the "append" mode, the whole window is sent only at the first frame
+        and when trimmed, otherwise only new rows are sent by add_rows,
+        so the data sent per frame is O(new rows) instead of O(window).
+        Appended rows are kept by the browser, so the chart is trimmed
+        (the window is sent again) if rows exceed trim_factor * capacity.
+        In the "full" mode, the whole window is sent every frame
+        (also used if add_rows is not supported by the streamlit version).
+    """
+
+    MODES = ("append", "full")
+
+    def __init__(
+        self,
+        placeholder: typing.Any,
+        capacity: int,
+        mode: str = "append",
+        trim_factor: float = 2.0,
+        chart_kwargs: typing.Optional[dict] = None,
+    ) -> None:
+        """Set the chart parameters.
+
+        Args:
+            placeholder (DeltaGenerator): A place holder (streamlit.empty()).
+            capacity (int): The number of rows of the window.
+            mode (str, optional): "append" or "full". Defaults to "append".
+            trim_factor (float, optional): Trim if rows exceed this times
+                the capacity (> 1). Defaults to 2.0.
+            chart_kwargs (dict, optional): Keyword arguments of
+                line_chart (e.g. use_container_width). Defaults to None.
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"mode must be one of {self.MODES}: {mode}")
+        if trim_factor <= 1:
+            raise ValueError(f"trim_factor must be larger than 1: {trim_factor}")
+
+        # set parameters
+        self.placeholder = placeholder
+        self.capacity = int(capacity)
+        self.mode = mode
+        self.trim_factor = float(trim_factor)
+        self.chart_kwargs = chart_kwargs or {}
+
+        # init
+        self.chart = None
+        self.columns = None
+        self.n_rows = 0
+        self.n_full = 0
+        self.n_append = 0
+        self.n_rows_sent = 0
+
+    def update(self, new_rows: typing.Callable, get_window: typing.Callable) -> int:
+        """Send new rows, or the whole window.
+
+        Args:
+            new_rows (Callable): A function returning a dataframe of new rows.
+            get_window (Callable): A function returning a dataframe of
+                the window (called only if the window is sent).
+
+        Returns:
+            int: The number of sent rows.
+        """
+        # append new rows if columns are known and not to be trimmed
+        if (self.mode == "append") and (self.chart is not None):
+            df = new_rows()
+            if set(df.columns) <= set(self.columns) and (
+                self.n_rows + len(df) <= self.trim_factor * self.capacity
+            ):
+                # columns of devices without new samples are filled by nan
+                if list(df.columns) != self.columns:
+                    df = df.reindex(columns=self.columns)
+                self.chart.add_rows(df)
+                self.n_rows += len(df)
+                self.n_append += 1
+                self.n_rows_sent += len(df)
+                return len(df)
+
+        # send the whole window (the first frame, trimming or new devices)
+        df = get_window()
+        self.chart = self.placeholder.line_chart(data=df, **self.chart_kwargs)
+
+        # add_rows was removed from recent streamlit -> the full mode
+        if (self.mode == "append") and not callable(
+            getattr(type(self.chart), "add_rows", None)
+        ):
+            print("add_rows is not supported, the chart is sent every frame")
+            self.mode = "full"
+        self.columns = list(df.columns)
+        self.n_rows = len(df)
+        self.n_full += 1
+        self.n_rows_sent += len(df)
+        return len(df)
+
+    def get_stats(self) -> dict:
+        """Get counters.
+
+        Returns:
+            dict: full (windows sent), append (new rows sent), rows (in the chart)
+                and rows_sent.
+        """
+        return {
+            "full": self.n_full,
+            "append": self.n_append,
+            "rows": self.n_rows,
+            "rows_sent": self.n_rows_sent,
+        }
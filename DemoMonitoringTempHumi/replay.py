@@ -0,0 +1,395 @@
+"""Replay recorded logs through virtual serial ports (pty, Linux).
+
+Descriptions:
+    Lines of logs (e.g. data/*.txt) are written into pseudo terminals
+    at the recorded pace multiplied by the speed (0: as fast as possible),
+    optionally looping and fanning out to multiple ports (devices).
+    The ports can be set to "Serial: port" (or "Serial: devices") of
+    settings.yml, so the real SerialMonitor / DataStream path is exercised
+    without devices (writing blocks while ports are not read).
+    With --measure, the ports are also read by DataStream in background
+    threads, and the achieved lines/s and the end-to-end latency
+    (from writing into the pty to receiving by DataStream) are reported.
+    (pyserial's "loop://" is not used because SerialMonitor opens ports
+    by serial.Serial, which does not accept URLs.)
+
+Usage:
+- py replay.py data --speed 100 --loop --devices 2
+- py replay.py data --speed 0 --devices 4 --measure 10
+
+---
+
+KazutoMakino
+
+"""
+
+import argparse
+import contextlib
+import logging
+import os
+import sys
+import threading
+import time
+import typing
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+# import my pkgs
+if True:
+    from archive import SensorArchive
+    from line_parser import TIME_KEY, LineParser
+
+######################################################################
+# main
+######################################################################
+
+
+def main():
+    # get parser
+    parser = argparse.ArgumentParser(description="Replay logs through ptys.")
+    parser.add_argument(
+        "sources", type=str, nargs="+", help="log files or directories (*.txt, *.log)"
+    )
+    parser.add_argument(
+        "--speed",
+        "-s",
+        type=float,
+        default=1.0,
+        help="speed multiplier of the recorded pace (0: as fast as possible)",
+    )
+    parser.add_argument("--loop", "-l", action="store_true", help="loop the logs")
+    parser.add_argument(
+        "--devices", "-d", type=int, default=1, help="the number of ports (fan-out)"
+    )
+    parser.add_argument(
+        "--restamp",
+        "-r",
+        action="store_true",
+        help="replace time stamps by the sending time (set by --measure)",
+    )
+    parser.add_argument(
+        "--measure",
+        "-m",
+        type=float,
+        default=0,
+        help="read the ports by DataStream for this time [s] and report",
+    )
+    args = parser.parse_args()
+
+    # open ports
+    replayer = LogReplayer(
+        sources=args.sources,
+        speed=args.speed,
+        loop=args.loop,
+        n_devices=args.devices,
+        restamp=args.restamp or bool(args.measure),
+    )
+    ports = replayer.open()
+    for i, port in enumerate(ports):
+        print(f"device {i}: {port}")
+
+    try:
+        if args.measure:
+            # replay in background and receive by DataStream
+            stats = measure(replayer=replayer, ports=ports, duration=args.measure)
+            print(f"sent: {replayer.get_stats()}")
+            print(f"received: {stats}")
+        else:
+            # replay until the end (or KeyboardInterrupt if looping)
+            replayer.run()
+            print(f"sent: {replayer.get_stats()}")
+
+    except KeyboardInterrupt:
+        print(f"sent: {replayer.get_stats()}")
+
+    finally:
+        replayer.close()
+
+
+def measure(replayer: "LogReplayer", ports: typing.List[str], duration: float) -> dict:
+    """Replay in background, receive lines by DataStream and measure
+    the throughput and latency.
+
+    Args:
+        replayer (LogReplayer): A replayer whose ports are opened.
+        ports (List[str]): Port names.
+        duration (float): A time [s] to measure.
+
+    Returns:
+        dict: lines, lines/s and latency percentiles [ms].
+    """
+    # the real data path (imported here, streamlit is heavy)
+    from ingest import BoundedQueue, IngestWorker
+    from real_time_monitoring import DataStream
+
+    # a DataStream per port (logs are written into /dev/null)
+    streams = [
+        DataStream(
+            param_serial={
+                "device_id": f"replay{i}",
+                "port": port,
+                "baudrate": 115200,
+                "timeout[s]": 0.1,
+                "logpath": os.devnull,
+            }
+        )
+        for i, port in enumerate(ports)
+    ]
+    queue = BoundedQueue(maxsize=1 << 16, policy="block")
+    workers = [
+        IngestWorker(source=ds.run, queue=queue, tag=ds.device_id, close_queue=False)
+        for ds in streams
+    ]
+    for w in workers:
+        w.start()
+
+    # start replaying after opening ports
+    th = threading.Thread(target=replayer.run, daemon=True)
+    th.start()
+
+    # local time [ns] (naive, the same as time stamps of lines)
+    offset = datetime.now().astimezone().utcoffset().total_seconds()
+    offset_ns = int(offset * 1e9)
+
+    # receive (lines printed by DataStream are discarded)
+    latencies = []
+    n_lines = 0
+    tstart = time.perf_counter()
+    with open(os.devnull, mode="w") as f, contextlib.redirect_stdout(f):
+        while time.perf_counter() - tstart < duration:
+            for _, data_dict in queue.drain(timeout=0.1):
+                now = time.time_ns() + offset_ns
+                tstamps = np.atleast_1d(data_dict[TIME_KEY])
+                latencies.append((now - tstamps) * 1e-6)
+                n_lines += len(tstamps)
+    elapsed = time.perf_counter() - tstart
+
+    # stop
+    replayer.stop()
+    th.join(timeout=5)
+    for w in workers:
+        w.stop()
+    queue.close()
+    for w in workers:
+        w.join(timeout=1.0)
+    for ds in streams:
+        ds.seri.close()
+
+    # stats
+    latencies = np.concatenate(latencies) if latencies else np.zeros(0)
+    ret = {"lines": n_lines, "lines/s": round(n_lines / elapsed, 1)}
+    if len(latencies):
+        for q in [50, 95, 99]:
+            ret[f"latency_p{q}[ms]"] = round(float(np.percentile(latencies, q)), 3)
+        ret["latency_max[ms]"] = round(float(latencies.max()), 3)
+    return ret
+
+
+######################################################################
+# class
+######################################################################
+
+
+class LogReplayer:
+    """Replay class of logs through pseudo terminals."""
+
+    def __init__(
+        self,
+        sources: typing.List[typing.Union[Path, str]],
+        speed: float = 1.0,
+        loop: bool = False,
+        n_devices: int = 1,
+        restamp: bool = False,
+    ) -> None:
+        """Load logs.
+
+        Args:
+            sources (List[Union[Path, str]]): Log files or directories.
+            speed (float, optional): A speed multiplier of the recorded pace
+                (0: as fast as possible). Defaults to 1.0.
+            loop (bool, optional): Loop the logs. Defaults to False.
+            n_devices (int, optional): The number of ports, all of which
+                are written the same lines. Defaults to 1.
+            restamp (bool, optional): Replace time stamps of lines by
+                the sending time (for measuring latency). Defaults to False.
+        """
+        if speed < 0:
+            raise ValueError(f"speed must not be negative: {speed}")
+        if n_devices < 1:
+            raise ValueError(f"the number of devices must be positive: {n_devices}")
+
+        # set parameters
+        self.speed = float(speed)
+        self.loop = loop
+        self.n_devices = int(n_devices)
+        self.restamp = restamp
+
+        # load lines and relative times [s]
+        self.lines, self.times = self.load(sources=sources)
+
+        # init
+        self._masters = []
+        self._slaves = []
+        self._stop_event = threading.Event()
+        self.n_lines = 0
+        self.n_bytes = 0
+        self.elapsed = 0.0
+
+    @staticmethod
+    def load(
+        sources: typing.List[typing.Union[Path, str]]
+    ) -> typing.Tuple[typing.List[bytes], np.ndarray]:
+        """Load lines and their relative times from the recorded time stamps.
+
+        Args:
+            sources (List[Union[Path, str]]): Log files or directories.
+
+        Returns:
+            Tuple[List[bytes], np.ndarray]: lines (with b"\\n") and
+                relative times [s] (lines without time stamps get the previous).
+        """
+        # load
+        lp = LineParser()
+        lines, times = [], []
+        t_offset = 0.0
+        for path in SensorArchive.glob_logs(sources=sources):
+            t0, t = None, 0.0
+            for line in path.read_bytes().splitlines():
+                data_dict = lp.parse_line(line=line)
+                if data_dict is not None:
+                    if t0 is None:
+                        t0 = data_dict[TIME_KEY]
+                    t = (data_dict[TIME_KEY] - t0) * 1e-9
+                lines.append(line + b"\n")
+                times.append(t_offset + t)
+
+            # the next file starts 1 [s] after the last line
+            t_offset += t + 1.0
+
+        if not lines:
+            raise FileNotFoundError(f"no lines in: {sources}")
+
+        return lines, np.maximum.accumulate(np.array(times))
+
+    def open(self) -> typing.List[str]:
+        """Open pseudo terminals.
+
+        Returns:
+            List[str]: Port names to be opened by SerialMonitor.
+        """
+        import tty
+
+        ports = []
+        for _ in range(self.n_devices):
+            master, slave = os.openpty()
+
+            # raw mode: no echo, no line feed conversion
+            tty.setraw(slave)
+            self._masters.append(master)
+            self._slaves.append(slave)
+            ports.append(os.ttyname(slave))
+        return ports
+
+    def run(self) -> None:
+        """Write lines into the ports until the end (or stopped)."""
+        if not self._masters:
+            self.open()
+
+        # init
+        self._stop_event.clear()
+        n = len(self.lines)
+        period = float(self.times[-1]) + 1.0
+        tstart = time.perf_counter()
+
+        try:
+            self._run(n=n, period=period, tstart=tstart)
+        finally:
+            self.elapsed = time.perf_counter() - tstart
+
+    def _run(self, n: int, period: float, tstart: float) -> None:
+        """Write lines (the loop of run)."""
+        i, k = 0, 0
+        while not self._stop_event.is_set():
+            # the end
+            if i == n:
+                if not self.loop:
+                    break
+                i, k = 0, k + 1
+
+            # wait for the time of the next line
+            if self.speed:
+                t_target = (k * period + float(self.times[i])) / self.speed
+                wait = t_target - (time.perf_counter() - tstart)
+                if wait > 0:
+                    time.sleep(min(wait, 0.1))
+                    continue
+
+            # lines whose time has come (up to 1000 lines at once)
+            if self.speed:
+                t_now = (time.perf_counter() - tstart) * self.speed - k * period
+                j = int(np.searchsorted(self.times, t_now, side="right"))
+                j = min(max(j, i + 1), i + 1000, n)
+            else:
+                j = min(i + 1000, n)
+            batch = self._get_batch(lines=self.lines[i:j])
+
+            # fan-out
+            for fd in self._masters:
+                os.write(fd, batch)
+            self.n_lines += j - i
+            self.n_bytes += len(batch)
+            i = j
+
+    def _get_batch(self, lines: typing.List[bytes]) -> bytes:
+        """Join lines (with time stamps replaced by now if restamp)."""
+        if not self.restamp:
+            return b"".join(lines)
+
+        # "TimeStamp: {now}, ..." (lines without time stamps are kept)
+        now = datetime.now().strftime("%Y/%m/%d %H:%M:%S.%f").encode()
+        head = b"TimeStamp: " + now
+        return b"".join(
+            head + v[v.index(b", ") :]
+            if v.startswith(b"TimeStamp: ") and (b", " in v)
+            else v
+            for v in lines
+        )
+
+    def stop(self) -> None:
+        """Stop replaying."""
+        self._stop_event.set()
+
+    def close(self) -> None:
+        """Close pseudo terminals."""
+        for fd in self._masters + self._slaves:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self._masters, self._slaves = [], []
+
+    def get_stats(self) -> dict:
+        """Get counters.
+
+        Returns:
+            dict: devices, lines, bytes, seconds and lines/s (per device).
+        """
+        return {
+            "devices": self.n_devices,
+            "lines": self.n_lines,
+            "bytes": self.n_bytes,
+            "seconds": round(self.elapsed, 3),
+            "lines/s": round(self.n_lines / self.elapsed, 1) if self.elapsed else 0,
+        }
+
+
+######################################################################
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as err:
+        logging.error(msg=err, exc_info=True)
+    sys.exit()
@@ -0,0 +1,165 @@
+"""Fixed-capacity columnar ring buffer for the real time monitoring window.
+
+Usage:
+- from ring_buffer import RingBuffer
+
+---
+
+KazutoMakino
+
+"""
+
+import typing
+
+import numpy as np
+
+######################################################################
+# class
+######################################################################
+
+
+class RingBuffer:
+    """Fixed-capacity columnar ring buffer class.
+
+    Descriptions:
+        One float64 array per channel and one int64 time stamp array
+        (epoch [ns]) are preallocated with twice the capacity.
+        Every value is written to both index i and i + capacity, so the
+        latest values are always contiguous in memory and can be returned
+        as ordered views without copying.
+        Appending and evicting the oldest value are O(1).
+        Returned views are valid until the next appending.
+    """
+
+    def __init__(
+        self,
+        columns: typing.Iterable[str],
+        capacity: int = 30,
+        time_column: str = "TimeStamp",
+    ) -> None:
+        """Preallocate the buffers.
+
+        Args:
+            columns (Iterable[str]): Channel names (except the time stamp).
+            capacity (int, optional): A maximum number of stored samples.
+                Defaults to 30.
+            time_column (str, optional): A column name of the time stamp.
+                Defaults to "TimeStamp".
+        """
+        if capacity < 1:
+            raise ValueError(f"capacity must be positive: {capacity}")
+
+        # set parameters
+        self.capacity = int(capacity)
+        self.time_column = time_column
+        self.columns = list(columns)
+
+        # preallocate (x2 capacity for mirrored writing)
+        self._tstamp = np.zeros(2 * self.capacity, dtype=np.int64)
+        self._values = {
+            k: np.full(2 * self.capacity, np.nan, dtype=np.float64)
+            for k in self.columns
+        }
+
+        # init: the next writing position and the number of stored samples
+        self._head = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, tstamp: int, values: dict) -> None:
+        """Append one sample (the oldest one is evicted if full).
+
+        Args:
+            tstamp (int): A time stamp (epoch [ns]).
+            values (dict): {channel name: value}.
+                Missing channels are set to NaN.
+        """
+        # get mirrored positions
+        i = self._head
+        j = i + self.capacity
+
+        # write
+        self._tstamp[i] = self._tstamp[j] = tstamp
+        for k, arr in self._values.items():
+            arr[i] = arr[j] = values.get(k, np.nan)
+
+        # update positions
+        self._head = (i + 1) % self.capacity
+        if self._size < self.capacity:
+            self._size += 1
+
+    def extend(self, tstamps: np.ndarray, values: dict) -> None:
+        """Append many samples at once.
+
+        Args:
+            tstamps (np.ndarray): 1d-array of time stamps (epoch [ns]).
+            values (dict): {channel name: 1d-array of values}.
+                Missing channels are set to NaN.
+        """
+        # cast
+        tstamps = np.asarray(tstamps, dtype=np.int64)
+        n = len(tstamps)
+        if n == 0:
+            return
+
+        # only the latest `capacity` samples can remain
+        skip = max(n - self.capacity, 0)
+        pos = (self._head + skip + np.arange(n - skip)) % self.capacity
+
+        # write
+        self._tstamp[pos] = self._tstamp[pos + self.capacity] = tstamps[skip:]
+        for k, arr in self._values.items():
+            if k in values:
+                v = np.asarray(values[k], dtype=np.float64)[skip:]
+            else:
+                v = np.nan
+            arr[pos] = arr[pos + self.capacity] = v
+
+        # update positions
+        self._head = (self._head + n) % self.capacity
+        self._size = min(self._size + n, self.capacity)
+
+    def clear(self) -> None:
+        """Remove all samples (buffers are kept)."""
+        self._head = 0
+        self._size = 0
+
+    def _window(self, arr: np.ndarray) -> np.ndarray:
+        """Return a read-only ordered view (oldest -> latest)."""
+        end = self._head + self.capacity
+        view = arr[end - self._size : end]
+        view.flags.writeable = False
+        return view
+
+    def get_timestamps(self) -> np.ndarray:
+        """Get time stamps.
+
+        Returns:
+            np.ndarray: A view of time stamps (int64, epoch [ns]).
+        """
+        return self._window(self._tstamp)
+
+    def get_column(self, column: str) -> np.ndarray:
+        """Get values of the channel.
+
+        Args:
+            column (str): A channel name or the time stamp column name.
+
+        Returns:
+            np.ndarray: A view of values.
+        """
+        if column == self.time_column:
+            return self.get_timestamps()
+        return self._window(self._values[column])
+
+    def to_dict(self) -> dict:
+        """Get all columns.
+
+        Returns:
+            dict: {time stamp column: view, channel name: view, ...}
+        """
+        ret = {self.time_column: self.get_timestamps()}
+        ret.update({k: self._window(arr) for k, arr in self._values.items()})
+        return ret
@@ -0,0 +1,429 @@
+"""Multi-resolution rollups of sensor values.
+
+Descriptions:
+    Samples of each device are aggregated into buckets of fixed resolutions
+    (1 min, 1 h and 1 day by default) keeping count, min, max, mean and
+    variance (M2 of Welford) per column.
+    Chunks of samples are grouped by buckets with NumPy and merged into
+    the open bucket by the parallel formula of Chan et al., so updating
+    is O(1) per sample, and long-horizon views read only a few thousand
+    buckets instead of raw logs.
+    Closed buckets are appended to binary files of fixed-size records
+    (log/rollup/{device id}/{resolution}.bin, readable by numpy.fromfile
+    with the dtype in meta.json). The open bucket is kept as the last
+    record (overwritten in place) when a bucket of the finest resolution
+    is closed and when the store is closed, and it is reopened at the next
+    start, so a crash loses at most the samples of the finest bucket.
+    Samples older than the open bucket of the finest resolution (e.g. the
+    clock of the device is reset or stepped back) are dropped and counted
+    (n_dropped), so buckets are always closed in time order.
+
+Usage:
+- from rollup import RollupStore
+    store = RollupStore(columns=["Temperature[degC]", "Humidity[%]"])
+    store.update(device_id="room1", data=chunk)  # {column: 1d-array}
+    data = store.query(device_id="room1", resolution="1min", tstart=t0)
+    store.close()
+
+---
+
+KazutoMakino
+
+"""
+
+import json
+import typing
+from pathlib import Path
+
+import numpy as np
+
+# import my pkgs
+if True:
+    from line_parser import TIME_KEY
+
+######################################################################
+# settings
+######################################################################
+
+# resolution name: bucket length [s]
+RESOLUTIONS = {"1min": 60, "1h": 3600, "1d": 86400}
+
+# buckets kept in memory per device and resolution (all are in files)
+RETENTION = {"1min": 10080, "1h": 8784, "1d": 3660}
+
+# aggregates per column
+STATS = ("min", "max", "mean", "m2")
+
+######################################################################
+# class
+######################################################################
+
+
+class RollupStore:
+    """Multi-resolution rollup store class."""
+
+    def __init__(
+        self,
+        columns: typing.List[str],
+        root: typing.Optional[typing.Union[Path, str]] = (
+            Path(__file__).resolve().parent / "log" / "rollup"
+        ),
+        resolutions: typing.Dict[str, int] = RESOLUTIONS,
+        retention: typing.Dict[str, int] = RETENTION,
+    ) -> None:
+        """Set columns and resolutions.
+
+        Args:
+            columns (List[str]): Columns to be aggregated.
+            root (Union[Path, str], optional): A directory of files
+                (None: not persisted).
+                Defaults to Path(__file__).resolve().parent / "log" / "rollup".
+            resolutions (Dict[str, int], optional): {name: bucket length [s]}.
+                Defaults to RESOLUTIONS.
+            retention (Dict[str, int], optional): {name: the number of buckets
+                kept in memory}. Defaults to RETENTION.
+        """
+        # set parameters
+        self.columns = list(columns)
+        self.root = None if root is None else Path(root)
+        self.resolutions = dict(resolutions)
+        self.retention = {k: int(retention.get(k, 10000)) for k in self.resolutions}
+
+        # a record of a bucket: start time [ns], count, stats per column
+        self.dtype = np.dtype(
+            [(TIME_KEY, "<i8"), ("count", "<i8")]
+            + [(f"{k}/{v}", "<f8") for k in self.columns for v in STATS]
+        )
+
+        # init: {device id: {resolution: closed buckets (records)}}
+        self._closed = {}
+
+        # init: {device id: {resolution: aggregates of the open bucket}}
+        self._open = {}
+
+        # init: {device id: {resolution: the last record of the file is open}}
+        self._tail = {}
+
+        # init: the number of samples older than the open buckets
+        self.n_dropped = 0
+
+    ##################################################################
+    # updating
+    ##################################################################
+
+    def update(self, device_id: str, data: typing.Dict[str, np.ndarray]) -> None:
+        """Aggregate samples of a device.
+
+        Args:
+            device_id (str): A device id.
+            data (Dict[str, np.ndarray]): {column: 1d-array} with the time stamp
+                column (epoch [ns], increasing). Samples older than the open
+                bucket of the finest resolution are dropped (n_dropped).
+        """
+        tstamps = np.atleast_1d(np.asarray(data[TIME_KEY], dtype=np.int64))
+        if len(tstamps) == 0:
+            return
+        if device_id not in self._closed:
+            self._load(device_id=device_id)
+        values = np.column_stack(
+            [np.atleast_1d(np.asarray(data[k], dtype=np.float64)) for k in self.columns]
+        )
+
+        # drop samples whose finest bucket is older than the latest one
+        # (buckets of the finest are increasing -> so are those of the others)
+        bucket_ns = min(self.resolutions.values()) * 1_000_000_000
+        starts_t = tstamps // bucket_ns * bucket_ns
+        floor = self.get_latest(device_id=device_id)
+        if floor is None:
+            floor = starts_t[0]
+        latest = np.maximum.accumulate(np.concatenate([[floor], starts_t[:-1]]))
+        is_kept = starts_t >= latest
+        if not np.all(is_kept):
+            self.n_dropped += int(np.count_nonzero(~is_kept))
+            tstamps, values = tstamps[is_kept], values[is_kept]
+            if len(tstamps) == 0:
+                return
+
+        is_closed = False
+        for res, length in self.resolutions.items():
+            # group samples by buckets (time stamps are increasing)
+            bucket_ns = length * 1_000_000_000
+            starts_t = tstamps // bucket_ns * bucket_ns
+            starts = np.concatenate([[0], np.flatnonzero(np.diff(starts_t)) + 1])
+            groups = self._aggregate(
+                tstamps=starts_t[starts], starts=starts, values=values
+            )
+
+            # merge the first group into the open bucket of the same time
+            opened = self._open[device_id].get(res)
+            if opened is not None:
+                if opened[TIME_KEY][0] == groups[TIME_KEY][0]:
+                    first = self._merge(a=opened, b=self._slice(groups, 0, 1))
+                    groups = self._concat([first, self._slice(groups, 1, None)])
+                else:
+                    groups = self._concat([opened, groups])
+
+            # close all but the last
+            n_groups = len(groups[TIME_KEY])
+            if n_groups > 1:
+                records = self._to_records(groups=self._slice(groups, 0, n_groups - 1))
+                self._close(device_id=device_id, res=res, records=records)
+                is_closed = True
+            self._open[device_id][res] = self._slice(groups, n_groups - 1, None)
+
+        # write the open buckets if a bucket is closed (once per the finest)
+        if is_closed:
+            self.checkpoint(device_id=device_id)
+
+    @staticmethod
+    def _aggregate(
+        tstamps: np.ndarray, starts: np.ndarray, values: np.ndarray
+    ) -> typing.Dict[str, np.ndarray]:
+        """Aggregate groups of samples (rows of values) at once.
+
+        Returns:
+            Dict[str, np.ndarray]: {TIME_KEY, "count": 1d-array of groups,
+                "min", "max", "mean", "m2": 2d-array of groups x columns}.
+        """
+        counts = np.diff(np.append(starts, len(values)))
+        mean = np.add.reduceat(values, starts, axis=0) / counts[:, np.newaxis]
+        dev = values - np.repeat(mean, counts, axis=0)
+        return {
+            TIME_KEY: tstamps,
+            "count": counts,
+            "min": np.minimum.reduceat(values, starts, axis=0),
+            "max": np.maximum.reduceat(values, starts, axis=0),
+            "mean": mean,
+            "m2": np.add.reduceat(dev * dev, starts, axis=0),
+        }
+
+    @staticmethod
+    def _merge(
+        a: typing.Dict[str, np.ndarray], b: typing.Dict[str, np.ndarray]
+    ) -> typing.Dict[str, np.ndarray]:
+        """Merge aggregates of the same buckets (Chan et al.)."""
+        na, nb = a["count"], b["count"]
+        n = na + nb
+        delta = b["mean"] - a["mean"]
+        return {
+            TIME_KEY: a[TIME_KEY],
+            "count": n,
+            "min": np.minimum(a["min"], b["min"]),
+            "max": np.maximum(a["max"], b["max"]),
+            "mean": a["mean"] + delta * (nb / n)[:, np.newaxis],
+            "m2": a["m2"] + b["m2"] + delta * delta * (na * nb / n)[:, np.newaxis],
+        }
+
+    @staticmethod
+    def _slice(
+        groups: typing.Dict[str, np.ndarray], start: int, stop: typing.Optional[int]
+    ) -> typing.Dict[str, np.ndarray]:
+        """Slice aggregates of groups."""
+        return {k: v[start:stop] for k, v in groups.items()}
+
+    @staticmethod
+    def _concat(
+        groups: typing.List[typing.Dict[str, np.ndarray]]
+    ) -> typing.Dict[str, np.ndarray]:
+        """Concatenate aggregates of groups."""
+        return {k: np.concatenate([v[k] for v in groups]) for k in groups[0]}
+
+    def _to_records(self, groups: typing.Dict[str, np.ndarray]) -> np.ndarray:
+        """Convert aggregates of groups to records."""
+        records = np.zeros(len(groups[TIME_KEY]), dtype=self.dtype)
+        records[TIME_KEY] = groups[TIME_KEY]
+        records["count"] = groups["count"]
+        for j, k in enumerate(self.columns):
+            for v in STATS:
+                records[f"{k}/{v}"] = groups[v][:, j]
+        return records
+
+    def _from_records(self, records: np.ndarray) -> typing.Dict[str, np.ndarray]:
+        """Convert records to aggregates of groups."""
+        groups = {TIME_KEY: records[TIME_KEY].copy(), "count": records["count"].copy()}
+        for v in STATS:
+            groups[v] = np.column_stack([records[f"{k}/{v}"] for k in self.columns])
+        return groups
+
+    def _close(self, device_id: str, res: str, records: np.ndarray) -> None:
+        """Keep closed buckets in memory and write them into the file."""
+        closed = self._closed[device_id]
+        closed[res] = np.concatenate([closed[res], records])[-self.retention[res] :]
+        self._write(device_id=device_id, res=res, records=records)
+        self._tail[device_id][res] = False
+
+    def _write(self, device_id: str, res: str, records: np.ndarray) -> None:
+        """Append records (overwrite the last record if it is open)."""
+        if self.root is None:
+            return
+        with self._get_path(device_id=device_id, res=res).open(mode="ab") as f:
+            if self._tail[device_id].get(res, False):
+                f.truncate(f.seek(0, 2) - self.dtype.itemsize)
+            f.write(records.tobytes())
+
+    def checkpoint(self, device_id: typing.Optional[str] = None) -> None:
+        """Write the open buckets as the last records of files.
+
+        Args:
+            device_id (str, optional): A device id. Defaults to None (all).
+        """
+        device_ids = list(self._open) if device_id is None else [device_id]
+        for k in device_ids:
+            for res, groups in self._open[k].items():
+                self._write(
+                    device_id=k, res=res, records=self._to_records(groups=groups)
+                )
+                self._tail[k][res] = True
+
+    ##################################################################
+    # persistence
+    ##################################################################
+
+    def _get_dir(self, device_id: str) -> Path:
+        """Get the directory of a device."""
+        return self.root / "".join(
+            v if (v.isalnum() or v in "-_.") else "_" for v in str(device_id)
+        )
+
+    def _get_path(self, device_id: str, res: str) -> Path:
+        """Get the file of a device and a resolution."""
+        return self._get_dir(device_id=device_id) / f"{res}.bin"
+
+    def _load(self, device_id: str) -> None:
+        """Load buckets of a device (the last one of each file is reopened)."""
+        self._closed[device_id] = {
+            res: np.zeros(0, dtype=self.dtype) for res in self.resolutions
+        }
+        self._open[device_id] = {}
+        self._tail[device_id] = {}
+        if self.root is None:
+            return
+
+        # meta data (columns must be the same)
+        sdir = self._get_dir(device_id=device_id)
+        sdir.mkdir(parents=True, exist_ok=True)
+        meta_path = sdir / "meta.json"
+        meta = {
+            "device_id": str(device_id),
+            "columns": self.columns,
+            "resolutions": self.resolutions,
+            "dtype": self.dtype.descr,
+        }
+        if meta_path.exists():
+            with meta_path.open(mode="r", encoding="utf-8") as f:
+                saved = json.load(fp=f)
+            if saved["columns"] != self.columns:
+                raise ValueError(
+                    f"columns are different from {meta_path}: {saved['columns']}"
+                )
+        else:
+            with meta_path.open(mode="w", encoding="utf-8") as f:
+                json.dump(obj=meta, fp=f, indent=4)
+
+        for res in self.resolutions:
+            path = self._get_path(device_id=device_id, res=res)
+            if not path.exists():
+                continue
+
+            # read the tail only (a partly written record is removed)
+            size = path.stat().st_size
+            n = size // self.dtype.itemsize
+            if size % self.dtype.itemsize:
+                with path.open(mode="r+b") as f:
+                    f.truncate(n * self.dtype.itemsize)
+            n_read = min(n, self.retention[res] + 1)
+            records = np.fromfile(
+                path,
+                dtype=self.dtype,
+                count=n_read,
+                offset=(n - n_read) * self.dtype.itemsize,
+            )
+
+            # the last one is reopened (overwritten when closed)
+            if len(records):
+                self._open[device_id][res] = self._from_records(records=records[-1:])
+                self._closed[device_id][res] = records[:-1].copy()
+                self._tail[device_id][res] = True
+
+    def close(self) -> None:
+        """Write the open buckets into files (reopened at the next start)."""
+        self.checkpoint()
+
+    def __enter__(self) -> "RollupStore":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    ##################################################################
+    # reading
+    ##################################################################
+
+    def query(
+        self,
+        device_id: str,
+        resolution: str = "1min",
+        tstart: typing.Optional[int] = None,
+        tend: typing.Optional[int] = None,
+        include_open: bool = True,
+    ) -> typing.Dict[str, np.ndarray]:
+        """Get buckets of a time range.
+
+        Args:
+            device_id (str): A device id.
+            resolution (str, optional): A resolution name. Defaults to "1min".
+            tstart (int, optional): The start time (epoch [ns]) of buckets
+                (inclusive). Defaults to None.
+            tend (int, optional): The end time (epoch [ns]) of buckets
+                (exclusive). Defaults to None.
+            include_open (bool, optional): Include the open (latest) bucket.
+                Defaults to True.
+
+        Returns:
+            Dict[str, np.ndarray]: {TIME_KEY: start times of buckets,
+                "count": counts, "{column}/{min, max, mean, std}": 1d-array}.
+        """
+        if resolution not in self.resolutions:
+            raise KeyError(f"resolution must be one of {list(self.resolutions)}")
+        if device_id not in self._closed:
+            self._load(device_id=device_id)
+
+        # closed (+ open) buckets
+        records = self._closed[device_id][resolution]
+        opened = self._open[device_id].get(resolution)
+        if include_open and (opened is not None):
+            records = np.concatenate([records, self._to_records(groups=opened)])
+
+        # time range (records are sorted by time)
+        t = records[TIME_KEY]
+        i0 = 0 if tstart is None else int(np.searchsorted(t, tstart, side="left"))
+        i1 = len(t) if tend is None else int(np.searchsorted(t, tend, side="left"))
+        records = records[i0:i1]
+
+        # columns (the sample standard deviation, nan if count == 1)
+        ret = {TIME_KEY: records[TIME_KEY], "count": records["count"]}
+        dof = np.where(records["count"] > 1, records["count"] - 1, np.nan)
+        for k in self.columns:
+            ret[f"{k}/min"] = records[f"{k}/min"]
+            ret[f"{k}/max"] = records[f"{k}/max"]
+            ret[f"{k}/mean"] = records[f"{k}/mean"]
+            ret[f"{k}/std"] = np.sqrt(records[f"{k}/m2"] / dof)
+        return ret
+
+    def get_latest(self, device_id: str) -> typing.Optional[int]:
+        """Get the latest bucket time of the finest resolution.
+
+        Args:
+            device_id (str): A device id.
+
+        Returns:
+            int: The start time (epoch [ns]), or None if no buckets.
+        """
+        res = min(self.resolutions, key=self.resolutions.get)
+        opened = self._open.get(device_id, {}).get(res)
+        if opened is not None:
+            return int(opened[TIME_KEY][0])
+        closed = self._closed.get(device_id, {}).get(res)
+        return (
+            int(closed[TIME_KEY][-1]) if (closed is not None and len(closed)) else None
+        )
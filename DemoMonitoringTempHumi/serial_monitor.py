@@ -19,6 +19,11 @@ from pathlib import Path
 
 import serial
 
+# import my pkgs
+if True:
+    from frame_protocol import FRAME_SIZE, get_frames_end
+    from log_writer import LogWriter
+
 ######################################################################
 # main
 ######################################################################
@@ -64,12 +69,18 @@ def main():
 class SerialMonitor:
     """Serial monitor class."""
 
+    # bytes kept without a line ending (frame) are written over this size
+    MAX_REST_BYTES = 1 << 16
+
     def __init__(
         self,
         port: str = "COM3",
         baudrate: int = 115200,
         timeout: float = 1,
         logpath: typing.Union[Path, str] = Path(__file__).parent / "log.log",
+        log_options: typing.Optional[dict] = None,
+        log_suffix: str = ".log",
+        binary: bool = False,
     ) -> None:
         """Set serial monitoring parameters.
 
@@ -81,17 +92,31 @@ class SerialMonitor:
             logpath (Path, optional): A log data file path.
                 =="auto": {timestamp}.log
                 Defaults to Path(__file__).parent/"log.log".
+            log_options (dict, optional): Keyword arguments of LogWriter
+                (flush_lines, flush_interval, fsync, max_bytes, period, compress)
+                used in the serial return mode. Defaults to None.
+            log_suffix (str, optional): A suffix of the log file if logpath is
+                "auto" (e.g. ".bin" for binary frames). Defaults to ".log".
+            binary (bool, optional): Bytes of read_bytes are binary frames
+                of frame_protocol.py (not lines). Defaults to False.
         """
         # get logpath
-        log_dir = Path(__file__).resolve().parent / "log"
-        if not log_dir.exists():
-            log_dir.mkdir()
         if logpath == "auto":
-            logpath = log_dir / f"{Timer.get_timestamp(fmt_date='str')}.log"
+            log_dir = Path(__file__).resolve().parent / "log"
+            if not log_dir.exists():
+                log_dir.mkdir()
+            logpath = log_dir / f"{Timer.get_timestamp(fmt_date='str')}{log_suffix}"
         self.logpath = logpath
         if not isinstance(self.logpath, Path):
             self.logpath = Path(self.logpath)
 
+        # set the persistent log writer (opened at the first writing)
+        self.writer = LogWriter(path=self.logpath, **(log_options or {}))
+
+        # bytes after the last complete line (frame) of read_bytes
+        self.binary = binary
+        self._rest = b""
+
         # serial open
         self.ser = serial.Serial(
             port=port,
@@ -121,13 +146,11 @@ class SerialMonitor:
                 txt = self.ser.readline()
                 txt = txt.decode(encoding="utf-8")
 
-                # write into file obj if txt is not None
+                # write into the buffer if txt is not None (flushed in batches)
                 if txt:
-                    # open file obj
-                    with self.logpath.open(
-                        mode="a", encoding="utf-8", newline="\n"
-                    ) as f:
-                        f.write(txt)
+                    self.writer.write(txt=txt)
+                else:
+                    self.writer.poll()
 
                 return txt
 
@@ -152,7 +175,49 @@ class SerialMonitor:
 
         except KeyboardInterrupt:
             # manual stop -> serial close
-            self.ser.close()
+            self.close()
+
+    def read_bytes(self) -> bytes:
+        """Read all available bytes (at least 1 byte or until the timeout)
+        without decoding, and write them into the log as they are.
+        (Only complete lines (frames) are written, and the rest is kept
+        for the next reading, so a line is not split by log rotations.)
+
+        Returns:
+            bytes: A data from the IoT device.
+        """
+        data = self.ser.read(max(1, self.ser.in_waiting))
+        if not data:
+            self.writer.poll()
+            return data
+
+        # split at the end of complete lines (frames)
+        buf = self._rest + data if self._rest else data
+        if self.binary:
+            end = get_frames_end(data=buf)
+            n_lines = end // FRAME_SIZE
+        else:
+            end = buf.rfind(b"\n") + 1
+            n_lines = None
+        if len(buf) - end > self.MAX_REST_BYTES:
+            # no line ending (e.g. garbage)
+            end = len(buf)
+        self._rest = buf[end:]
+
+        # write into the buffer (flushed in batches)
+        if end:
+            self.writer.write(txt=buf[:end], n_lines=n_lines)
+        else:
+            self.writer.poll()
+        return data
+
+    def close(self) -> None:
+        """Flush the log and close the serial port."""
+        if self._rest:
+            self.writer.write(txt=self._rest, n_lines=0)
+            self._rest = b""
+        self.writer.close()
+        self.ser.close()
 
 
 class Timer:
@@ -0,0 +1,413 @@
+"""Time series sink of sensor values into SQLite (WAL).
+
+Descriptions:
+    Chunks of samples are put into a bounded queue by reader threads
+    (never blocking them), and a writer thread inserts them in batches
+    (executemany in a transaction per batch_size rows or flush_interval).
+    The database is in the WAL mode, so readers (e.g. offline training)
+    do not block the writer.
+    Schema (compact, clustered by device and time):
+        devices(id INTEGER PRIMARY KEY, name TEXT UNIQUE)
+        samples(device INTEGER, ts INTEGER, "{column}" REAL, ...,
+                PRIMARY KEY (device, ts)) WITHOUT ROWID
+    ts is the epoch [ns], and columns are added when new channels appear.
+    A time range of a device is a range scan of the primary key.
+
+Usage:
+- py sqlite_sink.py data --device room1
+- from sqlite_sink import SQLiteSink
+    sink = SQLiteSink()
+    sink.start()
+    sink.put(device_id="room1", data=data_dict)  # from reader threads
+    sink.close()
+    data = sink.read(device_id="room1", columns=["Humidity[%]"], tstart=t0)
+    HotellingTSquare().fit(dataset=data["Humidity[%]"])
+
+---
+
+KazutoMakino
+
+"""
+
+import argparse
+import logging
+import sqlite3
+import sys
+import threading
+import time
+import typing
+from pathlib import Path
+
+import numpy as np
+
+# import my pkgs
+if True:
+    from ingest import BoundedQueue
+    from line_parser import TIME_KEY, LineParser
+    from metrics import Metrics
+
+######################################################################
+# main
+######################################################################
+
+
+def main():
+    # get parser
+    parser = argparse.ArgumentParser(description="Insert logs into the database.")
+    parser.add_argument(
+        "sources", type=str, nargs="+", help="log files or directories (*.txt, *.log)"
+    )
+    parser.add_argument(
+        "--path",
+        "-p",
+        type=str,
+        default=SQLiteSink.DEFAULT_PATH,
+        help="database file",
+    )
+    parser.add_argument("--device", "-d", type=str, default="0", help="device id")
+    args = parser.parse_args()
+
+    # insert logs through the queue (the same as the monitoring)
+    from archive import SensorArchive
+
+    sink = SQLiteSink(path=args.path, policy="block")
+    sink.start()
+    tstart = time.perf_counter()
+    for src in SensorArchive.glob_logs(sources=args.sources):
+        # read chunk by chunk (a large log is not loaded at once)
+        n = 0
+        for data in LineParser().iter_chunks(source=src):
+            for i in range(0, len(data[TIME_KEY]), 1000):
+                is_put = sink.put(
+                    device_id=args.device,
+                    data={k: v[i : i + 1000] for k, v in data.items()},
+                    timeout=None,
+                )
+                if not is_put:
+                    # the writer thread is stopped by an error
+                    sink.close()
+                    raise sink.error
+            n += len(data[TIME_KEY])
+        print(f"{src}: {n} samples")
+    sink.close()
+    if sink.error is not None:
+        raise sink.error
+    elapsed = time.perf_counter() - tstart
+    print(f"{sink.get_stats()} in {elapsed:.3f} [s]")
+
+
+######################################################################
+# class
+######################################################################
+
+
+class SQLiteSink(threading.Thread):
+    """Batched writer thread class of samples into SQLite."""
+
+    DEFAULT_PATH = Path(__file__).resolve().parent / "log" / "samples.db"
+
+    def __init__(
+        self,
+        path: typing.Union[Path, str] = DEFAULT_PATH,
+        batch_size: int = 1000,
+        flush_interval: float = 1.0,
+        queue_size: int = 1024,
+        policy: str = "drop-oldest",
+        metrics: typing.Optional[Metrics] = None,
+    ) -> None:
+        """Make the database and the queue.
+
+        Args:
+            path (Union[Path, str], optional): A database file.
+                Defaults to DEFAULT_PATH (./log/samples.db).
+            batch_size (int, optional): Insert if this number of rows are
+                waiting. Defaults to 1000.
+            flush_interval (float, optional): Insert if this time [s] has passed
+                since the last insert. Defaults to 1.0.
+            queue_size (int, optional): A maximum number of chunks waiting
+                for the writer. Defaults to 1024.
+            policy (str, optional): An overflow policy of the queue
+                ("drop-oldest", "block" or "coalesce"). Defaults to "drop-oldest".
+            metrics (Metrics, optional): Metrics to observe the insert stage
+                ("sink") and count inserted rows. Defaults to None (own metrics).
+        """
+        super().__init__(name="SQLiteSink", daemon=True)
+
+        # set parameters
+        self.path = Path(path)
+        self.batch_size = int(batch_size)
+        self.flush_interval = float(flush_interval)
+        self.queue = BoundedQueue(maxsize=queue_size, policy=policy)
+        self.metrics = Metrics() if metrics is None else metrics
+
+        # init
+        self.columns = []
+        self.device_ids = {}
+        self.n_rows = 0
+        self.n_batches = 0
+        self.error = None
+
+        # make tables (the WAL mode is kept by the database file)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS devices"
+                + " (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL)"
+            )
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS samples"
+                + " (device INTEGER NOT NULL, ts INTEGER NOT NULL,"
+                + " PRIMARY KEY (device, ts)) WITHOUT ROWID"
+            )
+            self.columns, self.device_ids = self._get_schema(con=con)
+        con.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Connect to the database (a connection per thread)."""
+        con = sqlite3.connect(self.path, timeout=10.0)
+        con.execute("PRAGMA synchronous=NORMAL")
+        return con
+
+    @staticmethod
+    def _get_schema(
+        con: sqlite3.Connection,
+    ) -> typing.Tuple[typing.List[str], typing.Dict[str, int]]:
+        """Get columns and {device id: id} from the database."""
+        columns = [
+            v[1] for v in con.execute("PRAGMA table_info(samples)").fetchall()[2:]
+        ]
+        device_ids = dict(con.execute("SELECT name, id FROM devices").fetchall())
+        return columns, device_ids
+
+    @staticmethod
+    def _quote(name: str) -> str:
+        """Quote a column name (e.g. "Humidity[%]")."""
+        return '"' + name.replace('"', '""') + '"'
+
+    ##################################################################
+    # writing
+    ##################################################################
+
+    def put(
+        self,
+        device_id: str,
+        data: typing.Dict[str, typing.Any],
+        timeout: typing.Optional[float] = 0.0,
+    ) -> bool:
+        """Put a chunk of samples (called by reader threads).
+
+        Args:
+            device_id (str): A device id.
+            data (Dict[str, Any]): {column: 1d-array or a value}, the 1st key is
+                the time stamp (epoch [ns]) as DataStream.run returns.
+            timeout (float, optional): A timeout [s] of the "block" policy.
+                Defaults to 0.0 (not wait).
+
+        Returns:
+            bool: False if the chunk is not put (the queue is full or closed).
+        """
+        return self.queue.put(item=(str(device_id), data), timeout=timeout)
+
+    def run(self) -> None:
+        """Insert chunks in batches until the queue is closed and empty."""
+        con = self._connect()
+        try:
+            pending = []
+            n_pending = 0
+            t_flush = time.perf_counter()
+            while True:
+                items = self.queue.drain(timeout=self.flush_interval)
+                for item in items:
+                    pending.append(item)
+                    n_pending += len(np.atleast_1d(next(iter(item[1].values()))))
+                is_end = (not items) and self.queue.closed
+                if pending and (
+                    (n_pending >= self.batch_size)
+                    or (time.perf_counter() - t_flush >= self.flush_interval)
+                    or is_end
+                ):
+                    self._insert(con=con, items=pending)
+                    pending = []
+                    n_pending = 0
+                    t_flush = time.perf_counter()
+                if is_end:
+                    break
+
+        except Exception as err:
+            # keep the error for the owner, and release waiting producers
+            # (put returns False after this)
+            self.error = err
+            self.queue.close()
+            logging.error(msg=err, exc_info=True)
+
+        finally:
+            con.close()
+
+    def _insert(self, con: sqlite3.Connection, items: list) -> None:
+        """Insert chunks in a transaction."""
+        t0 = time.perf_counter()
+
+        # rows per set of columns (columns in a chunk are the same)
+        groups = {}
+        for device_id, data in items:
+            keys = list(data.keys())
+            values = [np.atleast_1d(data[k]).tolist() for k in keys]
+            groups.setdefault(tuple(keys[1:]), []).append((device_id, values))
+
+        n_rows = 0
+        with con:
+            for columns, chunks in groups.items():
+                # new devices and columns
+                for device_id, _ in chunks:
+                    if device_id not in self.device_ids:
+                        con.execute(
+                            "INSERT OR IGNORE INTO devices (name) VALUES (?)",
+                            (device_id,),
+                        )
+                        self.device_ids[device_id] = con.execute(
+                            "SELECT id FROM devices WHERE name = ?", (device_id,)
+                        ).fetchone()[0]
+                for k in columns:
+                    if k not in self.columns:
+                        con.execute(
+                            f"ALTER TABLE samples ADD COLUMN {self._quote(k)} REAL"
+                        )
+                        self.columns.append(k)
+
+                # rows: (device, ts, values of columns)
+                sql = (
+                    "INSERT OR REPLACE INTO samples (device, ts, "
+                    + ", ".join(self._quote(k) for k in columns)
+                    + ") VALUES ("
+                    + ", ".join(["?"] * (len(columns) + 2))
+                    + ")"
+                )
+                for device_id, values in chunks:
+                    rows = zip(
+                        [self.device_ids[device_id]] * len(values[0]),
+                        values[0],
+                        *values[1:],
+                    )
+                    cur = con.executemany(sql, rows)
+                    n_rows += cur.rowcount
+
+        self.n_rows += n_rows
+        self.n_batches += 1
+        self.metrics.inc(name="sink_rows", value=n_rows)
+        self.metrics.observe(stage="sink", seconds=time.perf_counter() - t0)
+
+    def close(self, timeout: typing.Optional[float] = None) -> None:
+        """Insert waiting chunks and stop the thread.
+
+        Args:
+            timeout (float, optional): A time [s] to wait for the thread.
+                Defaults to None (wait until all chunks are inserted).
+        """
+        self.queue.close()
+        if self.is_alive():
+            self.join(timeout=timeout)
+
+    def get_stats(self) -> dict:
+        """Get counters.
+
+        Returns:
+            dict: rows (inserted), batches, depth, max_depth and dropped.
+        """
+        stats = self.queue.get_stats()
+        return {
+            "rows": self.n_rows,
+            "batches": self.n_batches,
+            "depth": stats["depth"],
+            "max_depth": stats["max_depth"],
+            "dropped": stats["dropped"],
+        }
+
+    ##################################################################
+    # reading
+    ##################################################################
+
+    def list_devices(self) -> typing.List[str]:
+        """Get device ids in the database.
+
+        Returns:
+            List[str]: Device ids.
+        """
+        con = self._connect()
+        try:
+            return [v[0] for v in con.execute("SELECT name FROM devices ORDER BY id")]
+        finally:
+            con.close()
+
+    def read(
+        self,
+        device_id: str,
+        columns: typing.Optional[typing.List[str]] = None,
+        tstart: typing.Optional[int] = None,
+        tend: typing.Optional[int] = None,
+    ) -> typing.Dict[str, np.ndarray]:
+        """Read columns of a device in a time range.
+
+        Args:
+            device_id (str): A device id.
+            columns (List[str], optional): Column names to read.
+                Defaults to None (all columns).
+            tstart (int, optional): The start time (epoch [ns], inclusive).
+                Defaults to None.
+            tend (int, optional): The end time (epoch [ns], exclusive).
+                Defaults to None.
+
+        Returns:
+            Dict[str, np.ndarray]: {TIME_KEY: int64 time stamps (sorted),
+                column: float64 values (nan if not received)}.
+        """
+        con = self._connect()
+        try:
+            # (the schema is read again, the writer may add devices and columns)
+            all_columns, device_ids = self._get_schema(con=con)
+            if columns is None:
+                columns = all_columns
+            unknown = set(columns) - set(all_columns)
+            if unknown:
+                raise KeyError(f"unknown columns: {unknown}")
+
+            # a range scan of the primary key (device, ts)
+            sql = (
+                "SELECT ts"
+                + "".join(f", {self._quote(k)}" for k in columns)
+                + " FROM samples WHERE device = ? AND ts >= ? AND ts < ? ORDER BY ts"
+            )
+            rows = con.execute(
+                sql,
+                (
+                    device_ids.get(str(device_id), -1),
+                    -(2**63) if tstart is None else int(tstart),
+                    2**63 - 1 if tend is None else int(tend),
+                ),
+            ).fetchall()
+        finally:
+            con.close()
+
+        # columns of arrays (NULL -> nan)
+        ret = {TIME_KEY: np.fromiter((v[0] for v in rows), np.int64, len(rows))}
+        values = np.array([v[1:] for v in rows], dtype=np.float64)
+        for j, k in enumerate(columns):
+            ret[k] = values[:, j] if len(rows) else np.zeros(0)
+        return ret
+
+    def __enter__(self) -> "SQLiteSink":
+        self.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+######################################################################
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as err:
+        logging.error(msg=err, exc_info=True)
+    sys.exit()
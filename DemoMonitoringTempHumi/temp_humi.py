@@ -14,6 +14,7 @@ KazutoMakino
 
 import socket
 import struct
+import sys
 import time
 
 import wifiCfg
@@ -29,8 +30,38 @@ R_HIGH = const(1)
 R_MEDIUM = const(2)
 R_LOW = const(3)
 
-# time.sleep
-SLEEPTIME = 1
+# sensor measurement mode
+#   0: single shot (blocking about 50 [ms] per sample)
+#   0.5, 1, 2, 4 or 10: periodic measurement [mps] (fetched without blocking)
+#   "art": periodic measurement by ART (accelerated response time, 4 [mps])
+PERIODIC_MPS = 0
+
+# sampling period [ms] of the single shot measurement
+#   (single shot measurement of high repeatability takes about 50 [ms],
+#   so the maximum rate is about 20 [Hz]; the periodic measurement is
+#   sampled at PERIODIC_MPS)
+SAMPLE_PERIOD_MS = const(1000)
+
+# the number of samples written into serial at once
+BATCH_SIZE = const(1)
+
+# LCD update period [ms]
+LCD_PERIOD_MS = const(1000)
+
+# serial protocol
+#   "text": human-readable lines ("TimeStamp: ..., Humidity[%]: ...")
+#   "binary": 21-byte frames (see frame_protocol.py @ PC side)
+PROTOCOL = "text"
+
+# text line
+TEXT_FORMAT = (
+    "TimeStamp: {0}, ElapsedTime[s]: {1}, Temperature[degC]: {2}, Humidity[%]: {3}"
+)
+
+# binary frame: magic, seq, sec, usec, ticks_ms, raw temp, raw humi (+ CRC-8)
+FRAME_MAGIC = b"\xa5\x5a"
+FRAME_FORMAT = "<2sHIIIHH"
+FRAME_SIZE = const(21)
 
 ######################################################################
 # main
@@ -48,34 +79,134 @@ def main():
     # init: rtc
     mcclock = MiConClock()
 
+    # start the periodic measurement
+    if PERIODIC_MPS:
+        sensor.start_periodic(mps=PERIODIC_MPS)
+
+    # init: preallocated batch buffers (binary frames or text lines)
+    frames = bytearray(FRAME_SIZE * BATCH_SIZE)
+    lines = [""] * BATCH_SIZE
+    n = 0
+    seq = 0
+    n_crc_errors = 0
+    t, h = float("nan"), float("nan")
+
+    # init: schedules
+    t_next = time.ticks_ms()
+    t_lcd = t_next
+
     # endless loop
     while True:
-        # get now
-        now_txt = mcclock.return_times_of_day(ret_type="str")
-
-        # get elapsed time [ms] / 1000
-        elapsed = time.ticks_ms() * 1e-3
+        # get raw counts of temperature and humidity
+        # (None if the periodic measurement is not ready or CRC is wrong)
+        try:
+            if PERIODIC_MPS:
+                raw = sensor.fetch_raw_temp_humi()
+            else:
+                raw = sensor.get_raw_temp_humi()
+        except CRCError:
+            n_crc_errors += 1
+            raw = None
 
-        # get temperature and humidity
-        t, h = sensor.get_temp_humi()
+        if raw is None:
+            pass
 
-        # print @ serial monitor
-        print(
-            "TimeStamp: {0}, ElapsedTime[s]: {1}, Temperature[degC]: {2}, Humidity[%]: {3}".format(
-                now_txt, elapsed, t, h
+        elif PROTOCOL == "binary":
+            # get now [s] since 2000/01/01 and sub seconds [us]
+            sec, usec = mcclock.return_times_of_day(ret_type="epoch")
+
+            # set a frame into the batch
+            i = n * FRAME_SIZE
+            struct.pack_into(
+                FRAME_FORMAT,
+                frames,
+                i,
+                FRAME_MAGIC,
+                seq,
+                sec,
+                usec,
+                time.ticks_ms(),
+                raw[0],
+                raw[1],
             )
-        )
+            frames[i + FRAME_SIZE - 1] = crc8(frames, i + 2, i + FRAME_SIZE - 1)
+            seq = (seq + 1) & 0xFFFF
+            n += 1
 
-        # clear the monitor window
-        lcd.clear(lcd.BLACK)
+        else:
+            # get now
+            now_txt = mcclock.return_times_of_day(ret_type="str")
 
-        # print @ physical monitor
-        lcd.text(0, 0, "{0}".format(now_txt))
-        lcd.text(0, 20, "Temp: {0:.3f} [degC]".format(t))
-        lcd.text(0, 40, "Humi: {0:.3f} [%]".format(h))
+            # get elapsed time [ms] / 1000
+            elapsed = time.ticks_ms() * 1e-3
 
-        # wait
-        time.sleep(SLEEPTIME)
+            # get temperature and humidity
+            t, h = SHT31.to_temp_humi(raw[0], raw[1])
+
+            # set a line into the batch
+            lines[n] = TEXT_FORMAT.format(now_txt, elapsed, t, h)
+            n += 1
+
+        # write the batch @ serial monitor
+        if n == BATCH_SIZE:
+            if PROTOCOL == "binary":
+                sys.stdout.buffer.write(frames)
+            else:
+                print("\n".join(lines))
+            n = 0
+
+        # print @ physical monitor (at the lower rate)
+        if time.ticks_diff(time.ticks_ms(), t_lcd) >= 0:
+            now_txt = mcclock.return_times_of_day(ret_type="str")
+            if (raw is not None) and (PROTOCOL == "binary"):
+                t, h = SHT31.to_temp_humi(raw[0], raw[1])
+
+            # clear the monitor window
+            lcd.clear(lcd.BLACK)
+
+            # print
+            lcd.text(0, 0, "{0}".format(now_txt))
+            lcd.text(0, 20, "Temp: {0:.3f} [degC]".format(t))
+            lcd.text(0, 40, "Humi: {0:.3f} [%]".format(h))
+            if n_crc_errors:
+                lcd.text(0, 60, "CRC errors: {0}".format(n_crc_errors))
+            t_lcd = time.ticks_add(t_lcd, LCD_PERIOD_MS)
+            if time.ticks_diff(time.ticks_ms(), t_lcd) >= 0:
+                t_lcd = time.ticks_add(time.ticks_ms(), LCD_PERIOD_MS)
+
+        # wait for the next sampling (not accumulating delays)
+        if PERIODIC_MPS:
+            # the sensor keeps the period: wait until the next result is ready
+            time.sleep_ms(max(1, sensor.get_wait_ms()))
+            continue
+        t_next = time.ticks_add(t_next, SAMPLE_PERIOD_MS)
+        wait = time.ticks_diff(t_next, time.ticks_ms())
+        if wait > 0:
+            time.sleep_ms(wait)
+        else:
+            t_next = time.ticks_ms()
+
+
+def crc8(buf, start: int = 0, end: int = None) -> int:
+    """Get CRC-8 (poly 0x31, init 0xff) which is the same as SHT3x.
+
+    Args:
+        buf (bytearray): A data.
+        start (int, optional): The start index. Defaults to 0.
+        end (int, optional): The end index (exclusive). Defaults to None.
+
+    Returns:
+        int: The CRC.
+    """
+    crc = 0xFF
+    for i in range(start, len(buf) if end is None else end):
+        crc ^= buf[i]
+        for _ in range(8):
+            if crc & 0x80:
+                crc = ((crc << 1) ^ 0x31) & 0xFF
+            else:
+                crc = (crc << 1) & 0xFF
+    return crc
 
 
 class MiConClock:
@@ -100,6 +231,7 @@ class MiConClock:
                 =="tuple": return tuple(year, month, day, weekday,
                     hours, minutes, seconds, subseconds).
                 =="str": return as datetime format.
+                =="epoch": return tuple(seconds since 2000/01/01, subseconds).
                 Defaults to "tuple".
 
         Returns:
@@ -144,6 +276,13 @@ class MiConClock:
                 subseconds,
             )
 
+        elif ret_type == "epoch":
+            # seconds since 2000/01/01 (the epoch of micropython)
+            ret = (
+                time.mktime((year, month, day, hours, minutes, seconds, 0, 0)),
+                subseconds,
+            )
+
         return ret
 
     def show_times_of_day(self) -> None:
@@ -258,6 +397,10 @@ class PseudoPython:
 ######################################################################
 
 
+class CRCError(Exception):
+    """CRC of the data read from the sensor is wrong."""
+
+
 class SHT31:
     """https://github.com/kfricke/micropython-sht31
     This class implements an interface to the SHT31 temperature and humidity
@@ -270,6 +413,18 @@ class SHT31:
         False: {R_HIGH: b"\x24\x00", R_MEDIUM: b"\x24\x0b", R_LOW: b"\x24\x16"},
     }
 
+    # periodic measurement commands: {mps: {repeatability: command}}
+    _map_mps_r = {
+        0.5: {R_HIGH: b"\x20\x32", R_MEDIUM: b"\x20\x24", R_LOW: b"\x20\x2f"},
+        1: {R_HIGH: b"\x21\x30", R_MEDIUM: b"\x21\x26", R_LOW: b"\x21\x2d"},
+        2: {R_HIGH: b"\x22\x36", R_MEDIUM: b"\x22\x20", R_LOW: b"\x22\x2b"},
+        4: {R_HIGH: b"\x23\x34", R_MEDIUM: b"\x23\x22", R_LOW: b"\x23\x29"},
+        10: {R_HIGH: b"\x27\x37", R_MEDIUM: b"\x27\x21", R_LOW: b"\x27\x2a"},
+    }
+    _CMD_ART = b"\x2b\x32"
+    _CMD_FETCH = b"\xe0\x00"
+    _CMD_BREAK = b"\x30\x93"
+
     def __init__(self, i2c, addr=0x44):
         """
         Initialize a sensor object on the given I2C bus and accessed by the
@@ -279,6 +434,8 @@ class SHT31:
             raise ValueError("I2C object needed as argument!")
         self._i2c = i2c
         self._addr = addr
+        self._period_ms = 0
+        self._t_ready = 0
 
     def _send(self, buf):
         """
@@ -296,17 +453,108 @@ class SHT31:
 
     def _raw_temp_humi(self, r=R_HIGH, cs=True):
         """
-        Read the raw temperature and humidity from the sensor and skips CRC
-        checking.
+        Read the raw temperature and humidity from the sensor by the single
+        shot measurement and checks CRC.
         Returns a tuple for both values in that order.
         """
         if r not in (R_HIGH, R_MEDIUM, R_LOW):
             raise ValueError("Wrong repeatabillity value given!")
+        if self._period_ms:
+            raise RuntimeError("Periodic measurement is running!")
         self._send(self._map_cs_r[cs][r])
         time.sleep_ms(50)
-        raw = self._recv(6)
+        return self._unpack(self._recv(6))
+
+    @staticmethod
+    def _unpack(raw):
+        """
+        Check CRC of both words and unpack them.
+        Raises CRCError if CRC is wrong.
+        Returns a tuple of the raw temperature and humidity in that order.
+        """
+        if crc8(raw, 0, 2) != raw[2]:
+            raise CRCError("CRC error of temperature: {0}".format(bytes(raw)))
+        if crc8(raw, 3, 5) != raw[5]:
+            raise CRCError("CRC error of humidity: {0}".format(bytes(raw)))
         return (raw[0] << 8) + raw[1], (raw[3] << 8) + raw[4]
 
+    def start_periodic(self, mps=1, r=R_HIGH):
+        """
+        Start the periodic measurement with the given measurements per second
+        (0.5, 1, 2, 4 or 10) and repeatability, or ART if mps is "art".
+        """
+        if mps == "art":
+            cmd, period_ms = self._CMD_ART, 250
+        elif mps in self._map_mps_r:
+            if r not in (R_HIGH, R_MEDIUM, R_LOW):
+                raise ValueError("Wrong repeatabillity value given!")
+            cmd, period_ms = self._map_mps_r[mps][r], int(1000 / mps)
+        else:
+            raise ValueError("Wrong mps value given!")
+        if self._period_ms:
+            self.stop_periodic()
+        self._send(cmd)
+        self._period_ms = period_ms
+        self._t_ready = time.ticks_add(time.ticks_ms(), period_ms)
+
+    def stop_periodic(self):
+        """
+        Stop the periodic measurement (the sensor returns to the single shot
+        mode).
+        """
+        self._send(self._CMD_BREAK)
+        self._period_ms = 0
+        time.sleep_ms(1)
+
+    def ready(self):
+        """
+        Check whether a new result of the periodic measurement is ready or
+        not without blocking.
+        """
+        return bool(self._period_ms) and (
+            time.ticks_diff(time.ticks_ms(), self._t_ready) >= 0
+        )
+
+    def get_wait_ms(self):
+        """
+        Returns the time [ms] until the next result of the periodic
+        measurement is ready (0 if ready).
+        """
+        return max(0, time.ticks_diff(self._t_ready, time.ticks_ms()))
+
+    def fetch_raw_temp_humi(self):
+        """
+        Fetch the raw temperature and humidity of the periodic measurement
+        only if a new result is ready (never waits for the conversion).
+        Raises CRCError if CRC is wrong.
+        Returns a tuple for both values in that order, or None if not ready.
+        """
+        if not self.ready():
+            return None
+        try:
+            self._send(self._CMD_FETCH)
+            raw = self._recv(6)
+        except OSError:
+            # NACK: no data yet (the sensor's clock is slightly slower)
+            return None
+
+        # the next result
+        self._t_ready = time.ticks_add(self._t_ready, self._period_ms)
+        if time.ticks_diff(time.ticks_ms(), self._t_ready) >= 0:
+            self._t_ready = time.ticks_add(time.ticks_ms(), self._period_ms)
+        return self._unpack(raw)
+
+    def fetch_temp_humi(self, celsius=True):
+        """
+        Fetch the temperature in degree celsius or fahrenheit and relative
+        humidity of the periodic measurement.
+        Returns a tuple for both values in that order, or None if not ready.
+        """
+        raw = self.fetch_raw_temp_humi()
+        if raw is None:
+            return None
+        return self.to_temp_humi(raw[0], raw[1], celsius)
+
     def get_temp_humi(self, resolution=R_HIGH, clock_stretch=True, celsius=True):
         """
         Read the temperature in degree celsius or fahrenheit and relative
@@ -314,6 +562,22 @@ class SHT31:
         Returns a tuple for both values in that order.
         """
         t, h = self._raw_temp_humi(resolution, clock_stretch)
+        return self.to_temp_humi(t, h, celsius)
+
+    def get_raw_temp_humi(self, resolution=R_HIGH, clock_stretch=True):
+        """
+        Read the raw 16-bit counts of the temperature and humidity.
+        Returns a tuple for both values in that order.
+        """
+        return self._raw_temp_humi(resolution, clock_stretch)
+
+    @staticmethod
+    def to_temp_humi(t, h, celsius=True):
+        """
+        Convert the raw counts to the temperature in degree celsius or
+        fahrenheit and relative humidity.
+        Returns a tuple for both values in that order.
+        """
         if celsius:
             temp = -45 + (175 * (t / 65535))
         else:
@@ -11,13 +11,18 @@ KazutoMakino
 """
 
 
+import json
+import os
 import sys
+import tempfile
 import traceback
 from pathlib import Path
 
+import numpy as np
+
 sys.path.append(str(Path(__file__).parent))
 if True:
-    from anomaly_detection import HotellingTSquare
+    from anomaly_detection import HotellingTSquare, SufficientStats
 
 ######################################################################
 # main
@@ -27,6 +32,14 @@ if True:
 def main():
     test_get_anomaly_score()
     test_is_normal()
+    test_is_normal_data()
+    test_score_batch()
+    test_is_normal_batch()
+    test_fit_multivariate()
+    test_partial_fit()
+    test_sufficient_stats()
+    test_reload()
+    test_save_mode()
 
 
 ######################################################################
@@ -52,6 +65,213 @@ def test_is_normal():
     assert all([isinstance(v, bool) for v in scores]) is True
 
 
+def test_is_normal_data():
+    hts = HotellingTSquare()
+    toydata = list(range(100))
+    expected = [
+        hts.is_normal(anomaly_score=hts.get_anomaly_score(data=v)) for v in toydata
+    ]
+    results = [hts.is_normal_data(data=v) for v in toydata]
+    print(results)
+    assert results == expected
+    assert any(results) and not all(results)
+
+
+def test_score_batch():
+    hts = HotellingTSquare()
+    toydata = np.arange(100, dtype=float).reshape(4, 25)
+    scores = hts.score_batch(data=toydata)
+    print(scores)
+    assert scores.shape == (4, 25)
+    assert np.allclose(
+        scores.ravel(), [hts.get_anomaly_score(data=v) for v in toydata.ravel()]
+    )
+
+
+def test_is_normal_batch():
+    hts = HotellingTSquare()
+    toydata = np.arange(100, dtype=float).reshape(4, 25)
+    results = hts.is_normal_batch(anomaly_scores=hts.score_batch(data=toydata))
+    print(results)
+    assert results.dtype == bool
+    assert results.ravel().tolist() == [hts.is_normal_data(v) for v in range(100)]
+
+
+def test_fit_multivariate():
+    rng = np.random.default_rng(seed=0)
+    toydata = rng.multivariate_normal(
+        mean=[20.0, 50.0], cov=[[1.0, -0.8], [-0.8, 4.0]], size=1000
+    )
+    with tempfile.TemporaryDirectory() as tmpdir:
+        hts = HotellingTSquare(param_path=Path(tmpdir) / "param.json")
+        hts.fit(dataset=toydata, columns=["Temperature[degC]", "Humidity[%]"])
+        reloaded = HotellingTSquare(param_path=Path(tmpdir) / "param.json")
+    assert reloaded.is_multivariate is True
+    assert reloaded.params["df"] == 2.0
+    scores = reloaded.score_batch(data=toydata)
+    print(scores)
+    assert scores.shape == (1000,)
+    assert np.isclose(scores.mean(), 2.0)
+    assert np.isclose(scores[0], reloaded.get_anomaly_score(data=toydata[0]))
+    results = reloaded.is_normal_batch(anomaly_scores=scores)
+    assert 0.97 < results.mean() < 1.0
+
+
+def test_partial_fit():
+    rng = np.random.default_rng(seed=0)
+    toydata = rng.multivariate_normal(
+        mean=[20.0, 50.0], cov=[[1.0, -0.8], [-0.8, 4.0]], size=1000
+    )
+    with tempfile.TemporaryDirectory() as tmpdir:
+        hts = HotellingTSquare(param_path=Path(tmpdir) / "param.json")
+        hts.fit(dataset=toydata)
+        hts_online = HotellingTSquare(param_path=Path(tmpdir) / "online.json")
+        hts_online.partial_fit(samples=toydata[:1])
+        hts_online.partial_fit(samples=toydata[1:100])
+        for v in toydata[100:]:
+            hts_online.partial_fit(samples=v, checkpoint_interval=300)
+        assert (Path(tmpdir) / "online.json").exists()
+        assert np.allclose(hts_online.params["mean"], hts.params["mean"])
+        assert np.allclose(hts_online.params["covariance"], hts.params["covariance"])
+        assert hts_online.params["threshold"] == hts.params["threshold"]
+
+        # univariate with forgetting: follows the level shift
+        hts_forget = HotellingTSquare(param_path=Path(tmpdir) / "forget.json")
+        hts_forget.partial_fit(samples=toydata[:, 1])
+        hts_forget.partial_fit(samples=toydata[:, 1] + 10.0, forgetting_factor=0.99)
+        print(hts_forget.params)
+        assert abs(hts_forget.params["mean"] - 60.0) < 0.5
+
+        # parameters without the count: a sample does not replace the model
+        params = {k: v for k, v in hts.params.items() if k != "count"}
+        (Path(tmpdir) / "nocount.json").write_text(json.dumps(params))
+        for forgetting_factor in [1.0, 0.9999, 0.999]:
+            hts_nocount = HotellingTSquare(param_path=Path(tmpdir) / "nocount.json")
+            hts_nocount.partial_fit(
+                samples=[100.0, 100.0], forgetting_factor=forgetting_factor
+            )
+            shift = np.asarray(hts_nocount.params["mean"]) - hts.params["mean"]
+            assert np.all(np.abs(shift) < 0.1), forgetting_factor
+
+
+def test_sufficient_stats():
+    rng = np.random.default_rng(seed=0)
+    toydata = rng.multivariate_normal(
+        mean=[20.0, 50.0], cov=[[1.0, -0.8], [-0.8, 4.0]], size=1000
+    )
+
+    # merged statistics of parts (including empty ones) == those of the whole
+    for data in [toydata, toydata[:, 1]]:
+        parts = np.split(data, [0, 1, 300, 300, 710])
+        merged = SufficientStats()
+        for part in parts[::-1]:
+            merged = merged.merge(SufficientStats.from_data(data=part))
+        assert merged.count == len(data)
+        assert np.allclose(merged.mean, np.mean(data, axis=0))
+        assert np.allclose(merged.covariance, np.cov(data, rowvar=False, ddof=0))
+
+    # fit by statistics == fit by samples
+    with tempfile.TemporaryDirectory() as tmpdir:
+        hts = HotellingTSquare(param_path=Path(tmpdir) / "param.json")
+        hts.fit(dataset=toydata)
+        hts_stats = HotellingTSquare(param_path=Path(tmpdir) / "stats.json")
+        hts_stats.fit_stats(sufficient_stats=merged)
+        assert hts_stats.is_multivariate is False
+        assert np.isclose(hts_stats.params["mean"], hts.params["mean"][1])
+        assert np.isclose(hts_stats.params["variance"], hts.params["covariance"][1][1])
+        try:
+            hts_stats.fit_stats(sufficient_stats=SufficientStats())
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("ValueError is not raised")
+
+
+def touch(path: Path, offset_ns: int):
+    """Shift mtime (writes in the same tick of the file system have the same)."""
+    mtime_ns = path.stat().st_mtime_ns + offset_ns
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_reload():
+    rng = np.random.default_rng(seed=0)
+    toydata = rng.normal(loc=50.0, scale=2.0, size=1000)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / "param.json"
+
+        # not fitted yet: nothing to reload
+        hts = HotellingTSquare(param_path=path)
+        assert hts.reload() is False
+
+        # fitted by another process (e.g. train.py)
+        trainer = HotellingTSquare(param_path=path)
+        trainer.fit(dataset=toydata)
+        assert hts.reload() is True
+        assert hts.threshold == trainer.params["threshold"]
+        assert hts.get_anomaly_score(data=trainer.params["mean"]) == 0.0
+        assert hts.reload() is False
+
+        # retrained: scores change, no temporary files are left
+        trainer.fit(dataset=toydata + 10.0)
+        touch(path=path, offset_ns=1)
+        assert hts.reload() is True
+        assert hts.get_anomaly_score(data=trainer.params["mean"]) == 0.0
+        assert np.array_equal(
+            hts.score_batch(data=np.array([60.0, 70.0])),
+            trainer.score_batch(data=np.array([60.0, 70.0])),
+        )
+        assert [v.name for v in Path(tmpdir).iterdir()] == ["param.json"]
+
+        # every session (instance) reloads the retrained model by itself
+        other = HotellingTSquare(param_path=path)
+        trainer.fit(
+            dataset=np.column_stack([toydata, toydata[::-1]]), columns=["a", "b"]
+        )
+        touch(path=path, offset_ns=3)
+        assert hts.reload() is True
+        assert other.reload() is True
+        assert other.is_multivariate and other.params["columns"] == ["a", "b"]
+        trainer.fit(dataset=toydata + 10.0)
+        touch(path=path, offset_ns=4)
+        assert hts.reload() is True
+
+        # saved by itself: not reloaded
+        hts.partial_fit(samples=toydata[:10] + 10.0)
+        hts.save()
+        assert hts.reload() is False
+
+        # broken file (e.g. written by hand): the current model is kept
+        threshold = hts.threshold
+        path.write_text("{", encoding="utf-8")
+        touch(path=path, offset_ns=2)
+        assert hts.reload() is False
+        assert hts.threshold == threshold
+        assert hts.get_anomaly_score(data=hts.params["mean"]) == 0.0
+
+
+def test_save_mode():
+    # permissions are only for the owner on Windows
+    if os.name != "posix":
+        return
+
+    toydata = np.random.default_rng(seed=0).normal(loc=50.0, scale=2.0, size=100)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / "param.json"
+
+        # a new file: 0o666 masked by the umask
+        umask = os.umask(0o022)
+        try:
+            HotellingTSquare(param_path=path).fit(dataset=toydata)
+        finally:
+            os.umask(umask)
+        assert path.stat().st_mode & 0o777 == 0o644
+
+        # the mode of the existing file is kept
+        path.chmod(0o640)
+        HotellingTSquare(param_path=path).fit(dataset=toydata)
+        assert path.stat().st_mode & 0o777 == 0o640
+
+
 ######################################################################
 
 if __name__ == "__main__":
@@ -0,0 +1,112 @@
+"""Test of archive.py
+
+Usage:
+- pytest test_archive.py
+- pytest
+
+---
+
+KazutoMakino
+
+"""
+
+
+import json
+import sys
+import tempfile
+import traceback
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent))
+if True:
+    from archive import SensorArchive
+    from line_parser import LineParser
+
+######################################################################
+# main
+######################################################################
+
+
+def main():
+    test_convert_and_read()
+    test_empty_session()
+
+
+######################################################################
+# modules
+######################################################################
+
+
+def test_convert_and_read():
+    src = Path(__file__).parent / "data" / "20220118192914980961.txt"
+    expected = LineParser().read_columns(source=src)
+    tstart, tend = expected["TimeStamp"][100], expected["TimeStamp"][200]
+
+    for fmt in ["npy", "parquet"]:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            sa = SensorArchive(root=tmpdir, fmt=fmt)
+            session = sa.convert(src=src)
+
+            # the same source is not archived twice
+            assert sa.convert(src=src) == session
+            assert sa.list_sessions() == [session]
+
+            # all columns
+            data = sa.read(session=session)
+            print(fmt, data)
+            for k, v in expected.items():
+                assert np.array_equal(data[k], v)
+
+            # column pruning and time range
+            data = sa.read(
+                session=session, columns=["Humidity[%]"], tstart=tstart, tend=tend
+            )
+            assert list(data.keys()) == ["Humidity[%]"]
+            assert np.array_equal(data["Humidity[%]"], expected["Humidity[%]"][100:200])
+            if fmt == "npy":
+                assert isinstance(data["Humidity[%]"], np.memmap)
+            del data
+
+            # blocks of rows
+            blocks = list(
+                sa.iter_blocks(session=session, columns=["TimeStamp"], block_rows=100)
+            )
+            assert max(len(v["TimeStamp"]) for v in blocks) <= 100
+            assert np.array_equal(
+                np.concatenate([v["TimeStamp"] for v in blocks]),
+                expected["TimeStamp"],
+            )
+            del blocks
+
+
+def test_empty_session():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # a log without samples (e.g. only boot messages) is not archived
+        src = Path(tmpdir) / "boot.txt"
+        src.write_text("M5Stack initializing...OK\n", encoding="utf-8")
+        sa = SensorArchive(root=Path(tmpdir) / "archive")
+        assert sa.convert(src=src) is None
+        assert sa.list_sessions() == []
+
+        # an empty session written by older versions is read as empty
+        sdir = Path(tmpdir) / "archive" / "old"
+        sdir.mkdir(parents=True)
+        meta = {"format": "npy", "columns": None, "n_rows": 0, "sorted": True}
+        (sdir / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+        assert sa.read(session="old") == {}
+        data = sa.read(session="old", columns=["TimeStamp", "Humidity[%]"])
+        assert data["TimeStamp"].dtype == np.int64
+        assert len(data["Humidity[%]"]) == 0
+        assert list(sa.iter_blocks(session="old", columns=["Humidity[%]"])) == []
+
+
+######################################################################
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception:
+        traceback.print_exc()
+    sys.exit()
@@ -0,0 +1,86 @@
+"""Test of benchmark.py
+
+Usage:
+- pytest test_benchmark.py
+- pytest
+
+---
+
+KazutoMakino
+
+"""
+
+
+import sys
+import traceback
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+if True:
+    from benchmark import compare, run_benchmarks
+
+######################################################################
+# main
+######################################################################
+
+
+def main():
+    test_run_benchmarks()
+    test_compare()
+
+
+######################################################################
+# modules
+######################################################################
+
+SRC = Path(__file__).parent / "data" / "20220118192914980961.txt"
+
+
+def test_run_benchmarks():
+    results = run_benchmarks(
+        sources=[SRC], repeat=1, cases=["parse_line", "window_extend", "score_batch"]
+    )
+    assert list(results["cases"]) == ["parse_line", "window_extend", "score_batch"]
+    for v in results["cases"].values():
+        assert v["n"] > 0
+        assert v["best_s"] <= v["median_s"]
+        assert v["per_item_us"] > 0
+    assert results["meta"]["bytes"] == SRC.stat().st_size
+
+    # unknown cases
+    try:
+        run_benchmarks(sources=[SRC], repeat=1, cases=["unknown"])
+        assert False
+    except KeyError:
+        pass
+
+
+def test_compare():
+    baseline = {
+        "cases": {
+            "a": {"per_item_us": 1.0},
+            "b": {"per_item_us": 1.0},
+            "c": {"per_item_us": 1.0},
+        }
+    }
+    results = {
+        "cases": {
+            "a": {"per_item_us": 1.1},
+            "b": {"per_item_us": 1.5},
+            "d": {"per_item_us": 9.9},
+        }
+    }
+    report = compare(results=results, baseline=baseline, tolerance=0.2)
+    assert list(report) == ["a", "b"]
+    assert not report["a"]["regression"]
+    assert report["b"]["regression"]
+    assert abs(report["b"]["ratio"] - 1.5) < 1e-12
+
+
+######################################################################
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception:
+        traceback.print_exc()
@@ -0,0 +1,171 @@
+"""Test of detectors.py
+
+Usage:
+- pytest test_detectors.py
+- pytest
+
+---
+
+KazutoMakino
+
+"""
+
+
+import sys
+import traceback
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent))
+if True:
+    from detectors import CUSUM, DETECTORS, EWMA, RollingZScore
+
+######################################################################
+# main
+######################################################################
+
+
+def main():
+    test_ewma()
+    test_cusum()
+    test_rolling_zscore()
+    test_warmup()
+    test_interface()
+
+
+######################################################################
+# modules
+######################################################################
+
+
+def make_data(n: int = 2000, shift: float = 1.0, seed: int = 0) -> np.ndarray:
+    """Normal(50, 2) samples whose level is shifted by shift [sigma] at n // 2."""
+    rng = np.random.default_rng(seed=seed)
+    data = rng.normal(loc=50.0, scale=2.0, size=n)
+    data[n // 2 :] += shift * 2.0
+    return data
+
+
+def test_ewma():
+    data = make_data()
+    ewma = EWMA(lam=0.1, threshold=3.0, mean=50.0, std=2.0)
+    scores = ewma.score_batch(data=data)
+
+    # the same as the definition
+    lam, z, expected = 0.1, 50.0, []
+    for t, v in enumerate(data, start=1):
+        z = lam * v + (1 - lam) * z
+        sigma = 2.0 * np.sqrt(lam / (2 - lam) * (1 - (1 - lam) ** (2 * t)))
+        expected.append(abs(z - 50.0) / sigma)
+    assert np.allclose(scores, expected)
+
+    # a 1 sigma shift inside the band of raw values is detected
+    normals = ewma.is_normal_batch(anomaly_scores=scores)
+    assert normals[: len(data) // 2].mean() > 0.99
+    assert normals[len(data) // 2 + 50 :].mean() < 0.2
+    assert np.all(np.abs(data[: len(data) // 2] - 50.0) < 4 * 2.0)
+
+
+def test_cusum():
+    data = make_data()
+    cusum = CUSUM(k=0.5, threshold=5.0, mean=50.0, std=2.0)
+    scores = cusum.score_batch(data=data)
+
+    # the same as the definition
+    s_pos, s_neg, expected = 0.0, 0.0, []
+    for v in (data - 50.0) / 2.0:
+        s_pos = min(max(0.0, s_pos + v - 0.5), 10.0)
+        s_neg = min(max(0.0, s_neg - v - 0.5), 10.0)
+        expected.append(max(s_pos, s_neg))
+    assert np.allclose(scores, expected)
+
+    # a 1 sigma shift is detected, and kept until the level returns
+    normals = cusum.is_normal_batch(anomaly_scores=scores)
+    assert normals[: len(data) // 2].mean() > 0.95
+    assert normals[len(data) // 2 + 50 :].mean() < 0.05
+    assert scores.max() == 10.0
+    scores = cusum.score_batch(data=np.full(20, 50.0))
+    assert scores[-1] == 0.0
+
+    # reset
+    cusum.reset()
+    assert cusum.s_pos == cusum.s_neg == 0.0
+
+
+def test_rolling_zscore():
+    data = make_data(n=500)
+    data[300] += 20.0
+    rzs = RollingZScore(window=50, threshold=3.0, min_periods=10)
+    scores = rzs.score_batch(data=data)
+
+    # the same as the window before each sample
+    for t, v in enumerate(data):
+        window = data[max(t - 50, 0) : t]
+        if len(window) < 10:
+            assert scores[t] == 0.0
+        else:
+            assert np.isclose(scores[t], abs(v - window.mean()) / window.std(ddof=1))
+    assert np.isclose(rzs.mean, data[-50:].mean())
+
+    # a spike is detected
+    normals = rzs.is_normal_batch(anomaly_scores=scores)
+    assert not normals[300]
+    assert normals.mean() > 0.98
+
+    # constant windows
+    rzs = RollingZScore(window=5, min_periods=2)
+    assert rzs.score_batch(data=np.array([1.0, 1.0, 1.0]))[-1] == 0.0
+    assert rzs.get_anomaly_score(data=2.0) == np.inf
+
+
+def test_warmup():
+    data = make_data(n=400, shift=0.0)
+
+    # the baseline is estimated by the first samples
+    for cls in [EWMA, CUSUM]:
+        det = cls(warmup=100)
+        scores = det.score_batch(data=data)
+        assert np.all(scores[:100] == 0.0)
+        assert np.isclose(det.mean, data[:100].mean())
+        assert np.isclose(det.std, data[:100].std(ddof=1))
+        ref = cls(mean=det.mean, std=det.std)
+        assert np.allclose(scores[100:], ref.score_batch(data=data[100:]))
+
+        # the given mean is kept
+        det = cls(mean=50.0, warmup=100)
+        det.score_batch(data=data[:100])
+        assert det.mean == 50.0
+        det.reset()
+        assert not det.is_ready
+
+    for kwargs in [{"std": 0.0}, {"warmup": 1}, {"lam": 0.0}]:
+        try:
+            EWMA(**kwargs)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"ValueError is not raised: {kwargs}")
+
+
+def test_interface():
+    data = make_data(n=300)
+    for name, cls in DETECTORS.items():
+        kwargs = {"mean": 50.0, "std": 2.0} if cls.has_baseline else {}
+
+        # one by one == at once
+        det_sample, det_batch = cls(**kwargs), cls(**kwargs)
+        scores = [det_sample.get_anomaly_score(data=v) for v in data.tolist()]
+        assert np.array_equal(scores, det_batch.score_batch(data=data)), name
+        results = [det_sample.is_normal(anomaly_score=v) for v in scores]
+        assert np.array_equal(results, det_batch.is_normal_batch(scores)), name
+        assert det_sample.is_multivariate is False
+
+
+######################################################################
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception:
+        traceback.print_exc()
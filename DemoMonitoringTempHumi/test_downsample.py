@@ -0,0 +1,123 @@
+"""Test of downsample.py
+
+Usage:
+- pytest test_downsample.py
+- pytest
+
+---
+
+KazutoMakino
+
+"""
+
+
+import sys
+import traceback
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent))
+if True:
+    from downsample import downsample, lttb, minmax
+
+######################################################################
+# main
+######################################################################
+
+
+def main():
+    test_lttb()
+    test_minmax()
+    test_downsample()
+
+
+######################################################################
+# modules
+######################################################################
+
+
+def get_data(n: int = 10000) -> tuple:
+    rng = np.random.default_rng(seed=0)
+    x = np.arange(n, dtype=np.float64)
+    y = np.sin(x * 1e-3) + rng.random(n) * 0.1
+    y[1234] = 10.0
+    y[5678] = -10.0
+    return x, y
+
+
+def test_lttb():
+    x, y = get_data()
+    idx = lttb(x=x, y=y, n_out=100)
+    assert len(idx) == 100
+    assert idx[0] == 0 and idx[-1] == len(y) - 1
+    assert np.all(np.diff(idx) > 0)
+
+    # spikes make the largest triangles
+    assert 1234 in idx and 5678 in idx
+
+    # the same as the naive implementation
+    edges = np.linspace(1, len(y) - 1, 99).astype(np.int64)
+    expected = [0]
+    for k in range(98):
+        s, e = edges[k], edges[k + 1]
+        if k < 97:
+            ax, ay = x[e : edges[k + 2]].mean(), y[e : edges[k + 2]].mean()
+        else:
+            ax, ay = x[-1], y[-1]
+        a = expected[-1]
+        area = [
+            abs((x[a] - ax) * (y[j] - y[a]) - (x[a] - x[j]) * (ay - y[a]))
+            for j in range(s, e)
+        ]
+        expected.append(s + int(np.argmax(area)))
+    expected.append(len(y) - 1)
+    assert np.array_equal(idx, expected)
+
+    # not reduced
+    assert np.array_equal(lttb(x=x[:50], y=y[:50], n_out=100), np.arange(50))
+
+
+def test_minmax():
+    x, y = get_data()
+    idx = minmax(x=x, y=y, n_out=100)
+    assert len(idx) <= 101
+    assert idx[0] == 0 and idx[-1] == len(y) - 1
+    assert np.all(np.diff(idx) > 0)
+
+    # the minimum and maximum of all buckets are kept
+    assert y[idx].max() == y.max() and y[idx].min() == y.min()
+    for s, e in zip(range(0, 10000, 200), range(200, 10200, 200)):
+        assert y[s:e].max() in y[idx] and y[s:e].min() in y[idx]
+
+
+def test_downsample():
+    x, y = get_data()
+    tstamps = (1_600_000_000_000_000_000 + x * 1e8).astype(np.int64)
+
+    # columns sharing the time stamps
+    idx = downsample(x=tstamps, ys=[y, -y], n_out=100, method="lttb")
+    assert np.array_equal(
+        idx,
+        np.union1d(lttb(x=x * 1e8, y=y, n_out=100), lttb(x=x * 1e8, y=-y, n_out=100)),
+    )
+
+    # not reduced
+    assert len(downsample(x=tstamps, ys=[y], n_out=100, method=None)) == len(y)
+    assert len(downsample(x=tstamps, ys=[y], n_out=0, method="lttb")) == len(y)
+
+    # invalid method
+    try:
+        downsample(x=tstamps, ys=[y], n_out=100, method="unknown")
+        assert False
+    except ValueError:
+        pass
+
+
+######################################################################
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception:
+        traceback.print_exc()
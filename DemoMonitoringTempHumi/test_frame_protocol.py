@@ -0,0 +1,136 @@
+"""Test of frame_protocol.py
+
+Usage:
+- pytest test_frame_protocol.py
+- pytest
+
+---
+
+KazutoMakino
+
+"""
+
+
+import sys
+import traceback
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent))
+if True:
+    from frame_protocol import (
+        FRAME_SIZE,
+        FrameDecoder,
+        crc8,
+        encode_frame,
+        get_frames_end,
+    )
+
+######################################################################
+# main
+######################################################################
+
+
+def main():
+    test_crc8()
+    test_feed()
+    test_resync()
+    test_get_frames_end()
+
+
+######################################################################
+# modules
+######################################################################
+
+
+def get_frames(seqs: list) -> bytes:
+    # 2022/01/18 18:05:40.016290 (seconds since 2000/01/01)
+    return b"".join(
+        encode_frame(
+            seq=v,
+            sec=695844340 + v,
+            usec=16290,
+            ticks=55832 + 1000 * v,
+            t_raw=0x6666,
+            h_raw=0x8000,
+        )
+        for v in seqs
+    )
+
+
+def test_crc8():
+    # example of the SHT3x datasheet
+    assert crc8(data=b"\xbe\xef") == 0x92
+    assert len(get_frames(seqs=[0])) == FRAME_SIZE == 21
+
+
+def test_feed():
+    data = get_frames(seqs=range(10))
+    fd = FrameDecoder()
+
+    # split at any position
+    chunks = [fd.feed(data=data[i : i + 8]) for i in range(0, len(data), 8)]
+    ret = {k: np.concatenate([v[k] for v in chunks]) for k in chunks[0]}
+    print(ret)
+    assert ret["TimeStamp"][0] == np.datetime64(
+        "2022-01-18T18:05:40.016290", "ns"
+    ).astype(np.int64)
+    assert np.allclose(ret["ElapsedTime[s]"], 55.832 + np.arange(10))
+    assert np.allclose(ret["Temperature[degC]"], -45 + 175 * 0x6666 / 65535)
+    assert np.allclose(ret["Humidity[%]"], 100 * 0x8000 / 65535)
+    assert fd.get_stats()["frames"] == 10
+    assert fd.get_stats()["skipped_bytes"] == 0
+
+
+def test_resync():
+    frames = get_frames(seqs=[0, 1, 2, 3, 5, 6])
+    broken = bytearray(frames[3 * FRAME_SIZE : 4 * FRAME_SIZE])
+    broken[10] ^= 0xFF
+    data = (
+        b"now restarting...\r\n\xa5\x5a"
+        + frames[: 3 * FRAME_SIZE]
+        + bytes(broken)
+        + b"\xa5"
+        + frames[4 * FRAME_SIZE :]
+    )
+    fd = FrameDecoder()
+    ret = fd.feed(data=data)
+    assert len(ret["TimeStamp"]) == 5
+    stats = fd.get_stats()
+    print(stats)
+    assert stats["skipped_bytes"] == 21 + FRAME_SIZE + 1
+    assert stats["gaps"] == 1
+    assert stats["lost"] == 2
+
+
+def test_get_frames_end():
+    frames = get_frames(seqs=[0, 1, 2])
+    n = len(frames)
+
+    # complete frames (also if the last byte of the crc is the magic)
+    assert get_frames_end(data=frames) == n
+    assert get_frames_end(data=b"") == 0
+    assert get_frames_end(data=b"now restarting...\r\n") == 19
+
+    # an incomplete frame at the end is excluded
+    for i in range(1, FRAME_SIZE):
+        assert get_frames_end(data=frames + frames[:i]) == n
+        assert get_frames_end(data=frames[: n - i]) == n - FRAME_SIZE
+
+    # the magic in the last valid frame is not the start of a frame
+    frame = encode_frame(
+        seq=0x5AA5, sec=695844340, usec=0, ticks=0, t_raw=0xA5, h_raw=0x5A
+    )
+    assert frame.count(b"\xa5\x5a") > 1
+    assert get_frames_end(data=frames + frame) == n + FRAME_SIZE
+
+
+######################################################################
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception:
+        traceback.print_exc()
+    sys.exit()
@@ -0,0 +1,168 @@
+"""Test of ingest.py
+
+Usage:
+- pytest test_ingest.py
+- pytest
+
+---
+
+KazutoMakino
+
+"""
+
+
+import sys
+import threading
+import time
+import traceback
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+if True:
+    from ingest import BoundedQueue, IngestWorker
+
+######################################################################
+# main
+######################################################################
+
+
+def main():
+    test_overflow_policy()
+    test_block()
+    test_ingest_worker()
+    test_slow_consumer()
+    test_shared_queue()
+
+
+######################################################################
+# modules
+######################################################################
+
+
+def test_overflow_policy():
+    # drop-oldest
+    q = BoundedQueue(maxsize=3, policy="drop-oldest")
+    for v in range(5):
+        assert q.put(item=v)
+    assert q.drain() == [2, 3, 4]
+    assert q.get_stats()["dropped"] == 2
+
+    # coalesce
+    q = BoundedQueue(maxsize=3, policy="coalesce")
+    for v in range(5):
+        assert q.put(item=v)
+    assert q.drain() == [0, 1, 4]
+    assert q.get_stats()["coalesced"] == 2
+    assert q.get_stats()["max_depth"] == 3
+
+    # coalesce with tagged items (only items of the same tag are replaced)
+    q = BoundedQueue(maxsize=1, policy="coalesce", key=lambda item: item[0])
+    assert q.put(item=("a", 1)) and q.put(item=("b", 2))
+    assert q.drain() == [("b", 2)]
+    assert q.get_stats()["dropped"] == 1
+    q = BoundedQueue(maxsize=3, policy="coalesce", key=lambda item: item[0])
+    for item in [("a", 0), ("b", 0), ("a", 1), ("a", 2), ("b", 1)]:
+        assert q.put(item=item)
+    assert q.drain() == [("a", 0), ("b", 1), ("a", 2)]
+    assert q.get_stats()["coalesced"] == 2
+
+
+def test_block():
+    q = BoundedQueue(maxsize=2, policy="block")
+    assert q.put(item=0) and q.put(item=1)
+
+    # timeout
+    assert not q.put(item=2, timeout=0.01)
+
+    # released by the consumer
+    t = threading.Timer(interval=0.05, function=q.drain)
+    t.start()
+    assert q.put(item=2, timeout=5)
+    t.join()
+    assert q.drain() == [2]
+
+    # released by closing
+    q.put(item=3)
+    q.put(item=4)
+    threading.Timer(interval=0.05, function=q.close).start()
+    assert not q.put(item=5, timeout=5)
+
+
+def test_ingest_worker():
+    items = iter([{"v": 0}, "continue", {"v": 1}, {"v": 2}])
+    q = BoundedQueue(maxsize=10, policy="block")
+    w = IngestWorker(source=lambda: next(items, None), queue=q)
+    w.start()
+    w.join(timeout=5)
+    assert not w.is_alive()
+    assert q.drain(timeout=1) == [{"v": 0}, {"v": 1}, {"v": 2}]
+    assert w.get_stats()["skipped"] == 1
+
+    # an error of the source is kept and the queue is closed
+    def source():
+        raise RuntimeError("disconnected")
+
+    q = BoundedQueue(maxsize=10)
+    w = IngestWorker(source=source, queue=q)
+    w.start()
+    w.join(timeout=5)
+    assert isinstance(w.error, RuntimeError)
+    assert q.drain(timeout=1) == []
+
+
+def test_slow_consumer():
+    # timeouts of "block" are retried, so no items are lost
+    q = BoundedQueue(maxsize=2, policy="block")
+    items = iter(range(20))
+    w = IngestWorker(source=lambda: next(items, None), queue=q, put_timeout=0.005)
+    w.start()
+    ret = []
+    while w.is_alive() or len(q):
+        ret += q.drain(timeout=0.1)
+        time.sleep(0.02)
+    assert ret == list(range(20))
+    assert q.get_stats()["blocked"] > 0
+    assert q.get_stats()["dropped"] == 0
+
+    # the item is dropped when the worker is stopped while blocking
+    q = BoundedQueue(maxsize=1, policy="block")
+    w = IngestWorker(source=lambda: 0, queue=q, close_queue=False, put_timeout=0.005)
+    w.start()
+    time.sleep(0.05)
+    w.stop(timeout=5)
+    assert not w.is_alive()
+    assert q.get_stats()["dropped"] == 1
+
+
+def test_shared_queue():
+    # workers of devices share the queue (items are tagged by device ids)
+    q = BoundedQueue(maxsize=100, policy="block")
+    workers = [
+        IngestWorker(
+            source=(lambda it=iter(range(10)): next(it, None)),
+            queue=q,
+            tag=device_id,
+            close_queue=False,
+        )
+        for device_id in ["a", "b"]
+    ]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join(timeout=5)
+
+    # the queue is not closed by workers
+    assert not q.closed
+    items = q.drain()
+    for device_id in ["a", "b"]:
+        assert [v for k, v in items if k == device_id] == list(range(10))
+
+
+######################################################################
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception:
+        traceback.print_exc()
+    sys.exit()
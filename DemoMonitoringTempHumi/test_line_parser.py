@@ -0,0 +1,128 @@
+"""Test of line_parser.py
+
+Usage:
+- pytest test_line_parser.py
+- pytest
+
+---
+
+KazutoMakino
+
+"""
+
+
+import io
+import sys
+import traceback
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent))
+if True:
+    from line_parser import LineParser
+
+######################################################################
+# main
+######################################################################
+
+
+def main():
+    test_parse_line()
+    test_parse_chunk()
+    test_iter_chunks()
+    test_feed()
+
+
+######################################################################
+# modules
+######################################################################
+
+LINES = (
+    b"now restarting...\n"
+    b"TimeStamp: 2022/01/18 18:05:40.16290, ElapsedTime[s]: 55.832, "
+    b"Temperature[degC]: 20.95178, Humidity[%]: 54.64256\r\n"
+    b"TimeStamp: 2022/01/1\n"
+    b"TimeStamp: 2022/01/18 18:05:41.353380, ElapsedTime[s]: 5.7169e1, "
+    b"Temperature[degC]: -0.5, Humidity[%]: 54.59526\n"
+    b"TimeStamp: 2022/01/18 18:05:42.1, ElapsedTime[s]: x, "
+    b"Temperature[degC]: 20.9, Humidity[%]: 54.5\n"
+    b"TimeStamp: 2022/01/18 18:05:43.2, ElapsedTime[s]: 58.5, "
+    b"Temperature[degC]: 21, Humidity[%]: 54.5"
+)
+
+
+def test_parse_line():
+    lp = LineParser()
+    data_dict = lp.parse_line(line=LINES.split(b"\n")[1])
+    print(data_dict)
+    assert data_dict["TimeStamp"] == np.datetime64(
+        "2022-01-18T18:05:40.016290", "ns"
+    ).astype(np.int64)
+    assert data_dict["Humidity[%]"] == 54.64256
+    assert lp.parse_line(line="now restarting...") is None
+    assert lp.parse_line(line="TimeStamp: 2022/01/1") is None
+
+    # a broken time after a valid line of the same day (the date is cached)
+    line = LINES.split(b"\n")[1].decode()
+    tstamp = line.split(", ")[0][len("TimeStamp: ") :]
+    for broken in [
+        tstamp[:11] + "18505:4016290",
+        tstamp[:13] + "-" + tstamp[14:],
+        tstamp[:17] + "4x" + tstamp[19:],
+        tstamp[:20] + " 16290",
+    ]:
+        assert lp.parse_line(line=line.replace(tstamp, broken)) is None, broken
+    assert lp.parse_line(line=line) is not None
+
+
+def test_parse_chunk():
+    lp = LineParser()
+    data = lp.parse_chunk(data=LINES)
+    print(data)
+    assert list(data.keys()) == [
+        "TimeStamp",
+        "ElapsedTime[s]",
+        "Temperature[degC]",
+        "Humidity[%]",
+    ]
+    assert data["TimeStamp"].dtype == np.int64
+    assert data["TimeStamp"].view("datetime64[ns]").tolist() == [
+        np.datetime64("2022-01-18T18:05:40.016290", "ns").tolist(),
+        np.datetime64("2022-01-18T18:05:41.353380", "ns").tolist(),
+        np.datetime64("2022-01-18T18:05:43.000002", "ns").tolist(),
+    ]
+    assert data["ElapsedTime[s]"].tolist() == [55.832, 57.169, 58.5]
+    assert data["Temperature[degC]"].tolist() == [20.95178, -0.5, 21.0]
+    assert lp.n_skipped == 3
+
+
+def test_iter_chunks():
+    data = LINES * 100
+    lp = LineParser()
+    expected = lp.parse_chunk(data=data)
+    chunks = list(lp.iter_chunks(source=io.BytesIO(data), chunk_size=1000))
+    assert len(chunks) > 1
+    for k, v in expected.items():
+        assert np.array_equal(np.concatenate([c[k] for c in chunks]), v)
+
+
+def test_feed():
+    # batches of lines split at any position
+    lp = LineParser()
+    expected = LineParser().parse_chunk(data=LINES)
+    chunks = [lp.feed(data=LINES[i : i + 50]) for i in range(0, len(LINES), 50)]
+    chunks.append(lp.feed(data=b"\n"))
+    chunks = [v for v in chunks if v]
+    for k, v in expected.items():
+        assert np.array_equal(np.concatenate([c[k] for c in chunks]), v)
+
+
+######################################################################
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception:
+        traceback.print_exc()
+    sys.exit()
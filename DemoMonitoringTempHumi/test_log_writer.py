@@ -0,0 +1,110 @@
+"""Test of log_writer.py
+
+Usage:
+- pytest test_log_writer.py
+- pytest
+
+---
+
+KazutoMakino
+
+"""
+
+
+import gzip
+import sys
+import tempfile
+import time
+import traceback
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+if True:
+    from log_writer import LogWriter
+
+######################################################################
+# main
+######################################################################
+
+
+def main():
+    test_flush()
+    test_count_lines()
+    test_rotate()
+
+
+######################################################################
+# modules
+######################################################################
+
+LINE = "TimeStamp: 2022/01/18 18:05:40.16290, Humidity[%]: 54.64256\n"
+
+
+def test_flush():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / "test.log"
+        w = LogWriter(path=path, flush_lines=3, flush_interval=0.05)
+
+        # buffered until the number of lines
+        w.write(txt=LINE)
+        w.write(txt=LINE)
+        assert path.read_text() == ""
+        w.write(txt=LINE)
+        assert path.read_text() == LINE * 3
+
+        # flushed by the time
+        w.write(txt=LINE)
+        time.sleep(0.06)
+        w.poll()
+        assert path.read_text() == LINE * 4
+
+        # appended after reopening
+        w.close()
+        with LogWriter(path=path) as w:
+            w.write(txt=LINE)
+        assert path.read_text() == LINE * 5
+
+
+def test_count_lines():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / "test.log"
+        with LogWriter(path=path, flush_lines=3, flush_interval=0.05) as w:
+            # lines in a chunk are counted
+            w.write(txt=LINE * 2)
+            assert path.read_text() == ""
+            w.write(txt=LINE * 2)
+            assert path.read_text() == LINE * 4
+
+            # records without line endings are flushed by the time
+            w.write(txt=b"\xa5\x5a", n_lines=0)
+            assert path.read_text() == LINE * 4
+            time.sleep(0.06)
+            w.poll()
+            assert path.read_bytes() == LINE.encode() * 4 + b"\xa5\x5a"
+
+
+def test_rotate():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / "test.log"
+        with LogWriter(
+            path=path, max_bytes=len(LINE) * 4, fsync="flush", compress="gzip"
+        ) as w:
+            for _ in range(10):
+                w.write(txt=LINE)
+        assert len(w.segments) == 2
+        for v in w.segments:
+            assert v.suffix == ".gz"
+            with gzip.open(v, mode="rt") as f:
+                assert f.read() == LINE * 4
+        assert path.read_text() == LINE * 2
+        assert len(list(Path(tmpdir).iterdir())) == 3
+
+
+######################################################################
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception:
+        traceback.print_exc()
+    sys.exit()
@@ -0,0 +1,105 @@
+"""Test of metrics.py
+
+Usage:
+- pytest test_metrics.py
+- pytest
+
+---
+
+KazutoMakino
+
+"""
+
+
+import math
+import sys
+import threading
+import traceback
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+if True:
+    from metrics import Histogram, Metrics
+
+######################################################################
+# main
+######################################################################
+
+
+def main():
+    test_histogram()
+    test_metrics()
+    test_collect()
+
+
+######################################################################
+# modules
+######################################################################
+
+
+def test_histogram():
+    hist = Histogram(buckets=[1, 2, 4])
+    assert math.isnan(hist.quantile(q=0.5))
+
+    # le: value <= upper bound
+    for v in [0.5, 1, 1.5, 3, 3, 10]:
+        hist.observe(value=v)
+    assert hist.counts == [2, 1, 2, 1]
+    assert hist.get_cumulative() == [("1.0", 2), ("2.0", 3), ("4.0", 5), ("+Inf", 6)]
+    assert hist.count == 6
+    assert hist.sum == 19
+    assert hist.max == 10
+
+    # interpolated in the bucket, the maximum in +Inf
+    assert hist.quantile(q=0.5) == 2.0
+    assert hist.quantile(q=0.75) == 3.5
+    assert hist.quantile(q=1.0) == 10
+
+
+def test_metrics():
+    metrics = Metrics()
+
+    # observed from threads
+    def func():
+        for _ in range(1000):
+            metrics.observe(stage="parse", seconds=1e-4)
+            metrics.inc(name="samples", value=2)
+
+    ths = [threading.Thread(target=func) for _ in range(4)]
+    for th in ths:
+        th.start()
+    for th in ths:
+        th.join()
+    with metrics.time(stage="plot"):
+        pass
+
+    stats = metrics.get_stats()
+    assert stats["counters"] == {"samples": 8000}
+    assert stats["stages"]["parse"]["count"] == 4000
+    assert abs(stats["stages"]["parse"]["mean[ms]"] - 0.1) < 1e-9
+    assert abs(stats["stages"]["parse"]["max[ms]"] - 0.1) < 1e-9
+    assert stats["stages"]["plot"]["count"] == 1
+
+
+def test_collect():
+    from prometheus_client import CollectorRegistry, generate_latest
+
+    metrics = Metrics(prefix="test")
+    metrics.observe(stage="parse", seconds=3e-3)
+    metrics.inc(name="resyncs")
+    registry = CollectorRegistry(auto_describe=False)
+    registry.register(metrics)
+    txt = generate_latest(registry).decode()
+    assert 'test_stage_seconds_bucket{le="0.001",stage="parse"} 0.0' in txt
+    assert 'test_stage_seconds_bucket{le="0.005",stage="parse"} 1.0' in txt
+    assert 'test_stage_seconds_count{stage="parse"} 1.0' in txt
+    assert "test_resyncs_total 1.0" in txt
+
+
+######################################################################
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception:
+        traceback.print_exc()
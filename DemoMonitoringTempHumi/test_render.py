@@ -0,0 +1,166 @@
+"""Test of render.py
+
+Usage:
+- pytest test_render.py
+- pytest
+
+---
+
+KazutoMakino
+
+"""
+
+
+import sys
+import time
+import traceback
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).parent))
+if True:
+    from render import MatplotlibRenderer, RenderScheduler, StreamlitChart
+    from ring_buffer import RingBuffer
+
+######################################################################
+# main
+######################################################################
+
+
+def main():
+    test_scheduler()
+    test_matplotlib_renderer()
+    test_streamlit_chart()
+
+
+######################################################################
+# modules
+######################################################################
+
+
+def test_scheduler():
+    # 20 [fps]: 5 frames take 4 intervals at least
+    scheduler = RenderScheduler(max_fps=20)
+    tstart = time.perf_counter()
+    for _ in range(5):
+        scheduler.wait()
+    assert time.perf_counter() - tstart >= 4 * 0.05 - 1e-3
+    assert scheduler.n_frames == 5
+
+    # slow frames are not waited
+    time.sleep(0.06)
+    assert scheduler.wait() == 0
+
+    # not limited
+    scheduler = RenderScheduler(max_fps=0)
+    assert all(scheduler.wait() == 0 for _ in range(10))
+
+
+def test_matplotlib_renderer():
+    cols = ["Temperature[degC]", "Humidity[%]"]
+    window = RingBuffer(columns=cols, capacity=100)
+    t0 = 1_600_000_000_000_000_000
+    tstamps = t0 + np.arange(50, dtype=np.int64) * 1_000_000_000
+    values = {cols[0]: 20 + np.sin(np.arange(50)), cols[1]: np.linspace(40, 60, 50)}
+    window.extend(tstamps=tstamps, values=values)
+    windows = {"room1": window}
+
+    # the first frame: full drawing
+    renderer = MatplotlibRenderer()
+    image = renderer.update(windows=windows).copy()
+    assert image.shape == (500, 1200, 4)
+    assert (renderer.n_full, renderer.n_blit) == (1, 0)
+    line = renderer.lines[("room1", cols[1])]
+    assert np.array_equal(line.get_ydata(), values[cols[1]])
+    lo, hi = renderer.axes[1].get_ylim()
+    assert lo < 40 and 60 < hi
+
+    # in the limits: only lines are drawn on the cached background
+    assert np.array_equal(renderer.update(windows=windows), image)
+    assert (renderer.n_full, renderer.n_blit) == (1, 1)
+
+    # out of the limits: full drawing
+    window.append(tstamp=int(tstamps[-1]) + 3600_000_000_000, values={cols[1]: 80})
+    renderer.update(windows=windows)
+    assert (renderer.n_full, renderer.n_blit) == (2, 1)
+    assert renderer.axes[1].get_ylim()[1] > 80
+
+    # lines of a new device
+    windows["room2"] = window
+    renderer.update(windows=windows, max_points=10, method="minmax")
+    assert len(renderer.lines) == 4
+    # (the union of indices of 2 columns)
+    assert len(renderer.lines[("room2", cols[0])].get_xdata()) <= 2 * 11
+
+
+class FakeChart:
+    def __init__(self, data) -> None:
+        self.data = data
+
+    def add_rows(self, data) -> None:
+        self.data = pd.concat([self.data, data])
+
+
+class FakePlaceholder:
+    def __init__(self, chart_class: type = FakeChart) -> None:
+        self.chart_class = chart_class
+        self.n_sent = 0
+
+    def line_chart(self, data, **kwargs):
+        self.n_sent += 1
+        return self.chart_class(data=data)
+
+
+def test_streamlit_chart():
+    index = pd.date_range("2022-01-01", periods=100, freq="s")
+    df = pd.DataFrame(data={"a @ 1": np.arange(100.0), "a @ 2": -np.arange(100.0)})
+    df.index = index
+
+    # append rows until rows exceed 2 * 10
+    placeholder = FakePlaceholder()
+    chart = StreamlitChart(placeholder=placeholder, capacity=10, trim_factor=2)
+    for i in range(10, 31):
+        n = chart.update(
+            new_rows=lambda: df.iloc[[i - 1], [0]], get_window=lambda: df[i - 10 : i]
+        )
+        assert n == (10 if i in [10, 21] else 1)
+    assert placeholder.n_sent == 2
+    assert chart.get_stats() == {"full": 2, "append": 19, "rows": 19, "rows_sent": 39}
+
+    # the chart has all rows (nan for columns without new rows)
+    data = chart.chart.data
+    assert data.index.equals(index[11:30])
+    assert list(data.columns) == ["a @ 1", "a @ 2"]
+    assert data["a @ 2"].isna().sum() == 9
+
+    # new columns: the window is sent
+    n = chart.update(
+        new_rows=lambda: df.rename(columns={"a @ 1": "b"})[30:31],
+        get_window=lambda: df[21:31],
+    )
+    assert n == 10 and placeholder.n_sent == 3
+
+    # full mode
+    placeholder = FakePlaceholder()
+    chart = StreamlitChart(placeholder=placeholder, capacity=10, mode="full")
+    for i in range(10, 20):
+        chart.update(new_rows=lambda: df[i - 1 : i], get_window=lambda: df[i - 10 : i])
+    assert placeholder.n_sent == 10
+
+    # add_rows is not supported: full mode
+    placeholder = FakePlaceholder(chart_class=pd.DataFrame)
+    chart = StreamlitChart(placeholder=placeholder, capacity=10)
+    for i in range(10, 13):
+        chart.update(new_rows=lambda: df[i - 1 : i], get_window=lambda: df[i - 10 : i])
+    assert chart.mode == "full" and placeholder.n_sent == 3
+
+
+######################################################################
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception:
+        traceback.print_exc()
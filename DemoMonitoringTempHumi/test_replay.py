@@ -0,0 +1,89 @@
+"""Test of replay.py
+
+Usage:
+- pytest test_replay.py
+- pytest
+
+---
+
+KazutoMakino
+
+"""
+
+
+import os
+import select
+import sys
+import threading
+import traceback
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent))
+if True:
+    from line_parser import LineParser
+    from replay import LogReplayer
+
+######################################################################
+# main
+######################################################################
+
+
+def main():
+    test_load()
+    test_run()
+
+
+######################################################################
+# modules
+######################################################################
+
+SRC = Path(__file__).parent / "data" / "20220118192914980961.txt"
+
+
+def test_load():
+    lines, times = LogReplayer.load(sources=[SRC])
+    assert b"".join(lines) == SRC.read_bytes().replace(b"\r\n", b"\n")
+    assert times[0] == 0
+    assert np.all(np.diff(times) >= 0)
+
+
+def test_run():
+    # pty is available only on POSIX
+    if os.name != "posix":
+        return
+
+    replayer = LogReplayer(sources=[SRC], speed=0, n_devices=2, restamp=True)
+    ports = replayer.open()
+
+    # read ports while replaying
+    th = threading.Thread(target=replayer.run, daemon=True)
+    th.start()
+    fds = [os.open(v, os.O_RDONLY | os.O_NOCTTY | os.O_NONBLOCK) for v in ports]
+    received = [b"", b""]
+    while th.is_alive() or any(select.select(fds, [], [], 0.1)[0]):
+        for fd in select.select(fds, [], [], 0.1)[0]:
+            received[fds.index(fd)] += os.read(fd, 1 << 16)
+    th.join(timeout=10)
+    for fd in fds:
+        os.close(fd)
+    replayer.close()
+
+    # the same values (time stamps are replaced by the sending time)
+    expected = LineParser().parse_chunk(data=SRC.read_bytes())
+    for v in received:
+        data = LineParser().parse_chunk(data=v)
+        assert np.array_equal(data["Humidity[%]"], expected["Humidity[%]"])
+        assert data["TimeStamp"][0] > expected["TimeStamp"][-1]
+    assert replayer.get_stats()["lines"] == len(replayer.lines)
+
+
+######################################################################
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception:
+        traceback.print_exc()
+    sys.exit()
@@ -0,0 +1,68 @@
+"""Test of ring_buffer.py
+
+Usage:
+- pytest test_ring_buffer.py
+- pytest
+
+---
+
+KazutoMakino
+
+"""
+
+
+import sys
+import traceback
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent))
+if True:
+    from ring_buffer import RingBuffer
+
+######################################################################
+# main
+######################################################################
+
+
+def main():
+    test_append()
+    test_extend()
+
+
+######################################################################
+# modules
+######################################################################
+
+
+def test_append():
+    rb = RingBuffer(columns=["a", "b"], capacity=5)
+    for i in range(12):
+        rb.append(tstamp=i, values={"a": i * 1.0, "b": -i * 1.0})
+    data = rb.to_dict()
+    print(data)
+    assert len(rb) == 5
+    assert data["TimeStamp"].tolist() == list(range(7, 12))
+    assert data["a"].tolist() == [7.0, 8.0, 9.0, 10.0, 11.0]
+    assert data["b"].base is not None
+
+
+def test_extend():
+    rb = RingBuffer(columns=["a"], capacity=4)
+    rb.append(tstamp=0, values={"a": 0.0})
+    rb.extend(tstamps=np.arange(1, 4), values={"a": np.arange(1, 4)})
+    assert rb.get_column("a").tolist() == [0.0, 1.0, 2.0, 3.0]
+    rb.extend(tstamps=np.arange(4, 14), values={})
+    assert rb.get_timestamps().tolist() == [10, 11, 12, 13]
+    assert np.isnan(rb.get_column("a")).all()
+
+
+######################################################################
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception:
+        traceback.print_exc()
+    sys.exit()
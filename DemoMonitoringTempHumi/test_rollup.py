@@ -0,0 +1,209 @@
+"""Test of rollup.py
+
+Usage:
+- pytest test_rollup.py
+- pytest
+
+---
+
+KazutoMakino
+
+"""
+
+
+import sys
+import tempfile
+import traceback
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent))
+if True:
+    from line_parser import TIME_KEY
+    from rollup import RollupStore
+
+######################################################################
+# main
+######################################################################
+
+
+def main():
+    test_aggregates()
+    test_persistence()
+    test_query()
+    test_out_of_order()
+
+
+######################################################################
+# modules
+######################################################################
+
+COLUMNS = ["Temperature[degC]", "Humidity[%]"]
+
+# 3 hours @ about 1.3 [s] (irregular) from 2022-01-18 19:29 (JST)
+T0 = 1642501740_000_000_000
+
+
+def make_data(n: int = 8000, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed=seed)
+    tstamps = T0 + np.cumsum(rng.integers(1_000_000_000, 1_600_000_000, size=n))
+    return {
+        TIME_KEY: tstamps,
+        COLUMNS[0]: 18 + rng.standard_normal(n).cumsum() * 0.01,
+        COLUMNS[1]: 70 + rng.standard_normal(n) * 2,
+    }
+
+
+def split(data: dict, sizes: list) -> list:
+    """Split data into chunks of sizes (cyclic)."""
+    chunks, i, j = [], 0, 0
+    while i < len(data[TIME_KEY]):
+        n = sizes[j % len(sizes)]
+        chunks.append({k: v[i : i + n] for k, v in data.items()})
+        i, j = i + n, j + 1
+    return chunks
+
+
+def test_aggregates():
+    data = make_data()
+    store = RollupStore(columns=COLUMNS, root=None)
+    for chunk in split(data, sizes=[1, 7, 2, 300, 5]):
+        store.update(device_id="dev", data=chunk)
+
+    # the same as numpy per bucket
+    for res, length in store.resolutions.items():
+        ret = store.query(device_id="dev", resolution=res)
+        buckets = data[TIME_KEY] // (length * 10**9) * (length * 10**9)
+        tbuckets, counts = np.unique(buckets, return_counts=True)
+        assert np.array_equal(ret[TIME_KEY], tbuckets)
+        assert np.array_equal(ret["count"], counts)
+        for i, t in enumerate(tbuckets.tolist()):
+            for k in COLUMNS:
+                v = data[k][buckets == t]
+                assert ret[f"{k}/min"][i] == v.min()
+                assert ret[f"{k}/max"][i] == v.max()
+                assert np.isclose(ret[f"{k}/mean"][i], v.mean())
+                if len(v) > 1:
+                    assert np.isclose(ret[f"{k}/std"][i], v.std(ddof=1))
+                else:
+                    assert np.isnan(ret[f"{k}/std"][i])
+
+    # the open bucket is the last one
+    ret = store.query(device_id="dev", resolution="1min", include_open=False)
+    assert ret[TIME_KEY][-1] < store.get_latest(device_id="dev")
+    assert store.get_latest(device_id="unknown") is None
+
+
+def test_persistence():
+    data = make_data()
+    chunks = split(data, sizes=[3, 50, 1])
+    half = len(chunks) // 2
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # all at once
+        with RollupStore(columns=COLUMNS, root=Path(tmpdir) / "a") as store:
+            for chunk in chunks:
+                store.update(device_id="dev/1", data=chunk)
+            expected = {
+                res: store.query(device_id="dev/1", resolution=res)
+                for res in store.resolutions
+            }
+
+        # stopped and restarted in the middle (the open buckets are reopened)
+        root = Path(tmpdir) / "b"
+        with RollupStore(columns=COLUMNS, root=root) as store:
+            for chunk in chunks[:half]:
+                store.update(device_id="dev/1", data=chunk)
+        with RollupStore(columns=COLUMNS, root=root) as store:
+            for chunk in chunks[half:]:
+                store.update(device_id="dev/1", data=chunk)
+
+        # files have a record per bucket (the open one is overwritten)
+        store = RollupStore(columns=COLUMNS, root=root)
+        for res, exp in expected.items():
+            ret = store.query(device_id="dev/1", resolution=res)
+            for k, v in exp.items():
+                assert np.allclose(ret[k], v, equal_nan=True), (res, k)
+            records = np.fromfile(root / "dev_1" / f"{res}.bin", dtype=store.dtype)
+            assert np.array_equal(records[TIME_KEY], exp[TIME_KEY])
+
+        # a partly written record is removed
+        path = root / "dev_1" / "1min.bin"
+        with path.open(mode="ab") as f:
+            f.write(b"\x00" * 5)
+        store = RollupStore(columns=COLUMNS, root=root)
+        ret = store.query(device_id="dev/1", resolution="1min")
+        assert np.array_equal(ret[TIME_KEY], expected["1min"][TIME_KEY])
+        assert path.stat().st_size % store.dtype.itemsize == 0
+
+        # other columns are not accepted
+        store = RollupStore(columns=COLUMNS[:1], root=root)
+        try:
+            store.query(device_id="dev/1")
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("ValueError is not raised")
+
+
+def test_query():
+    data = make_data()
+    store = RollupStore(columns=COLUMNS, root=None)
+    store.update(device_id="dev", data=data)
+
+    # [tstart, tend) of start times of buckets
+    tall = store.query(device_id="dev", resolution="1min")[TIME_KEY]
+    tstart, tend = int(tall[10]), int(tall[20])
+    ret = store.query(device_id="dev", resolution="1min", tstart=tstart, tend=tend)
+    assert np.array_equal(ret[TIME_KEY], tall[10:20])
+    ret = store.query(device_id="dev", resolution="1h", tstart=int(tall[-1]) + 1)
+    assert len(ret[TIME_KEY]) == 0
+
+    try:
+        store.query(device_id="dev", resolution="1s")
+    except KeyError:
+        pass
+    else:
+        raise AssertionError("KeyError is not raised")
+
+
+def test_out_of_order():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # the clock is stepped back in a chunk and between chunks
+        with RollupStore(columns=COLUMNS[:1], root=tmpdir) as store:
+            for tstamps in [[200, 10, 300], [250, 310, 100, 320]]:
+                store.update(
+                    device_id="dev",
+                    data={
+                        TIME_KEY: np.array(tstamps) * 10**9,
+                        COLUMNS[0]: np.ones(len(tstamps)),
+                    },
+                )
+            assert store.n_dropped == 3
+
+        # after restarting, samples before the reopened bucket are dropped
+        store = RollupStore(columns=COLUMNS[:1], root=tmpdir)
+        store.update(device_id="dev", data={TIME_KEY: [5 * 10**9], COLUMNS[0]: [1.0]})
+        assert store.n_dropped == 1
+
+        # buckets are in time order (in memory and in files)
+        for res in store.resolutions:
+            ret = store.query(device_id="dev", resolution=res)
+            assert np.all(np.diff(ret[TIME_KEY]) > 0)
+            records = np.fromfile(
+                Path(tmpdir) / "dev" / f"{res}.bin", dtype=store.dtype
+            )
+            assert np.all(np.diff(records[TIME_KEY]) > 0)
+        ret = store.query(device_id="dev", resolution="1min")
+        assert np.array_equal(ret[TIME_KEY], np.array([180, 300]) * 10**9)
+        assert np.array_equal(ret["count"], [1, 3])
+
+
+######################################################################
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception:
+        traceback.print_exc()
@@ -0,0 +1,92 @@
+"""Test of serial_monitor.py
+
+Usage:
+- pytest test_serial_monitor.py
+- pytest
+
+---
+
+KazutoMakino
+
+"""
+
+
+import os
+import sys
+import tempfile
+import traceback
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+if True:
+    from frame_protocol import encode_frame
+    from serial_monitor import SerialMonitor
+
+######################################################################
+# main
+######################################################################
+
+
+def main():
+    test_read_bytes()
+
+
+######################################################################
+# modules
+######################################################################
+
+LINE = b"TimeStamp: 2022/01/18 18:05:40.16290, Humidity[%]: 54.64256\n"
+
+
+def read_all(sm: SerialMonitor, n: int) -> bytes:
+    """Read n bytes by read_bytes."""
+    ret = b""
+    while len(ret) < n:
+        data = sm.read_bytes()
+        assert data, "timeout"
+        ret += data
+    return ret
+
+
+def test_read_bytes():
+    # pty is available only on POSIX
+    if os.name != "posix":
+        return
+
+    frame = encode_frame(seq=0, sec=0, usec=0, ticks=0, t_raw=0, h_raw=0)
+    for binary, record in [(False, LINE), (True, frame)]:
+        master, slave = os.openpty()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "test.log"
+            sm = SerialMonitor(
+                port=os.ttyname(slave),
+                timeout=1.0,
+                logpath=path,
+                log_options={"max_bytes": len(record) * 2},
+                binary=binary,
+            )
+            os.close(slave)
+
+            # a record split by readings is not split by rotations
+            for chunk in [record * 2 + record[:10], record[10:] + record[:5]]:
+                os.write(master, chunk)
+                assert read_all(sm=sm, n=len(chunk)) == chunk
+            assert sm.writer.segments
+            for v in sm.writer.segments + [path]:
+                data = v.read_bytes()
+                assert data == record * (len(data) // len(record)), v
+
+            # the rest is written at the end
+            sm.close()
+            assert path.read_bytes().endswith(record + record[:5])
+        os.close(master)
+
+
+######################################################################
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception:
+        traceback.print_exc()
+    sys.exit()
@@ -0,0 +1,172 @@
+"""Test of sqlite_sink.py
+
+Usage:
+- pytest test_sqlite_sink.py
+- pytest
+
+---
+
+KazutoMakino
+
+"""
+
+
+import sqlite3
+import sys
+import tempfile
+import threading
+import traceback
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent))
+if True:
+    from line_parser import TIME_KEY
+    from sqlite_sink import SQLiteSink
+
+######################################################################
+# main
+######################################################################
+
+
+def main():
+    test_write_read()
+    test_columns()
+    test_overflow()
+    test_error()
+
+
+######################################################################
+# modules
+######################################################################
+
+
+def make_data(n: int, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed=seed)
+    return {
+        TIME_KEY: 1642501740_000_000_000 + np.arange(n, dtype=np.int64) * 10**8,
+        "Temperature[degC]": 18 + rng.random(n),
+        "Humidity[%]": 70 + rng.random(n),
+    }
+
+
+def test_write_read():
+    data = make_data(n=3000)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / "samples.db"
+
+        # chunks of devices from reader threads
+        def func(device_id):
+            for i in range(0, 3000, 7):
+                sink.put(
+                    device_id=device_id,
+                    data={k: v[i : i + 7] for k, v in data.items()},
+                    timeout=None,
+                )
+
+        with SQLiteSink(path=path, batch_size=500, policy="block") as sink:
+            ths = [threading.Thread(target=func, args=(f"dev{i}",)) for i in range(4)]
+            for th in ths:
+                th.start()
+            for th in ths:
+                th.join()
+        assert sink.error is None
+        assert sink.get_stats()["rows"] == 4 * 3000
+        assert sink.get_stats()["dropped"] == 0
+
+        # WAL mode, clustered by (device, ts)
+        con = sqlite3.connect(path)
+        assert con.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        sql = con.execute("SELECT sql FROM sqlite_master WHERE name = 'samples'")
+        assert "WITHOUT ROWID" in sql.fetchone()[0]
+        con.close()
+
+        # read by another instance (e.g. offline training)
+        sink = SQLiteSink(path=path)
+        assert sink.list_devices() == ["dev0", "dev1", "dev2", "dev3"]
+        ret = sink.read(device_id="dev2")
+        assert list(ret.keys()) == list(data.keys())
+        for k, v in data.items():
+            assert ret[k].dtype == v.dtype
+            assert np.array_equal(ret[k], v)
+
+        # a time range [tstart, tend)
+        tstart, tend = int(data[TIME_KEY][100]), int(data[TIME_KEY][250])
+        ret = sink.read(
+            device_id="dev1", columns=["Humidity[%]"], tstart=tstart, tend=tend
+        )
+        assert list(ret.keys()) == [TIME_KEY, "Humidity[%]"]
+        assert np.array_equal(ret[TIME_KEY], data[TIME_KEY][100:250])
+        assert np.array_equal(ret["Humidity[%]"], data["Humidity[%]"][100:250])
+
+        # unknown devices are empty, unknown columns are not accepted
+        assert len(sink.read(device_id="unknown")[TIME_KEY]) == 0
+        try:
+            sink.read(device_id="dev0", columns=["Pressure[hPa]"])
+        except KeyError:
+            pass
+        else:
+            raise AssertionError("KeyError is not raised")
+
+
+def test_columns():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / "samples.db"
+
+        # a new channel is added, missing values are nan, the same ts is replaced
+        with SQLiteSink(path=path, flush_interval=0.01) as sink:
+            sink.put(device_id="a", data={TIME_KEY: np.array([1, 2]), "x": [1.0, 2.0]})
+            sink.put(device_id="a", data={TIME_KEY: 3, "x": 3.0, "y": 30.0})
+            sink.put(device_id="a", data={TIME_KEY: np.array([2]), "x": [-2.0]})
+        ret = SQLiteSink(path=path).read(device_id="a")
+        assert np.array_equal(ret[TIME_KEY], [1, 2, 3])
+        assert np.array_equal(ret["x"], [1.0, -2.0, 3.0])
+        assert np.array_equal(ret["y"], [np.nan, np.nan, 30.0], equal_nan=True)
+
+
+def test_overflow():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # the writer is not started: putting is never blocked
+        sink = SQLiteSink(path=Path(tmpdir) / "samples.db", queue_size=2)
+        data = make_data(n=1)
+        assert all(sink.put(device_id="a", data=data) for _ in range(5))
+        assert sink.get_stats()["dropped"] == 3
+
+        # waiting chunks are inserted when closed (the same sample is replaced)
+        sink.start()
+        sink.close()
+        assert sink.get_stats()["rows"] == 2
+        assert len(sink.read(device_id="a")[TIME_KEY]) == 1
+        assert not sink.put(device_id="a", data=data)
+
+
+def test_error():
+    def insert(con: sqlite3.Connection, items: list) -> None:
+        raise sqlite3.OperationalError("disk I/O error")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # the error is kept and blocked producers are released
+        sink = SQLiteSink(
+            path=Path(tmpdir) / "samples.db",
+            batch_size=1,
+            queue_size=1,
+            policy="block",
+        )
+        sink._insert = insert
+        sink.start()
+        data = make_data(n=1)
+        assert sink.put(device_id="a", data=data, timeout=None)
+        sink.join(timeout=5)
+        assert isinstance(sink.error, sqlite3.OperationalError)
+        assert not sink.put(device_id="a", data=data, timeout=None)
+        sink.close()
+
+
+######################################################################
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception:
+        traceback.print_exc()
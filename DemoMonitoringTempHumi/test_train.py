@@ -0,0 +1,155 @@
+"""Test of train.py
+
+Usage:
+- pytest test_train.py
+- pytest
+
+---
+
+KazutoMakino
+
+"""
+
+
+import sys
+import tempfile
+import traceback
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent))
+if True:
+    from anomaly_detection import HotellingTSquare
+    from archive import SensorArchive
+    from line_parser import LineParser
+    from train import select, train
+
+######################################################################
+# main
+######################################################################
+
+
+def main():
+    test_train()
+    test_train_archive()
+    test_select()
+
+
+######################################################################
+# modules
+######################################################################
+
+DATADIR = Path(__file__).parent / "data"
+
+
+def get_expected(columns: list) -> np.ndarray:
+    """Gather all samples of logs (the previous way)."""
+    datasets = [
+        np.column_stack([LineParser().read_columns(source=v)[k] for k in columns])
+        for v in sorted(DATADIR.glob("*.txt"))
+    ]
+    return np.concatenate(datasets)
+
+
+def test_train():
+    columns = ["Temperature[degC]", "Humidity[%]"]
+    expected = get_expected(columns=columns)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # univariate, in parallel
+        hts = train(
+            sources=[DATADIR],
+            workers=2,
+            param_path=Path(tmpdir) / "uni.json",
+        )
+        reloaded = HotellingTSquare(param_path=Path(tmpdir) / "uni.json")
+        assert reloaded.is_multivariate is False
+        assert reloaded.params["count"] == len(expected)
+        assert np.isclose(reloaded.params["mean"], expected[:, 1].mean())
+        assert np.isclose(reloaded.params["variance"], expected[:, 1].var())
+        assert reloaded.params["threshold"] == hts.params["threshold"]
+        assert reloaded.params["columns"] == ["Humidity[%]"]
+        assert reloaded.params["sourcedir"] == "data"
+        assert reloaded.params["sourcefiles"] == [
+            v.name for v in sorted(DATADIR.glob("*.txt"))
+        ]
+
+        # multivariate, not parallel: the same as fit by all samples
+        hts = train(
+            sources=sorted(DATADIR.glob("*.txt")),
+            columns=columns,
+            alpha=0.95,
+            workers=1,
+            param_path=Path(tmpdir) / "multi.json",
+        )
+        ref = HotellingTSquare(param_path=Path(tmpdir) / "ref.json")
+        ref.fit(dataset=expected, alpha=0.95, columns=columns)
+        assert hts.params["df"] == 2.0
+        for k in ["mean", "covariance", "inv_covariance", "threshold"]:
+            assert np.allclose(hts.params[k], ref.params[k])
+
+        # no log files
+        try:
+            train(sources=[tmpdir], param_path=Path(tmpdir) / "none.json")
+        except FileNotFoundError:
+            pass
+        else:
+            raise AssertionError("FileNotFoundError is not raised")
+
+
+def test_train_archive():
+    expected = get_expected(columns=["Humidity[%]"])[:, 0]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # 2 sessions of the archive + 2 text logs
+        paths = sorted(DATADIR.glob("*.txt"))
+        sa = SensorArchive(root=Path(tmpdir) / "archive")
+        sessions = [sa.convert(src=v) for v in paths[:2]]
+        hts = train(
+            sources=paths[2:],
+            workers=2,
+            param_path=Path(tmpdir) / "param.json",
+            archive=Path(tmpdir) / "archive",
+            chunk_size=64 * 1000,
+        )
+        assert hts.params["count"] == len(expected)
+        assert np.isclose(hts.params["mean"], expected.mean())
+        assert np.isclose(hts.params["variance"], expected.var())
+        assert hts.params["sourcefiles"] == [v.name for v in paths[2:]] + sessions
+
+
+def test_select():
+    names = ["20220118180523357086.txt", "20220118192914980961.txt", "x.log"]
+    assert select(names=names) == [True, True, True]
+    assert select(names=names, include=["*.txt"]) == [True, True, False]
+    assert select(names=names, include=["*.txt"], exclude=["*1929*"]) == [
+        True,
+        False,
+        False,
+    ]
+
+    # the normal sessions of trial_training.ipynb (small chunks)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        hts = train(
+            sources=[Path(__file__).parent / "traindata"],
+            exclude=["20220118192914980961.txt"],
+            workers=1,
+            param_path=Path(tmpdir) / "param.json",
+            chunk_size=1 << 14,
+        )
+    expected = HotellingTSquare().params
+    assert np.isclose(hts.params["mean"], expected["mean"])
+    assert np.isclose(hts.params["variance"], expected["variance"])
+    assert hts.params["threshold"] == expected["threshold"]
+    assert "20220118192914980961.txt" not in hts.params["sourcefiles"]
+
+
+######################################################################
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception:
+        traceback.print_exc()
+    sys.exit()
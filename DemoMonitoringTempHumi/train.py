@@ -0,0 +1,365 @@
+"""Out-of-core training of the anomaly detection model over log files.
+
+Descriptions:
+    Log files (text logs or sessions of the archive) are mapped to
+    worker processes, each of which streams a file chunk by chunk and
+    computes mergeable statistics (count, mean and the sum of squared
+    deviations or the scatter matrix of channels) in bounded memory.
+    The parent reduces them exactly (SufficientStats.merge), and fits
+    HotellingTSquare once by the merged statistics, so samples are never
+    gathered, the peak memory does not depend on the number of files
+    (days of logs), and the fitting time is divided by the number of
+    processes.
+    Files (or sessions) are selected by name patterns (--include /
+    --exclude), e.g. sessions of pseudo anomalies are excluded from
+    the training of the normal state.
+
+Usage:
+- py train.py traindata
+- py train.py traindata --exclude 20220118192914980961.txt
+    (the parameters of trial_training.ipynb)
+- py train.py traindata --columns Temperature[degC] Humidity[%] --alpha 0.999
+- py train.py data traindata --include "20220119*" --workers 4
+- py train.py --archive archive --sessions 20220118180523357086
+- from train import train
+    hts = train(sources=["traindata"], columns=["Humidity[%]"])
+
+---
+
+KazutoMakino
+
+"""
+
+import argparse
+import concurrent.futures
+import fnmatch
+import functools
+import logging
+import os
+import sys
+import time
+import typing
+from pathlib import Path
+
+import numpy as np
+
+# import my pkgs
+if True:
+    from anomaly_detection import HotellingTSquare, SufficientStats
+    from archive import SensorArchive
+    from line_parser import LineParser
+
+######################################################################
+# main
+######################################################################
+
+
+def main():
+    # get parser
+    parser = argparse.ArgumentParser(description="Train the anomaly detection model.")
+    parser.add_argument(
+        "sources",
+        type=str,
+        nargs="*",
+        help="log files or directories (*.txt, *.log)",
+    )
+    parser.add_argument(
+        "--archive", "-a", type=str, default=None, help="archive directory"
+    )
+    parser.add_argument(
+        "--sessions",
+        type=str,
+        nargs="*",
+        default=None,
+        help="sessions of the archive (default: all)",
+    )
+    parser.add_argument(
+        "--include",
+        "-i",
+        type=str,
+        nargs="+",
+        default=None,
+        help="name patterns of files (sessions) to use (default: all)",
+    )
+    parser.add_argument(
+        "--exclude",
+        "-e",
+        type=str,
+        nargs="+",
+        default=None,
+        help="name patterns of files (sessions) not to use",
+    )
+    parser.add_argument(
+        "--columns",
+        "-c",
+        type=str,
+        nargs="+",
+        default=["Humidity[%]"],
+        help="columns (univariate if one)",
+    )
+    parser.add_argument(
+        "--alpha", type=float, default=0.99, help="a degree of reliability"
+    )
+    parser.add_argument(
+        "--df", type=float, default=None, help="a degree of freedom (default: channels)"
+    )
+    parser.add_argument(
+        "--workers",
+        "-w",
+        type=int,
+        default=None,
+        help="the number of processes (default: the number of cpus)",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=1 << 22,
+        help="a byte size of logs (x 1/64 rows of sessions) to read at once",
+    )
+    parser.add_argument(
+        "--param-path",
+        "-p",
+        type=str,
+        default=Path(__file__).parent / "param_HotellingTSquare.json",
+        help="parameter file",
+    )
+    args = parser.parse_args()
+
+    # train
+    tstart = time.perf_counter()
+    hts = train(
+        sources=args.sources,
+        columns=args.columns,
+        alpha=args.alpha,
+        df=args.df,
+        workers=args.workers,
+        param_path=args.param_path,
+        archive=args.archive,
+        sessions=args.sessions,
+        include=args.include,
+        exclude=args.exclude,
+        chunk_size=args.chunk_size,
+    )
+    elapsed = time.perf_counter() - tstart
+
+    # show
+    print(f"{hts.param_path}: count={hts.params['count']} in {elapsed:.3f} [s]")
+    print(f"sourcefiles: {hts.params['sourcefiles']}")
+    try:
+        import resource
+
+        # peak resident set sizes [KiB] of this process and workers (linux)
+        peaks = [
+            resource.getrusage(v).ru_maxrss / 1024
+            for v in [resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN]
+        ]
+        print(f"peak rss: {peaks[0]:.1f} [MiB] (workers: {peaks[1]:.1f} [MiB])")
+    except ImportError:
+        pass
+    print(
+        {k: v for k, v in hts.params.items() if k in ["mean", "variance", "threshold"]}
+    )
+
+
+######################################################################
+# modules
+######################################################################
+
+
+def map_log(
+    path: typing.Union[Path, str],
+    columns: typing.List[str],
+    chunk_size: int = 1 << 22,
+) -> SufficientStats:
+    """Compute statistics of a log file chunk by chunk (called by workers).
+
+    Args:
+        path (Union[Path, str]): A log file path.
+        columns (List[str]): Columns.
+        chunk_size (int, optional): A byte size to read at once.
+            Defaults to 1 << 22 (4 [MiB]).
+
+    Returns:
+        SufficientStats: Statistics (rows with nan are excluded).
+    """
+    merged = SufficientStats()
+    for data in LineParser().iter_chunks(source=Path(path), chunk_size=chunk_size):
+        merged = merged.merge(_get_stats(data=data, columns=columns))
+    return merged
+
+
+def map_session(
+    root: typing.Union[Path, str],
+    session: str,
+    columns: typing.List[str],
+    block_rows: int = 1 << 16,
+) -> SufficientStats:
+    """Compute statistics of a session of the archive block by block
+    (called by workers).
+
+    Args:
+        root (Union[Path, str]): An archive directory.
+        session (str): A session name.
+        columns (List[str]): Columns.
+        block_rows (int, optional): The number of rows to read at once.
+            Defaults to 1 << 16.
+
+    Returns:
+        SufficientStats: Statistics (rows with nan are excluded).
+    """
+    merged = SufficientStats()
+    for data in SensorArchive(root=root).iter_blocks(
+        session=session, columns=columns, block_rows=block_rows
+    ):
+        merged = merged.merge(_get_stats(data=data, columns=columns))
+    return merged
+
+
+def select(
+    names: typing.List[str],
+    include: typing.Optional[typing.List[str]] = None,
+    exclude: typing.Optional[typing.List[str]] = None,
+) -> typing.List[bool]:
+    """Select names by patterns (fnmatch, e.g. "20220119*").
+
+    Args:
+        names (List[str]): File or session names.
+        include (List[str], optional): Patterns of names to use.
+            Defaults to None (all).
+        exclude (List[str], optional): Patterns of names not to use
+            (prior to include). Defaults to None.
+
+    Returns:
+        List[bool]: Used or not per name.
+    """
+    return [
+        (include is None or any(fnmatch.fnmatch(v, p) for p in include))
+        and not any(fnmatch.fnmatch(v, p) for p in exclude or [])
+        for v in names
+    ]
+
+
+def _get_stats(data: dict, columns: typing.List[str]) -> SufficientStats:
+    """Compute statistics of columns of parsed data."""
+    if not data:
+        return SufficientStats()
+    missing = set(columns) - set(data)
+    if missing:
+        raise KeyError(f"unknown columns: {missing}")
+    values = np.column_stack([np.asarray(data[k], dtype=np.float64) for k in columns])
+    values = values[np.all(np.isfinite(values), axis=1)]
+    return SufficientStats.from_data(data=values[:, 0] if len(columns) == 1 else values)
+
+
+def train(
+    sources: typing.List[typing.Union[Path, str]],
+    columns: typing.List[str] = ["Humidity[%]"],
+    alpha: float = 0.99,
+    df: typing.Optional[float] = None,
+    workers: typing.Optional[int] = None,
+    param_path: typing.Union[Path, str] = (
+        Path(__file__).parent / "param_HotellingTSquare.json"
+    ),
+    archive: typing.Optional[typing.Union[Path, str]] = None,
+    sessions: typing.Optional[typing.List[str]] = None,
+    include: typing.Optional[typing.List[str]] = None,
+    exclude: typing.Optional[typing.List[str]] = None,
+    chunk_size: int = 1 << 22,
+) -> HotellingTSquare:
+    """Fit HotellingTSquare by log files in parallel and save parameters.
+
+    Args:
+        sources (List[Union[Path, str]]): Log files or directories.
+        columns (List[str], optional): Columns (univariate if one).
+            Defaults to ["Humidity[%]"].
+        alpha (float, optional): A degree of reliability. Defaults to 0.99.
+        df (float, optional): A degree of freedom.
+            Defaults to None (1.0 or the number of channels).
+        workers (int, optional): The number of processes
+            (1: not parallel). Defaults to None (the number of cpus).
+        param_path (Union[Path, str], optional): A parameter file.
+            Defaults to Path(__file__).parent / "param_HotellingTSquare.json".
+        archive (Union[Path, str], optional): An archive directory whose
+            sessions are also used. Defaults to None.
+        sessions (List[str], optional): Sessions of the archive.
+            Defaults to None (all sessions).
+        include (List[str], optional): Name patterns of files (sessions)
+            to use. Defaults to None (all).
+        exclude (List[str], optional): Name patterns of files (sessions)
+            not to use. Defaults to None.
+        chunk_size (int, optional): A byte size of logs to read at once
+            (sessions are read by chunk_size // 64 rows, about the same).
+            Defaults to 1 << 22 (4 [MiB]).
+
+    Returns:
+        HotellingTSquare: The fitted model.
+    """
+    # tasks: selected log files and sessions of the archive
+    paths = SensorArchive.glob_logs(sources=sources)
+    is_used = select(names=[v.name for v in paths], include=include, exclude=exclude)
+    paths = [v for v, used in zip(paths, is_used) if used]
+    tasks = [
+        functools.partial(map_log, path=v, columns=columns, chunk_size=chunk_size)
+        for v in paths
+    ]
+    sourcefiles = [v.name for v in paths]
+    sourcedirs = [v.resolve().parent for v in paths]
+    if archive is not None:
+        if sessions is None:
+            sessions = SensorArchive(root=archive).list_sessions()
+        is_used = select(names=sessions, include=include, exclude=exclude)
+        sessions = [v for v, used in zip(sessions, is_used) if used]
+        tasks += [
+            functools.partial(
+                map_session,
+                root=archive,
+                session=v,
+                columns=columns,
+                block_rows=max(chunk_size // 64, 1),
+            )
+            for v in sessions
+        ]
+        sourcefiles += list(sessions)
+        sourcedirs += [Path(archive).resolve()] * len(sessions)
+    if not tasks:
+        raise FileNotFoundError(f"no log files: {sources}")
+
+    # map: statistics per file (in the order of tasks)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(tasks))
+    if workers > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_call, tasks))
+    else:
+        results = [task() for task in tasks]
+
+    # reduce: exact merge, and fit once
+    merged = functools.reduce(SufficientStats.merge, results, SufficientStats())
+    hts = HotellingTSquare(param_path=param_path)
+    hts.fit_stats(
+        sufficient_stats=merged,
+        alpha=alpha,
+        df=df,
+        memo_dict={
+            "sourcedir": Path(os.path.commonpath(sourcedirs)).name,
+            "sourcefiles": sourcefiles,
+        },
+        columns=columns,
+    )
+    return hts
+
+
+def _call(task: typing.Callable) -> typing.Any:
+    """Call a task (a picklable function for the process pool)."""
+    return task()
+
+
+######################################################################
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as err:
+        logging.error(msg=err, exc_info=True)
+    sys.exit()